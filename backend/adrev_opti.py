@@ -1,9 +1,30 @@
-# pip install gurobipy if needed; requires a Gurobi license.
+# pip install gurobipy if needed; requires a Gurobi license (only for engine="gurobi", which falls back to numpy without one).
+import logging
 import math
-import gurobipy as gp
-from gurobipy import GRB
+import os
 import sqlite3
-import pandas as pd
+import threading
+import time
+from collections import namedtuple
+from itertools import repeat
+
+import numpy as np
+
+from creator_stats import deferred_stats
+from db import snapshot, fetch_chunks, fetch_by_ids, CHUNK_ROWS
+from earnings import record_earnings
+from engines import gp
+from metrics import timed, observe, inc
+from quality import get_quality_score, clamp01, quality_from_rows, QUALITY_INPUTS
+
+# gurobipy is imported on first use (engines.py); the numpy engine runs without gurobipy / a licence
+
+def gurobi_errors():
+    """
+    What a gurobi solve raises when gurobipy is missing or its licence can't solve the model
+    (none, expired, size-limited). GurobiError only exists once gurobipy has been imported.
+    """
+    return (RuntimeError, gp.GurobiError) if gp.loaded else (RuntimeError,)
 
 # ----------------------------
 # 1) Inputs (edit these)
@@ -12,108 +33,151 @@ P = 10_000  # total creator pool, note that this term can be interpreted in many
 lambda_fair = 0.6 # these are weights/ parameters which definitely can be learnt and refined over time with more data
 lambda_eff  = 0.4
 alpha = 0.7
-phi_W = 0.35
-phi_E = 0.25
-phi_D = 0.15
-phi_R = 0.10
-phi_S = 0.15
+# phi_* weights of the quality score live in quality.py
 
+# Solver engine: "numpy" (exact KKT / bisection, no licence) or "gurobi" (PWL log approximation)
+ENGINES = ("numpy", "gurobi")
+DEFAULT_ENGINE = os.environ.get("ADREV_ENGINE", "numpy")
 
-# Add this to adopti.py near the other quality-score helpers
+# Optional floors/caps per video (0 / inf disable them)
+PAYOUT_FLOOR = 0.0           # e.g., 50.0 for a minimum payout
+PAYOUT_CAP = float("inf")    # e.g., 250_000.0 for a cap
+P_MIN = max(1e-8 * P, 1e-8)  # compliant payouts stay > 0 so log(p) is defined
 
-def get_quality_score(W: float, E: float, D: float, R: float, S: float, C: int = 1) -> float:
-    """
-    Geometric aggregation with fixed phi's, then compliance and clamp.
-    Q_v = C * min(1, W^phi_W * E^phi_E * D^phi_D * R^phi_R * S^phi_S).
-    Inputs W,E,D,R,S should already be in [0,1]; C in {0,1}.
+# Incremental mode: fraction of the eligible mass M_total that may move between full re-solves
+DRIFT_TOL = float(os.environ.get("ADREV_DRIFT_TOL", "0.01"))
 
-    For detailed calculation of W,E,D,R and S, they require user specific interaction for each video, for which we will skip the calculation
-    The mathematical formula can be found in the pdf for calculation of quality score. The intention is that TikTok can calculate them
-    trivially as TikTok should easily have access to these data, (i.e. how a specific user interacts with this specific video)
-    """
-    q = (W ** phi_W) \
-        * (E ** phi_E) \
-        * (D ** phi_D) \
-        * (R ** phi_R) \
-        * (S ** phi_S)
-    return C * min(1.0, q)
+# Only the top rows of the payout table are printed after a solve
+REPORT_TOP_N = 20
 
-# ----------------------------
-# Build `videos` list dynamically from DB rows
-# ----------------------------
+log = logging.getLogger(__name__)
 
-def clamp01(x: float) -> float:
-    try:
-        return max(0.0, min(1.0, float(x)))
-    except Exception:
-        return 0.0
-
-def get_optimised_values(conn):
-    q = """
-        SELECT video_id, \
-               views, \
-               watch_completion, \
-               engagement_rate, \
-               engagement_diversity, \
-               rewatch, \
-               nlp_quality, \
-               compliance
-        FROM videos; \
-        """
+# version is the allocation_versions row the payouts were written under (None until persisted)
+Allocation = namedtuple(
+    "Allocation", ["video_ids", "payouts", "quality", "mass", "mu", "objective", "engine", "version"],
+    defaults=("numpy", None),
+)
 
-    df = pd.read_sql_query(q, conn)
-    if df is None or df.empty:
-        raise ValueError("No rows returned from database; cannot build videos list.")
-
-    videos = []
-    for row in df.itertuples(index=False):
-        # Expect columns: video_id, views, watch_completion, engagement_rate, engagement_diversity, rewatch, nlp_quality
-        W = clamp01(row.watch_completion)
-        E = clamp01(row.engagement_rate)
-        D = clamp01(row.engagement_diversity)
-        R = clamp01(row.rewatch)
-        S = clamp01(row.nlp_quality)
-        C_gate = 1 if int(row.compliance) == 1 else 0
-
-        Qv = get_quality_score(W=W, E=E, D=D, R=R, S=S, C=C_gate)
-
-        videos.append({
-            "id":    str(row.video_id),
-            "views": float(row.views),
-            "Q":     Qv,
-            "C":     C_gate,
-        })
-
-    # Optional floors/caps per video (comment out to disable)
-    floors = {v["id"]: 0.0 for v in videos}        # e.g., 50.0 for a minimum payout
-    caps   = {v["id"]: float('inf') for v in videos}  # e.g., 250_000.0 for a cap
 
-    # Normalize caps to Gurobi's infinity if needed
-    for k in caps:
-        if math.isinf(caps[k]):
-            caps[k] = GRB.INFINITY
+# ----------------------------
+# Native solver (KKT / bisection on the budget multiplier)
+# ----------------------------
 
-    # ----------------------------
-    # 2) Derived shares/weights
-    # ----------------------------
-    for v in videos:
-        v["M"] = v["views"] * v["Q"] if v["C"] == 1 else 0.0
+def solve_allocation(s, w, lb, ub, pool=P, lam_fair=lambda_fair, lam_eff=lambda_eff, tol=1e-13, max_iter=200, mu0=None):
+    """
+    Exact solve of
+        max  lam_fair * sum_v w_v log(p_v) + lam_eff * sum_v s_v p_v / pool
+        s.t. sum_v p_v = pool,  lb_v <= p_v <= ub_v
+    The objective is separable and concave, so with budget multiplier mu the KKT conditions give
+        p_v(mu) = clip(lam_fair * w_v / (mu - lam_eff * s_v / pool), lb_v, ub_v)
+    and sum_v p_v(mu) is non-increasing in mu. We bisect on mu until the budget is met, then
+    rescale the videos strictly inside their bounds to absorb the last rounding residual.
+    Videos with w_v = 0 contribute nothing to the objective and sit on their floor unless the
+    positive-weight videos are all capped (mu = 0), in which case they absorb the remainder.
+    mu0 warm-starts the search from a neighbouring solve's multiplier (e.g. the previous point of
+    a parameter sweep): Newton steps on the budget residual, kept inside the bisection bracket.
+    Returns (payouts, mu).
+    """
+    s = np.asarray(s, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    lb = np.asarray(lb, dtype=np.float64)
+    ub = np.asarray(ub, dtype=np.float64)
+
+    if lb.sum() > pool + 1e-9:
+        raise ValueError(f"Infeasible: sum of minimum payouts ({lb.sum():.6f}) exceeds pool P={pool}.")
+    if ub.sum() < pool - 1e-9:
+        raise ValueError(f"Infeasible: sum of payout caps ({ub.sum():.6f}) is below pool P={pool}.")
+
+    pos = w > 0
+    if not pos.any():
+        raise ValueError("No eligible videos (all fairness weights are 0). Check Q_v and compliance flags.")
+    a = lam_eff * s[pos] / pool
+    num = lam_fair * w[pos]
+    lb_pos, ub_pos = lb[pos], ub[pos]
+
+    def payouts_at(mu):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            raw = np.where(mu > a, num / (mu - a), np.inf)
+        return np.clip(raw, lb_pos, ub_pos)
+
+    p = lb.copy()
+
+    # mu = 0: every positive-weight video is capped and the rest still has to be handed out
+    capped_total = ub_pos.sum() + lb[~pos].sum()
+    if capped_total <= pool:
+        p[pos] = ub_pos
+        rest = pool - capped_total
+        headroom = ub[~pos] - lb[~pos]
+        if rest > 0 and (~pos).any():
+            if np.isinf(headroom).any():
+                share = np.isinf(headroom) / np.isinf(headroom).sum()
+            else:
+                share = headroom / headroom.sum()
+            p[~pos] = lb[~pos] + rest * share
+        return p, 0.0
+
+    # Bracket: g(0+) > pool, and at `hi` every free payout is at most w_v * (pool - sum lb) / sum w
+    lo = 0.0
+    hi = a.max() + num.sum() / max(pool - lb.sum(), 1e-12)
+    warm = mu0 is not None
+    mid = mu0 if warm and lo < mu0 < hi else 0.5 * (lo + hi)
+    for _ in range(max_iter):
+        p_mid = payouts_at(mid)
+        excess = p_mid.sum() + lb[~pos].sum() - pool
+        if excess > 0:
+            lo = mid
+        else:
+            hi = mid
+        if hi - lo <= tol * hi:
+            break
+        nxt = 0.5 * (lo + hi)
+        if warm:
+            # d/dmu of num / (mu - a) is -p^2 / num for the videos strictly inside their bounds
+            free = (p_mid > lb_pos) & (p_mid < ub_pos)
+            slope = -np.sum(p_mid[free] ** 2 / num[free])
+            if slope < 0:
+                newton = mid - excess / slope
+                if abs(newton - mid) <= tol * hi:
+                    hi = max(newton, lo)
+                    break
+                if lo < newton < hi:
+                    nxt = newton
+        mid = nxt
+
+    mu = hi
+    p_pos = payouts_at(mu)
+    free = (p_pos > lb_pos) & (p_pos < ub_pos)
+    fixed_total = p_pos[~free].sum() + lb[~pos].sum()
+    free_total = p_pos[free].sum()
+    if free_total > 0:
+        p_pos[free] = np.clip(p_pos[free] * (pool - fixed_total) / free_total, lb_pos[free], ub_pos[free])
+    p[pos] = p_pos
+    return p, mu
+
+def allocation_objective(p, s, w, pool=P, lam_fair=lambda_fair, lam_eff=lambda_eff):
+    pos = w > 0
+    fair = float(np.sum(w[pos] * np.log(p[pos])))
+    eff = float(np.sum(s * p / pool))
+    return lam_fair * fair + lam_eff * eff
 
-    M_total = sum(v["M"] for v in videos)
-    if M_total <= 0:
-        raise ValueError("No eligible videos (M_total=0). Check Q_v and compliance flags.")
+# ----------------------------
+# Gurobi solver (PWL approximation of log)
+# ----------------------------
 
-    for v in videos:
-        v["s"] = v["M"] / M_total
-        v["w"] = (v["s"] ** alpha) if v["s"] > 0 else 0.0
+def solve_allocation_gurobi(ids, s, w, C, floors, caps, pool=P, lam_fair=lambda_fair, lam_eff=lambda_eff):
+    if not gp.available:
+        raise RuntimeError("engine='gurobi' requires gurobipy (pip install gurobipy) and a Gurobi license.")
+
+    # Normalize caps to Gurobi's infinity if needed
+    caps = [gp.GRB.INFINITY if math.isinf(c) else float(c) for c in caps]
 
     # ----------------------------
     # 3) Build PWL for log(p)
     # ----------------------------
     # Dynamic domain for p_v in the log so that all payouts lie within [p_min, p_max]
     # p_min must be > 0 so log is defined.
-    p_min = max(1e-8 * P, 1e-8)  # tiny but positive; scale with pool
-    p_max = max(P, 1.0)          # cover the full feasible range of payouts
+    p_min = max(1e-8 * pool, 1e-8)  # tiny but positive; scale with pool
+    p_max = max(pool, 1.0)          # cover the full feasible range of payouts
 
     # Log-spaced breakpoints (increase K slightly for smoother curvature)
     K = 60
@@ -123,86 +187,418 @@ def get_optimised_values(conn):
     # ----------------------------
     # 4) Build model
     # ----------------------------
+    t_build = time.perf_counter()
     m = gp.Model("quality_weighted_ad_pool")
 
     # Decision variables: payouts p_v >= 0
-    p = {v["id"]: m.addVar(lb=0.0, ub=caps[v["id"]], name=f"p_{v['id']}") for v in videos}
+    p = [m.addVar(lb=0.0, ub=caps[i], name=f"p_{vid}") for i, vid in enumerate(ids)]
 
     # Auxiliary vars: z_v approximates log(p_v) via PWL
-    z = {v["id"]: m.addVar(lb=-GRB.INFINITY, name=f"log_{v['id']}") for v in videos}
+    z = [m.addVar(lb=-gp.GRB.INFINITY, name=f"log_{vid}") for vid in ids]
 
     # Set bounds and PWL constraints based on compliance
-    for v in videos:
-        vid = v["id"]
-        if v["C"] == 0:
+    for i, vid in enumerate(ids):
+        if C[i] == 0:
             # Non-compliant: fix payout to 0 and fix z to 0 (no log defined at 0)
-            p[vid].LB = 0.0
-            p[vid].UB = 0.0
-            m.addConstr(z[vid] == 0.0, name=f"z_fix_{vid}")
+            p[i].LB = 0.0
+            p[i].UB = 0.0
+            m.addConstr(z[i] == 0.0, name=f"z_fix_{vid}")
         else:
             # Compliant: apply floor and ensure >= p_min for log
-            lb = floors.get(vid, 0.0)
-            p[vid].LB = max(lb, p_min)
-            # Optional cap already in var definition via ub=caps[vid]
-            m.addGenConstrPWL(p[vid], z[vid], x_pts, y_pts, name=f"pwl_log_{vid}")
+            p[i].LB = max(floors[i], p_min)
+            # Optional cap already in var definition via ub=caps[i]
+            m.addGenConstrPWL(p[i], z[i], x_pts, y_pts, name=f"pwl_log_{vid}")
 
     # Feasibility check: sum of lower bounds for compliant videos must not exceed P
-    total_lb = sum(max(floors.get(v["id"], 0.0), p_min) for v in videos if v["C"] == 1)
-    if total_lb > P + 1e-9:
-        raise ValueError(f"Infeasible: sum of minimum payouts ({total_lb:.6f}) exceeds pool P={P}.")
+    total_lb = sum(max(floors[i], p_min) for i in range(len(ids)) if C[i] == 1)
+    if total_lb > pool + 1e-9:
+        raise ValueError(f"Infeasible: sum of minimum payouts ({total_lb:.6f}) exceeds pool P={pool}.")
 
     # Budget constraint: sum p_v = P
-    m.addConstr(gp.quicksum(p[v["id"]] for v in videos) == P, name="budget")
+    m.addConstr(gp.quicksum(p) == pool, name="budget")
 
     # Objective:
     # lambda_fair * sum_v w_v * z_v  +  lambda_eff * sum_v s_v * (p_v / P)
-    fair_term = gp.quicksum(v["w"] * z[v["id"]] for v in videos)
-    eff_term  = gp.quicksum(v["s"] * (p[v["id"]] / P) for v in videos)
-    m.setObjective(lambda_fair * fair_term + lambda_eff * eff_term, GRB.MAXIMIZE)
+    fair_term = gp.quicksum(w[i] * z[i] for i in range(len(ids)))
+    eff_term  = gp.quicksum(s[i] * (p[i] / pool) for i in range(len(ids)))
+    m.setObjective(lam_fair * fair_term + lam_eff * eff_term, gp.GRB.MAXIMIZE)
+
+    observe("solver_stage_duration_seconds", time.perf_counter() - t_build, solver="adrev", engine="gurobi", stage="build")
+
+    # Solve (Gurobi's own console log is off; the outcome is logged below)
+    m.Params.LogToConsole = 0
+    with timed("solver_stage_duration_seconds", span="solver", solver="adrev", engine="gurobi", stage="solve"):
+        m.optimize()
+    inc("solver_status_total", solver="adrev", engine="gurobi", status=str(m.Status))
+    log.info("gurobi solve finished", extra={
+        "solver": "adrev", "status": m.Status, "runtime_s": m.Runtime, "iterations": m.IterCount,
+        "num_vars": m.NumVars, "objective": m.ObjVal if m.SolCount else None,
+    })
+
+    if m.Status != gp.GRB.OPTIMAL:
+        return None, None
+    return np.array([v.X for v in p], dtype=np.float64), m.ObjVal
 
-    # Solve
-    m.Params.OutputFlag = 1
-    m.optimize()
+# ----------------------------
+# Load inputs and solve
+# ----------------------------
 
+def load_allocation_inputs(conn, chunk_rows=CHUNK_ROWS):
+    """
+    (ids int64, views float64, Q float64, C int8) for every video. Rows are streamed from SQLite
+    chunk_rows at a time straight into columns sized by a count(*) in the same read snapshot, and
+    Q is computed per chunk, so the quality inputs and Python row objects never exist for the whole
+    table: peak memory is 25 bytes per video plus one chunk.
+    """
+    with snapshot(conn):
+        n = conn.execute("SELECT count(*) FROM videos;").fetchone()[0]
+        if not n:
+            raise ValueError("No rows returned from database; cannot build videos list.")
+        ids = np.empty(n, dtype=np.int64)
+        views = np.empty(n, dtype=np.float64)
+        Q = np.empty(n, dtype=np.float64)
+        C = np.empty(n, dtype=np.int8)
+        i = 0
+        q = f"SELECT video_id, views, {', '.join(QUALITY_INPUTS)} FROM videos;"
+        for block in fetch_chunks(conn, q, chunk_rows=chunk_rows):
+            j = i + len(block)
+            ids[i:j] = block[:, 0]
+            views[i:j] = block[:, 1]
+            Q[i:j] = quality_from_rows(block[:, 2:])  # clamped, gated on compliance
+            C[i:j] = block[:, -1] == 1
+            i = j
+    return ids, views, Q, C
+
+def load_video_inputs(conn, video_id):
+    row = conn.execute(
+        """
+        SELECT views, watch_completion, engagement_rate, engagement_diversity, rewatch, nlp_quality, compliance
+        FROM videos
+        WHERE video_id = ?;
+        """,
+        (int(video_id),),
+    ).fetchone()
+    if row is None:
+        return None
+    C_gate = 1 if int(row[6]) == 1 else 0
+    Qv = get_quality_score(
+        W=clamp01(row[1]), E=clamp01(row[2]), D=clamp01(row[3]), R=clamp01(row[4]), S=clamp01(row[5]), C=C_gate
+    )
+    return float(row[0]), Qv, C_gate
+
+def get_allocation_weights(views, Q, C, alpha=alpha):
     # ----------------------------
-    # 5) Report solution
+    # 2) Derived shares/weights
     # ----------------------------
-    if m.Status == GRB.OPTIMAL:
-        total = sum(p[v["id"]].X for v in videos)
-        print(f"\nObjective value: {m.ObjVal:.6f}")
-        print(f"Sum p_v = {total:.2f} (should equal P={P})")
-        print("\nVideo  |  Q_v (quality)   s_v (share)   w_v (fair-wt)   payout p_v    pct_of_pool")
-        print("-"*90)
-        for v in sorted(videos, key=lambda x: p[x["id"]].X, reverse=True):
-            pv = p[v["id"]].X
-            print(f"{v['id']:>5}  |  {v['Q']:>13.4f}   {v['s']:>10.4f}   {v['w']:>12.4f}   {pv:>11.2f}   {pv/P:>11.4%}")
-
-        # --- Persist payout proportions to DB (rev_prop in [0,1]) ---
-        updates = []
-        for v in videos:
-            vid = v["id"]
-            pct = float(p[vid].X / P) if vid in p else 0.0
-            if not (0.0 <= pct <= 1.0):
-                pct = max(0.0, min(1.0, pct))
-            payout = float(p[vid].X)
-            qv = float(v.get("Q", 0.0))
-            updates.append((pct, payout, qv, vid))
+    # Two passes over the columns: mass and its total, then shares and weights (in place)
+    M = np.multiply(views, Q)
+    M[C != 1] = 0.0
+    M_total = M.sum()
+    if M_total <= 0:
+        raise ValueError("No eligible videos (M_total=0). Check Q_v and compliance flags.")
 
+    s = M / M_total
+    w = np.zeros_like(s)
+    np.power(s, alpha, out=w, where=s > 0)
+    return M, s, w
+
+def get_payout_bounds(C, p_min=P_MIN):
+    # Same bounds as the Gurobi model: non-compliant fixed at 0, compliant >= p_min
+    lb = np.where(C == 1, max(PAYOUT_FLOOR, p_min), 0.0)
+    ub = np.where(C == 1, PAYOUT_CAP, 0.0)
+    return lb, ub
+
+def get_optimised_values(conn, engine=None, persist=True, inputs=None):
+    engine = engine or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}.")
+
+    with timed("solver_stage_duration_seconds", span="solver", solver="adrev", engine=engine, stage="load"):
+        # inputs: (ids, views, Q, C) already read by load_allocation_inputs, to solve them more than once
+        ids, views, Q, C = inputs if inputs is not None else load_allocation_inputs(conn)
+        M, s, w = get_allocation_weights(views, Q, C)
+
+    if engine == "gurobi":
+        floors = np.full(len(ids), PAYOUT_FLOOR)
+        caps = np.full(len(ids), PAYOUT_CAP)
         try:
+            payouts, objective = solve_allocation_gurobi(ids, s, w, C, floors, caps)
+        except gurobi_errors() as e:
+            # Licence-free fallback: the numpy engine solves the same model exactly
+            log.warning("gurobi engine unavailable, falling back to numpy", extra={"error": str(e)})
+            inc("solver_status_total", solver="adrev", engine="gurobi", status="unavailable")
+            engine = "numpy"
+        else:
+            if payouts is None:
+                return None
+            mu = None
+    if engine == "numpy":
+        with timed("solver_stage_duration_seconds", span="solver", solver="adrev", engine="numpy", stage="solve"):
+            lb, ub = get_payout_bounds(C)
+            payouts, mu = solve_allocation(s, w, lb, ub)
+            objective = allocation_objective(payouts, s, w)
+        inc("solver_status_total", solver="adrev", engine="numpy", status="optimal")
+
+    alloc = Allocation(video_ids=ids, payouts=payouts, quality=Q, mass=M, mu=mu, objective=objective, engine=engine)
+    log.info("allocation solved", extra={
+        "engine": engine, "videos": len(ids), "objective": objective, "payout_total": float(payouts.sum()), "pool": P,
+    })
+
+    if persist:
+        alloc = alloc._replace(version=persist_allocation(conn, alloc))
+    return alloc
+
+def allocation_report(alloc, top_n=REPORT_TOP_N):
+    """
+    Human-readable table of the largest payouts (used by the CLI).
+    """
+    s = alloc.mass / alloc.mass.sum()
+    w = np.zeros_like(s)
+    np.power(s, alpha, out=w, where=s > 0)
+    lines = [
+        f"[{alloc.engine}] Objective value: {alloc.objective:.6f}",
+        f"Sum p_v = {float(alloc.payouts.sum()):.2f} (should equal P={P})",
+        "",
+        "Video  |  Q_v (quality)   s_v (share)   w_v (fair-wt)   payout p_v    pct_of_pool",
+        "-" * 90,
+    ]
+    for i in np.argsort(-alloc.payouts, kind="stable")[:top_n]:
+        pv = alloc.payouts[i]
+        lines.append(f"{alloc.video_ids[i]:>5}  |  {alloc.quality[i]:>13.4f}   {s[i]:>10.4f}   {w[i]:>12.4f}   {pv:>11.2f}   {pv/P:>11.4%}")
+    if len(alloc.video_ids) > top_n:
+        lines.append(f"... ({len(alloc.video_ids) - top_n} more videos)")
+    return "\n".join(lines)
+
+def init_allocation_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS allocation_versions (
+            version    INTEGER PRIMARY KEY AUTOINCREMENT,
+            engine     TEXT    NOT NULL,
+            videos     INTEGER NOT NULL,
+            objective  FLOAT,
+            pool       FLOAT   NOT NULL,
+            created_at TEXT    NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    conn.commit()
+
+def persist_allocation(conn, alloc):
+    """
+    Write the payouts under a new allocation_versions row, in one transaction: every video gets
+    the new allocation_version and its row_version bumped. Returns the version (None on failure).
+    """
+    # --- Persist payout proportions to DB (rev_prop in [0,1]) ---
+    pct = np.clip(alloc.payouts / P, 0.0, 1.0)
+    try:
+        with timed("solver_stage_duration_seconds", span="solver", solver="adrev", engine=alloc.engine, stage="write"):
             cur = conn.cursor()
-            cur.executemany("UPDATE videos SET rev_prop = ?, proj_earnings = ?, quality_score = ? WHERE video_id = ?;", updates)
+            cur.execute(
+                "INSERT INTO allocation_versions (engine, videos, objective, pool) VALUES (?, ?, ?, ?);",
+                (alloc.engine, len(alloc.video_ids), alloc.objective, P),
+            )
+            version = cur.lastrowid
+            # Streamed in CHUNK_ROWS batches (one transaction), so only one batch is ever Python objects.
+            # Every row changes, so creator_stats is recomputed once rather than by trigger per row
+            with deferred_stats(conn):
+                for start in range(0, len(alloc.video_ids), CHUNK_ROWS):
+                    end = start + CHUNK_ROWS
+                    cur.executemany(
+                        "UPDATE videos SET rev_prop = ?, proj_earnings = ?, quality_score = ?, allocation_version = ?, "
+                        "row_version = row_version + 1 WHERE video_id = ?;",
+                        zip(pct[start:end].tolist(), alloc.payouts[start:end].tolist(), alloc.quality[start:end].tolist(),
+                            repeat(version), alloc.video_ids[start:end].tolist()),
+                    )
+            record_earnings(conn, version)
             conn.commit()
-            print(f"\nWrote rev_prop, proj_earnings, and quality_score for {len(updates)} videos to database.")
-        except Exception as e:
-            print(f"\nWARNING: Failed to write rev_prop and proj_earnings to database: {e}")
-    else:
-        print(f"Model ended with status {m.Status}")
+        log.info("allocation written", extra={"videos": len(alloc.video_ids), "version": version})
+        return version
+    except Exception:
+        conn.rollback()
+        log.exception("failed to write rev_prop and proj_earnings to database")
+        return None
+
+# ----------------------------
+# Incremental re-optimisation
+# ----------------------------
+
+class IncrementalAllocator:
+    """
+    Keeps the state of the last full numpy solve (budget multiplier mu, M_total and per-video mass)
+    so that a new or changed video can be priced on its own: with mu fixed, the KKT payout of one
+    video only depends on its own share. Only that video's row is written back. The other payouts
+    are left as they were, so every incremental update moves a little mass away from the last
+    full solve; once the moved mass exceeds drift_tol * M_total we do a full re-solve instead.
+    """
+
+    def __init__(self, drift_tol=DRIFT_TOL):
+        self.drift_tol = drift_tol
+        self.lock = threading.Lock()
+        self.video_ids = None  # sorted int64
+        self.mass = None
+        self.payouts = None
+        self.mu = None
+        self.M_total = 0.0
+        self.moved = 0.0
+        self.version = None  # allocation version of the last full solve
+
+    @property
+    def drift(self):
+        return self.moved / self.M_total if self.M_total > 0 else float("inf")
+
+    def full_solve(self, conn):
+        with self.lock:
+            return self._full_solve(conn)
+
+    def _full_solve(self, conn):
+        alloc = get_optimised_values(conn, engine="numpy")
+        order = np.argsort(alloc.video_ids, kind="stable")
+        self.video_ids = alloc.video_ids[order]
+        self.mass = alloc.mass[order]
+        self.payouts = alloc.payouts[order]
+        self.mu = alloc.mu
+        self.version = alloc.version
+        self.M_total = float(self.mass.sum())
+        self.moved = 0.0
+        return alloc
+
+    def update(self, conn, video_id, defer_full=False):
+        """
+        Re-price a single new or changed video. Returns "incremental" or "full"; with
+        defer_full=True a needed full re-solve is left to the caller and "deferred" is returned.
+        """
+        with self.lock:
+            if self.mu is None or self.mu <= 0:
+                return self._full_or_defer(conn, defer_full)
+
+            row = load_video_inputs(conn, video_id)
+            if row is None:
+                raise ValueError(f"video_id {video_id} not found in videos table")
+            views, Q, C = row
+            M_new = views * Q if C == 1 else 0.0
+
+            i = int(np.searchsorted(self.video_ids, video_id))
+            known = i < len(self.video_ids) and self.video_ids[i] == video_id
+            M_old = float(self.mass[i]) if known else 0.0
+
+            M_total = self.M_total - M_old + M_new
+            moved = self.moved + abs(M_new - M_old)
+            if M_total <= 0 or moved > self.drift_tol * M_total:
+                return self._full_or_defer(conn, defer_full)
+
+            payout = self._payout_at_mu(M_new / M_total, C)
+            if payout is None:
+                return self._full_or_defer(conn, defer_full)
+
+            if known:
+                self.mass[i] = M_new
+                self.payouts[i] = payout
+            else:
+                self.video_ids = np.insert(self.video_ids, i, video_id)
+                self.mass = np.insert(self.mass, i, M_new)
+                self.payouts = np.insert(self.payouts, i, payout)
+            self.M_total = M_total
+            self.moved = moved
+
+            pct = max(0.0, min(1.0, payout / P))
+            conn.execute(
+                "UPDATE videos SET rev_prop = ?, proj_earnings = ?, quality_score = ?, allocation_version = ?, "
+                "row_version = row_version + 1 WHERE video_id = ?;",
+                (pct, payout, Q, self.version or 0, int(video_id)),
+            )
+            record_earnings(conn, self.version or 0, [video_id])
+            conn.commit()
+            log.info("incremental allocation", extra={"video_id": int(video_id), "payout": payout, "drift": self.drift})
+            return "incremental"
+
+    def record_drift(self, conn, video_ids):
+        """
+        Account for videos whose views or quality inputs changed without re-pricing them (e.g. a
+        batch of engagement events): their new mass counts towards the drift. Returns True when
+        the allocation needs a full re-solve (drift past drift_tol, or no full solve to compare to).
+        """
+        video_ids = sorted({int(v) for v in video_ids})
+        with self.lock:
+            if self.mu is None or not video_ids:
+                return self.mu is None and bool(video_ids)
+            blocks = list(fetch_by_ids(conn, f"SELECT video_id, views, {', '.join(QUALITY_INPUTS)} FROM videos", video_ids))
+            if not blocks:
+                return False
+            data = np.concatenate(blocks)
+            ids = data[:, 0].astype(np.int64)
+            M_new = data[:, 1] * quality_from_rows(data[:, 2:])  # quality_from_rows already gates on compliance
+
+            pos = np.searchsorted(self.video_ids, ids)
+            known = pos < len(self.video_ids)
+            known[known] = self.video_ids[pos[known]] == ids[known]
+            M_old = np.zeros_like(M_new)
+            M_old[known] = self.mass[pos[known]]
+            self.mass[pos[known]] = M_new[known]
+            # Videos the last solve hasn't seen are priced by update() / the next full solve
+
+            self.M_total += float((M_new - M_old)[known].sum())
+            self.moved += float(np.abs(M_new - M_old)[known].sum())
+            return self.M_total <= 0 or self.moved > self.drift_tol * self.M_total
+
+    def _full_or_defer(self, conn, defer_full):
+        if defer_full:
+            return "deferred"
+        self._full_solve(conn)
+        return "full"
+
+    def _payout_at_mu(self, s, C):
+        lb, ub = get_payout_bounds(np.array([C]))
+        if C != 1 or s <= 0:
+            return float(lb[0])
+        a = lambda_eff * s / P
+        if self.mu <= a:
+            # This video alone would soak up the pool at the current multiplier; needs a full solve
+            return None
+        raw = lambda_fair * (s ** alpha) / (self.mu - a)
+        return float(np.clip(raw, lb[0], ub[0]))
+
+def compare_engines(conn):
+    """
+    Solve with both engines (without writing to the DB) and report how far apart the payouts are.
+    The Gurobi model approximates log(p) with a 60-point PWL, so small differences are expected.
+    """
+    inputs = load_allocation_inputs(conn)
+    _, s, w = get_allocation_weights(*inputs[1:])
+    exact = get_optimised_values(conn, engine="numpy", persist=False, inputs=inputs)
+    approx = get_optimised_values(conn, engine="gurobi", persist=False, inputs=inputs)
+    if approx is None or approx.engine != "gurobi":
+        raise RuntimeError("Gurobi did not produce a solution; cannot compare engines.")
+    diff = np.abs(exact.payouts - approx.payouts)
+    report = {
+        "max_abs_diff": float(diff.max()),
+        "max_pct_of_pool_diff": float(diff.max() / P),
+        "objective_numpy": exact.objective,
+        "objective_gurobi": approx.objective,
+        # Gurobi's payouts scored on the exact log objective; never above objective_numpy
+        "objective_gurobi_exact": allocation_objective(approx.payouts, s, w),
+    }
+    log.info("engine agreement", extra=report)
+    return report
 
 if __name__ == ("__main__"):
-    db_path = "app.db"
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Quality-weighted ad pool optimiser")
+    parser.add_argument("--db", default="app.db")
+    parser.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE)
+    parser.add_argument("--compare", action="store_true", help="solve with both engines and report agreement")
+    args = parser.parse_args()
+
+    from metrics import configure_logging
+    configure_logging()
+
     # Connect to database to dynamically query video statistics, used as inputs to calculate quality score, Q, which is input for optimisation model
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(args.db)
 
-    get_optimised_values(conn)
+    if args.compare:
+        print(f"Engine agreement: {compare_engines(conn)}")
+    else:
+        alloc = get_optimised_values(conn, engine=args.engine)
+        if alloc is not None:
+            print(allocation_report(alloc))
 
-    conn.close()
\ No newline at end of file
+    conn.close()
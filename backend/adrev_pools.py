@@ -0,0 +1,270 @@
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from adrev_opti import (
+    solve_allocation, allocation_objective, get_allocation_weights, get_payout_bounds,
+    lambda_fair, lambda_eff, alpha,
+)
+from db import fetch_chunks
+from metrics import timed, observe, inc
+from quality import quality_from_rows, QUALITY_INPUTS
+
+# Independent ad pools (per region, campaign, ad set), each with its own budget and parameters
+# and its own member videos. A video can sit in any number of pools; the global pool of
+# adrev_opti (every video, budget P) is separate and keeps writing videos.proj_earnings.
+
+# Worker processes for solve_pools (default: one per core)
+POOL_WORKERS = int(os.environ.get("ADREV_POOL_WORKERS", "0")) or os.cpu_count() or 1
+# Workers are spawned: solve_pools runs on request / job / scheduler threads, and a forked child
+# would inherit whatever locks those threads hold at that moment
+MP_CONTEXT = multiprocessing.get_context("spawn")
+# Below this many member rows in total, starting the workers (about 0.7 s to spawn and import) and
+# pickling cost more than they save
+PARALLEL_MIN_ROWS = 200_000
+
+log = logging.getLogger(__name__)
+
+# One pool's solve: payouts are aligned with video_ids; status is "optimal" or "infeasible"
+PoolAllocation = namedtuple(
+    "PoolAllocation", ["pool_id", "video_ids", "payouts", "mu", "objective", "status", "seconds", "version"],
+    defaults=(None,),
+)
+
+
+def init_pool_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ad_pools (
+            pool_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+            name        TEXT    NOT NULL UNIQUE,
+            budget      FLOAT   NOT NULL,
+            lambda_fair FLOAT   NOT NULL DEFAULT 0.6,
+            lambda_eff  FLOAT   NOT NULL DEFAULT 0.4,
+            alpha       FLOAT   NOT NULL DEFAULT 0.7,
+            created_at  TEXT    NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    # payout / rev_prop are the last persisted solve of the pool (allocation_versions row)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ad_pool_members (
+            pool_id            INTEGER NOT NULL,
+            video_id           INTEGER NOT NULL,
+            payout             FLOAT   NOT NULL DEFAULT 0,
+            rev_prop           FLOAT   NOT NULL DEFAULT 0,
+            allocation_version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (pool_id, video_id)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ad_pool_members_video ON ad_pool_members(video_id);")
+    conn.commit()
+
+
+def create_pool(conn, name, budget, lam_fair=lambda_fair, lam_eff=lambda_eff, pool_alpha=alpha, video_ids=()):
+    """
+    Add a pool (and its members). Returns the pool_id.
+    """
+    if budget <= 0:
+        raise ValueError("budget must be positive")
+    cur = conn.execute(
+        "INSERT INTO ad_pools (name, budget, lambda_fair, lambda_eff, alpha) VALUES (?, ?, ?, ?, ?);",
+        (name, float(budget), float(lam_fair), float(lam_eff), float(pool_alpha)),
+    )
+    pool_id = cur.lastrowid
+    add_members(conn, pool_id, video_ids)
+    conn.commit()
+    return pool_id
+
+
+def add_members(conn, pool_id, video_ids):
+    conn.executemany(
+        "INSERT OR IGNORE INTO ad_pool_members (pool_id, video_id) VALUES (?, ?);",
+        ((pool_id, int(v)) for v in video_ids),
+    )
+
+
+def remove_members(conn, pool_id, video_ids):
+    conn.executemany(
+        "DELETE FROM ad_pool_members WHERE pool_id = ? AND video_id = ?;",
+        ((pool_id, int(v)) for v in video_ids),
+    )
+
+
+def load_pool_inputs(conn, pool_ids=None):
+    """
+    Every member row of the selected pools (all by default), in one pass sorted by pool, split
+    into per-pool solver tasks: (pool_id, budget, lambda_fair, lambda_eff, alpha, ids, views, Q, C).
+    Members whose video no longer exists are skipped. Rows are streamed in chunks and reduced to
+    typed columns (Q computed per chunk), so the quality inputs are never held for every member.
+    """
+    pool_filter, params = "", ()
+    if pool_ids is not None:
+        pool_ids = [int(p) for p in pool_ids]
+        if not pool_ids:
+            return []
+        pool_filter, params = f"pool_id IN ({', '.join('?' for _ in pool_ids)})", pool_ids
+    pools = {
+        row[0]: tuple(row[1:])
+        for row in conn.execute(
+            "SELECT pool_id, budget, lambda_fair, lambda_eff, alpha FROM ad_pools"
+            + (f" WHERE {pool_filter}" if pool_filter else ""),
+            params,
+        )
+    }
+    columns = {"pool_id": [], "video_id": [], "views": [], "Q": [], "C": []}
+    for block in fetch_chunks(
+        conn,
+        f"SELECT m.pool_id, v.video_id, v.views, {', '.join('v.' + c for c in QUALITY_INPUTS)} "
+        "FROM ad_pool_members m JOIN videos v ON v.video_id = m.video_id "
+        + (f"WHERE m.{pool_filter} " if pool_filter else "") +
+        "ORDER BY m.pool_id, m.video_id",
+        params,
+    ):
+        columns["pool_id"].append(block[:, 0].astype(np.int64))
+        columns["video_id"].append(block[:, 1].astype(np.int64))
+        columns["views"].append(block[:, 2].copy())
+        columns["Q"].append(quality_from_rows(block[:, 3:]))  # already gated on compliance
+        columns["C"].append((block[:, -1] == 1).astype(np.int8))
+    if not columns["pool_id"]:
+        return []
+    pool_col, video_ids, views, Q, C = (np.concatenate(parts) for parts in columns.values())
+
+    tasks = []
+    starts = np.flatnonzero(np.r_[True, pool_col[1:] != pool_col[:-1]])
+    for start, end in zip(starts, np.r_[starts[1:], len(pool_col)]):
+        pool_id = int(pool_col[start])
+        if pool_id not in pools:
+            continue
+        tasks.append((
+            pool_id, *pools[pool_id],
+            video_ids[start:end], views[start:end], Q[start:end], C[start:end],
+        ))
+    return tasks
+
+
+def solve_pool(task):
+    """
+    Solve one pool with the numpy engine. Runs in a worker process, so it only takes and returns
+    plain values (a PoolAllocation without a version).
+    """
+    t0 = time.perf_counter()
+    pool_id, budget, lam_fair, lam_eff, pool_alpha, ids, views, Q, C = task
+    try:
+        _, s, w = get_allocation_weights(views, Q, C, alpha=pool_alpha)
+        lb, ub = get_payout_bounds(C, p_min=max(1e-8 * budget, 1e-8))
+        payouts, mu = solve_allocation(s, w, lb, ub, pool=budget, lam_fair=lam_fair, lam_eff=lam_eff)
+        objective = allocation_objective(payouts, s, w, pool=budget, lam_fair=lam_fair, lam_eff=lam_eff)
+    except ValueError as e:
+        # No eligible videos, or floors/caps that can't meet the budget
+        return PoolAllocation(pool_id, ids, None, None, None, f"infeasible: {e}", time.perf_counter() - t0)
+    return PoolAllocation(pool_id, ids, payouts, mu, objective, "optimal", time.perf_counter() - t0)
+
+
+def solve_pools(conn, pool_ids=None, max_workers=None, persist=True):
+    """
+    Solve every selected pool (all by default) independently. Pools are spread over a process
+    pool, largest first, so wall time follows the largest pools and the core count rather than
+    the sum of all pool sizes; small workloads are solved inline. With persist=True all results
+    are written in one transaction. Returns {pool_id: PoolAllocation}.
+    """
+    max_workers = POOL_WORKERS if max_workers is None else max_workers
+    with timed("solver_stage_duration_seconds", span="solver", solver="adrev_pools", engine="numpy", stage="load"):
+        tasks = load_pool_inputs(conn, pool_ids)
+    if not tasks:
+        return {}
+    tasks.sort(key=lambda t: -len(t[5]))
+    rows = sum(len(t[5]) for t in tasks)
+
+    with timed("solver_stage_duration_seconds", span="solver", solver="adrev_pools", engine="numpy", stage="solve"):
+        if max_workers <= 1 or len(tasks) == 1 or rows < PARALLEL_MIN_ROWS:
+            results = [solve_pool(t) for t in tasks]
+        else:
+            workers = min(max_workers, len(tasks))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT) as executor:
+                results = list(executor.map(solve_pool, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    for r in results:
+        observe("adrev_pool_solve_duration_seconds", r.seconds)
+        inc("solver_status_total", solver="adrev_pools", engine="numpy", status=r.status.split(":")[0])
+        if r.payouts is None:
+            log.warning("pool not solved", extra={"pool_id": r.pool_id, "videos": len(r.video_ids), "status": r.status})
+    log.info("pools solved", extra={
+        "pools": len(results), "videos": rows, "infeasible": sum(r.payouts is None for r in results),
+    })
+
+    results = {r.pool_id: r for r in results}
+    if persist:
+        versions = persist_pool_allocations(conn, results.values(), {t[0]: t[1] for t in tasks})
+        results = {pid: r._replace(version=versions.get(pid)) for pid, r in results.items()}
+    return results
+
+
+def persist_pool_allocations(conn, results, budgets):
+    """
+    Write every solved pool in one transaction: one allocation_versions row per pool, then
+    payout, rev_prop and allocation_version for all their members in a single executemany.
+    Returns {pool_id: version} ({} on failure).
+    """
+    solved = [r for r in results if r.payouts is not None]
+    if not solved:
+        return {}
+    try:
+        with timed("solver_stage_duration_seconds", span="solver", solver="adrev_pools", engine="numpy", stage="write"):
+            cur = conn.cursor()
+            versions = {}
+            for r in solved:
+                cur.execute(
+                    "INSERT INTO allocation_versions (engine, videos, objective, pool, pool_id) VALUES (?, ?, ?, ?, ?);",
+                    ("numpy", len(r.video_ids), r.objective, budgets[r.pool_id], r.pool_id),
+                )
+                versions[r.pool_id] = cur.lastrowid
+
+            def updates():
+                for r in solved:
+                    budget, version = budgets[r.pool_id], versions[r.pool_id]
+                    pct = np.clip(r.payouts / budget, 0.0, 1.0)
+                    for video_id, payout, prop in zip(r.video_ids.tolist(), r.payouts.tolist(), pct.tolist()):
+                        yield payout, prop, version, r.pool_id, video_id
+
+            cur.executemany(
+                "UPDATE ad_pool_members SET payout = ?, rev_prop = ?, allocation_version = ? "
+                "WHERE pool_id = ? AND video_id = ?;",
+                updates(),
+            )
+            conn.commit()
+        log.info("pool allocations written", extra={"pools": len(versions), "videos": sum(len(r.video_ids) for r in solved)})
+        return versions
+    except Exception:
+        conn.rollback()
+        log.exception("failed to write pool allocations")
+        return {}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Solve every ad pool in parallel")
+    parser.add_argument("--db", default="app.db")
+    parser.add_argument("--workers", type=int, default=POOL_WORKERS)
+    parser.add_argument("--pool", type=int, action="append", help="only this pool_id (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="solve without writing the results")
+    args = parser.parse_args()
+
+    from metrics import configure_logging
+    configure_logging()
+
+    conn = sqlite3.connect(args.db)
+    t0 = time.perf_counter()
+    results = solve_pools(conn, args.pool, max_workers=args.workers, persist=not args.dry_run)
+    elapsed = time.perf_counter() - t0
+    print(f"{'pool':>6} {'videos':>9} {'objective':>12} {'solve s':>9}  status")
+    for r in sorted(results.values(), key=lambda r: r.pool_id):
+        objective = f"{r.objective:>12.4f}" if r.objective is not None else f"{'-':>12}"
+        print(f"{r.pool_id:>6} {len(r.video_ids):>9} {objective} {r.seconds:>9.3f}  {r.status}")
+    print(f"{len(results)} pools in {elapsed:.2f}s with {args.workers} workers")
+    conn.close()
@@ -1,133 +1,174 @@
-from flask import Flask, request, jsonify, g, send_file
+from flask import Flask, request, jsonify, g, send_file, has_request_context
 import sqlite3
 from pathlib import Path
 import json
-import cv2
 import random
 import base64
 import shutil
+import logging
+import os
+import hashlib
+import re
+import time
+import atexit
 from flask_cors import CORS  # <-- ensure installed
-
-from adrev_opti import get_optimised_values
-from donate_opti import get_coin_split
+from werkzeug.exceptions import BadRequest
+
+from adrev_opti import get_optimised_values, IncrementalAllocator, DEFAULT_ENGINE
+from donate_opti import get_coin_splits, purge_coin_cache, coin_cache
+from adrev_pools import solve_pools, create_pool
+from creator_stats import get_creator_stats
+from search import search, KINDS, SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from earnings import earnings_range, daily_timeline, compact_earnings, parse_date, GRAINS, DEFAULT_WINDOW
+from whatif import run_sweep, TOP_CREATORS
+from reopt_scheduler import ReoptScheduler
+from jobs import JobQueue
+from db import ConnectionPool
+from bootstrap import migrate, check_schema, create_indexes, sync_seeds, sync_media, data_fingerprint, get_meta, set_meta
+from quality import refresh_quality_scores
+from uploads import UploadStore, UploadError, CHUNK_SIZE
+from engagement import EngagementBuffer, EngagementError, MAX_EVENTS_PER_CALL
+from thumbnails import generate_thumbnails, prune_thumbnails, thumbnail_path, build_sprite, prune_sprites, THUMBNAIL_SIZES, DEFAULT_SIZE, SPRITE_TILE, SPRITE_COLUMNS
+from cache import LRUCache
+from engines import engine_status, cv2
+import metrics
 
 # ---- App ----
 app = Flask(__name__)
 # Wide-open CORS for dev. Adjust origins if you prefer.
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True, expose_headers=["X-Next-Cursor", "ETag", "Server-Timing", "X-Allocation-Stale-For"])
+# Optimiser, job and thumbnail logs go to stderr as JSON lines (LOG_LEVEL, default INFO)
+metrics.configure_logging()
+log = logging.getLogger(__name__)
 
-DB_PATH = Path(f"{app.root_path}/app.db")
+# APP_DB_PATH points the app at another database file (e.g. a scratch one for benchmarks)
+DB_PATH = Path(os.environ.get("APP_DB_PATH", f"{app.root_path}/app.db"))
 VIDEOS_DIR = Path(f"{app.root_path}/static/videos")
 THUMBNAILS_DIR = Path(f"{app.root_path}/static/thumbnails")
+UPLOADS_TMP_DIR = Path(f"{app.root_path}/uploads_tmp")
+SPRITES_DIR = THUMBNAILS_DIR / "sprites"
+SEED_DIR = Path(f"{app.root_path}/tables_init")
+# Read-only replica: serves reads from a database another process keeps up to date. Start-up
+# only checks the schema, write routes answer 503, and OpenCV/pandas/gurobipy are never imported
+# unless a read needs them (a sprite sheet that isn't on disk yet)
+READ_ONLY = os.environ.get("APP_READ_ONLY", "0") == "1"
+
+# POST routes that only read (what-if sweeps): served on replicas, from read-only connections
+READ_ONLY_POSTS = {"what_if"}
+
+# Pagination defaults for list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
 
 # ---- DB helpers ----
+# One pool for the whole process: routes, jobs, uploads and the optimisers
+pool = ConnectionPool(DB_PATH)
+
 def get_db():
     if "db" not in g:
-        g.db = sqlite3.connect(DB_PATH)
-        g.db.row_factory = sqlite3.Row
+        # GET routes only read, so they get a read-only connection
+        g.db_readonly = READ_ONLY or (has_request_context() and (
+            request.method in ("GET", "HEAD") or request.endpoint in READ_ONLY_POSTS))
+        g.db = pool.acquire(readonly=g.db_readonly)
     return g.db
 
 @app.teardown_appcontext
 def close_db(_exc):
     db = g.pop("db", None)
     if db is not None:
-        db.close()
+        pool.release(db, g.pop("db_readonly", False))
+
+# ---- Metrics ----
+@app.before_request
+def start_request_timing():
+    g.metrics_t0 = time.perf_counter()
+    g.metrics_token = metrics.start_request()
+
+@app.after_request
+def record_request_timing(response):
+    t0 = g.pop("metrics_t0", None)
+    if t0 is None:
+        return response
+    elapsed = time.perf_counter() - t0
+    # Label by URL rule, not path, so ids in the path don't blow up the number of series
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe("http_request_duration_seconds", elapsed, method=request.method, route=route)
+    metrics.inc("http_requests_total", method=request.method, route=route, status=response.status_code)
+    spans = metrics.end_request(g.pop("metrics_token"))
+    if metrics.SERVER_TIMING:
+        total = f"app;dur={elapsed * 1000:.2f}"
+        response.headers["Server-Timing"] = f"{spans}, {total}" if spans else total
+    return response
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return app.response_class(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+metrics.registry.gauge("engine_loaded", lambda: {(("engine", k),): int(v["loaded"]) for k, v in engine_status().items()})
+
+@app.before_request
+def reject_writes_on_replica():
+    if READ_ONLY and request.method not in ("GET", "HEAD", "OPTIONS") and request.endpoint not in READ_ONLY_POSTS:
+        return jsonify({"ok": False, "error": "read-only replica"}), 503
 
 def init_db():
+    """
+    Bring the database and media up to date, applying only what changed since the last start:
+    schema migrations, seed files and seed media by hash (see bootstrap.py), thumbnails by the
+    thumbnail manifest, and the full solve + coin splits only when the video data moved since
+    the last start-up solve. Nothing is dropped.
+    """
+    t0 = time.perf_counter()
     db = get_db()
-
-    # Videos
-    db.execute("DROP TABLE IF EXISTS videos;")
-    db.execute("""
-        CREATE TABLE videos (
-            video_id         INTEGER PRIMARY KEY AUTOINCREMENT,
-            creator_id       INTEGER NOT NULL DEFAULT 0,
-            title      TEXT NOT NULL,
-            views      INTEGER NOT NULL DEFAULT 0,
-            likes      INTEGER NOT NULL DEFAULT 0,
-            comments   INTEGER NOT NULL DEFAULT 0,
-            shares     INTEGER NOT NULL DEFAULT 0,
-            
-            watch_completion FLOAT NOT NULL DEFAULT 0.5,
-            engagement_rate FLOAT NOT NULL DEFAULT 0.5,
-            engagement_diversity FLOAT NOT NULL DEFAULT 0.5,
-            rewatch FLOAT NOT NULL DEFAULT 0.5,
-            nlp_quality FLOAT NOT NULL DEFAULT 0.5,
-            compliance INTEGER NOT NULL DEFAULT 0,
-            
-            rev_prop FLOAT NOT NULL DEFAULT 0,
-            proj_earnings FLOAT NOT NULL DEFAULT 0,
-            quality_score FLOAT NOT NULL DEFAULT 0,
-            
-            norm_coins INTEGER NOT NULL DEFAULT 0,
-            prem_coins INTEGER NOT NULL DEFAULT 0,
-            x_n FLOAT NOT NULL DEFAULT 0,
-            x_p FLOAT NOT NULL DEFAULT 0,
-            
-            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-
-    with open(f"{app.root_path}/tables_init/videos_init.json", "rb") as f:
-        videos_init = json.load(f)
-    if videos_init:
-        videos_init_rows = [list(row.values()) for row in videos_init]
-        colnames = list(videos_init[0].keys())
-        cols = ", ".join(colnames)
-        placeholders = ", ".join("?" for _ in colnames)
-        sql = f"INSERT INTO videos ({cols}) VALUES ({placeholders})"
-        db.executemany(sql, videos_init_rows)
-
-    db.execute("CREATE INDEX IF NOT EXISTS idx_videos_creator ON videos(creator_id);")
-    db.commit()
-
-    # Creators
-    db.execute("DROP TABLE IF EXISTS creators;")
-    db.execute("""
-        CREATE TABLE creators (
-            creator_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name       TEXT    NOT NULL,
-            following  INTEGER NOT NULL DEFAULT 0,
-            followers  INTEGER NOT NULL DEFAULT 0,
-            likes      INTEGER NOT NULL DEFAULT 0
-        );
-    """)
-    db.execute("CREATE INDEX IF NOT EXISTS idx_creators_name ON creators(name);")
-
-    with open(f"{app.root_path}/tables_init/creators_init.json", "rb") as f:
-        creators_init = json.load(f)
-    if creators_init:
-        creators_init_rows = [list(row.values()) for row in creators_init]
-        db.executemany(
-            "INSERT INTO creators (name, following, followers, likes) VALUES (?, ?, ?, ?)",
-            creators_init_rows,
-        )
-    db.commit()
-
-    # Copy seed videos (optional)
-    VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
-    THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
-
-    for p in VIDEOS_DIR.glob("*"):
-        p.unlink()
-    videos_init_dir = Path(app.root_path) / "tables_init" / "videos"
-    if videos_init_dir.exists():
-        for vid_fp in videos_init_dir.iterdir():
-            shutil.copy2(vid_fp, VIDEOS_DIR / f"{vid_fp.stem}{vid_fp.suffix}")
-
-    # Rebuild thumbnails
-    for p in THUMBNAILS_DIR.glob("*"):
-        p.unlink()
-    for video_path in VIDEOS_DIR.glob("*.mp4"):
-        save_thumbnail(video_path.stem)
-
-    # Update ad revenue split in table
-    compute_optimised_values()
-
-    # Update premium and normal coin revnue split in table
-    video_ids = list(range(1, len(videos_init_rows) + 1))
-    for video_id in video_ids:
-        compute_coin_splits(video_id)
+    if READ_ONLY:
+        check_schema(db)
+        log.info("startup ready", extra={"seconds": round(time.perf_counter() - t0, 3), "read_only": True})
+        return
+
+    # Jobs and upload sessions survive restarts, so these tables are never dropped
+    jobs.init_table()
+    uploads.init_table()
+    # Finalizes a previous process didn't get to commit() can be retried
+    uploads.reopen_stale()
+
+    with metrics.timed("startup_stage_duration_seconds", stage="schema"):
+        migrated = migrate(db)
+        create_indexes(db)
+        # Memoised coin splits solved under constants that have since changed can never be hit
+        purge_coin_cache(db)
+    with metrics.timed("startup_stage_duration_seconds", stage="seeds"):
+        seeded = sync_seeds(db, SEED_DIR)
+        if migrated or seeded:
+            refresh_quality_scores(db)
+
+    with metrics.timed("startup_stage_duration_seconds", stage="media"):
+        copied = sync_media(db, SEED_DIR / "videos", VIDEOS_DIR)
+        # Thumbnails are only extracted for videos whose content changed (thumbnail manifest);
+        # sprites are content-addressed, so the ones on disk stay valid until their page is rebuilt
+        video_paths = sorted(VIDEOS_DIR.glob("*.mp4"))
+        prune_thumbnails(THUMBNAILS_DIR, [p.stem for p in video_paths])
+        thumbnailed = generate_thumbnails(video_paths, THUMBNAILS_DIR)
+    thumb_cache.clear()
+    video_data_cache.clear()
+
+    # Payouts and coin splits on disk are current if no video row was written since the last
+    # start-up solve. Otherwise re-solve (ad revenue split, then both coin splits in one batch)
+    solved = data_fingerprint(db) != get_meta(db, "solved_fingerprint")
+    if solved:
+        with metrics.timed("startup_stage_duration_seconds", stage="solve"):
+            compute_optimised_values()
+            compute_coin_splits()
+            set_meta(db, "solved_fingerprint", data_fingerprint(db))
+            db.commit()
+
+    log.info("startup ready", extra={
+        "seconds": round(time.perf_counter() - t0, 3),
+        "migrated": migrated,
+        "seeded": seeded,
+        "media_copied": len(copied),
+        "thumbnails": len(thumbnailed),
+        "solved": solved,
+    })
 
 # ---- Routes ----
 @app.get("/health")
@@ -139,32 +180,181 @@ def index():
     return "Hello World"
 
 # ---- Helpers ----
-def compute_optimised_values():
-    conn = sqlite3.connect(DB_PATH)
-    get_optimised_values(conn)
-    conn.close()
-
-def compute_coin_splits(video_id):
-    conn = sqlite3.connect(DB_PATH)
-    get_coin_split(conn, video_id)
-    conn.close()
+# Keeps the last ad-pool solve around so uploads only re-price the new video
+allocator = IncrementalAllocator()
+
+def full_reoptimise():
+    metrics.inc("reopt_total", mode="full")
+    with pool.connection() as conn:
+        if DEFAULT_ENGINE != "numpy":
+            get_optimised_values(conn)
+        else:
+            allocator.full_solve(conn)
+        # Regional / campaign pools (ad_pools), solved in parallel; nothing to do without any
+        solve_pools(conn)
+        # Earnings history retention, at most once a day
+        compact_earnings(conn)
+
+# All full re-solves go through here: debounced, one at a time
+reopt = ReoptScheduler(full_reoptimise)
+
+def compute_optimised_values(video_id=None):
+    """
+    Full re-solve right away when video_id is None (startup). Otherwise re-price just that
+    video; if drift has passed adrev_opti.DRIFT_TOL a coalesced full re-solve is scheduled.
+    """
+    if video_id is None:
+        reopt.run_now()
+        return
+    if DEFAULT_ENGINE == "numpy":
+        with pool.connection() as conn:
+            mode = allocator.update(conn, video_id, defer_full=True)
+        metrics.inc("reopt_total", mode=mode)
+        if mode != "deferred":
+            return
+    reopt.mark_dirty()
+
+def current_allocation_version():
+    with pool.connection(readonly=True) as conn:
+        row = conn.execute("SELECT max(version) FROM allocation_versions WHERE pool_id IS NULL").fetchone()
+    return row[0] or 0
+
+def compute_coin_splits(video_ids=None):
+    with pool.connection() as conn:
+        get_coin_splits(conn, video_ids)
 
 def save_thumbnail(video_id: str):
+    generate_thumbnails([VIDEOS_DIR / f"{video_id}.mp4"], THUMBNAILS_DIR)
+    for size in THUMBNAIL_SIZES:
+        thumb_cache.pop((int(video_id), size))
+
+def parse_page_args(default=DEFAULT_PAGE_SIZE):
+    """
+    Keyset pagination args: ?after=<last id seen>&limit=<page size>. Returns (after, limit).
+    With default=None a request with neither gets limit None: every row, as before paging.
+    """
+    if default is None and "after" in request.args:
+        default = DEFAULT_PAGE_SIZE
     try:
-        video_filename = f"{app.root_path}/static/videos/{video_id}.mp4"
-        vid = cv2.VideoCapture(video_filename)
-        ok, img = vid.read()
-        if not ok or img is None:
-            raise RuntimeError("Failed to read video frame")
-        thumbnail_filename = f"{app.root_path}/static/thumbnails/{video_id}.jpg"
-        cv2.imwrite(thumbnail_filename, img)
-    except Exception as e:
-        print("Thumbnail cannot be extracted:", e)
+        after = int(request.args.get("after", 0))
+        limit = request.args.get("limit", default)
+        if limit is None:
+            return after, None
+        limit = int(limit)
+    except ValueError:
+        raise BadRequest("after and limit must be integers")
+    return after, max(1, min(limit, MAX_PAGE_SIZE))
+
+def sql_limit(limit):
+    # One row past the page tells paged_response whether there is a next one; -1 is no limit
+    return -1 if limit is None else limit + 1
+
+_table_columns = {}
+
+def parse_fields(db, table, key):
+    """
+    ?fields=a,b,c projection, checked against the table's columns. The key column is always
+    included (it is the pagination cursor). Returns the SELECT column list.
+    """
+    if table not in _table_columns:
+        _table_columns[table] = [r[1] for r in db.execute(f"PRAGMA table_info({table})").fetchall()]
+    columns = _table_columns[table]
+    fields = request.args.get("fields")
+    if not fields:
+        return ", ".join(columns)
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in columns]
+    if unknown:
+        raise BadRequest(f"unknown fields: {', '.join(unknown)}")
+    if key not in wanted:
+        wanted.insert(0, key)
+    return ", ".join(dict.fromkeys(wanted))
+
+def paged_response(rows, limit, key):
+    """
+    JSON list of the first `limit` rows; X-Next-Cursor carries the id to pass as ?after= next.
+    """
+    resp = jsonify([dict(r) for r in rows[:limit]])
+    if limit is not None and len(rows) > limit:
+        resp.headers["X-Next-Cursor"] = str(rows[limit - 1][key])
+    return resp
+
+# ---- Thumbnail payloads ----
+# base64 payloads keyed by (video_id, size). Every entry carries the file's etag, so a
+# regenerated thumbnail is never served stale even if nobody invalidated the entry.
+thumb_cache = LRUCache(maxsize=4096, maxbytes=64 * 1024 * 1024)
+metrics.registry.gauge("thumbnail_cache", lambda: {(("stat", k),): v for k, v in thumb_cache.stats().items()})
+metrics.registry.gauge("coin_cache", lambda: {(("stat", k),): v for k, v in coin_cache.lru.stats().items()})
+metrics.registry.gauge("allocation_version", lambda: current_allocation_version())
+metrics.registry.gauge("allocation_stale", lambda: int(reopt.status()["allocation_stale"]))
+
+def grid_thumbnail_path(video_id, size="grid"):
+    thumb = thumbnail_path(THUMBNAILS_DIR, video_id, size)
+    if not thumb.exists():
+        thumb = thumbnail_path(THUMBNAILS_DIR, video_id)
+    return thumb
+
+def file_etag(path):
+    st = path.stat()
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+def encoded_thumbnail(video_id, size, path, etag):
+    item = thumb_cache.get((video_id, size))
+    if item is not None and item["etag"] == etag:
+        return item
+    with open(path, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode("ascii")
+    item = {
+        "video_id": video_id,
+        "content_type": "image/jpeg",
+        "data_uri": f"data:image/jpeg;base64,{b64}",
+        "etag": etag,
+    }
+    thumb_cache.put((video_id, size), item, nbytes=len(b64))
+    return item
+
+def creator_thumbnail_page(creator_id, size, after, limit):
+    """
+    One keyset page of a creator's thumbnails (every one with limit None): [(video_id, path,
+    etag)], next cursor, page etag.
+    """
+    db = get_db()
+    rows = db.execute(
+        "SELECT video_id FROM videos WHERE creator_id = ? AND video_id > ? ORDER BY video_id LIMIT ?",
+        (creator_id, after, sql_limit(limit)),
+    ).fetchall()
+    next_cursor = rows[limit - 1][0] if limit is not None and len(rows) > limit else None
+    page = []
+    for (video_id,) in rows[:limit]:
+        thumb = grid_thumbnail_path(video_id, size)
+        if thumb.exists():
+            page.append((video_id, thumb, file_etag(thumb)))
+    h = hashlib.sha1(f"{size}|{next_cursor}|".encode())
+    for video_id, _, etag in page:
+        h.update(f"{video_id}:{etag};".encode())
+    return page, next_cursor, h.hexdigest()
 
 def save_video(video_id: int, file):
+    # Stream through a fixed-size buffer into a temp file, then rename into place
     video_filename = f"{app.root_path}/static/videos/{video_id}.mp4"
-    with open(video_filename, "wb") as f:
-        f.write(file.read())
+    tmp_filename = f"{video_filename}.part"
+    with open(tmp_filename, "wb") as f:
+        shutil.copyfileobj(file.stream, f, CHUNK_SIZE)
+    os.replace(tmp_filename, video_filename)
+
+def insert_video(db, creator_id, title):
+    new_row = {
+        "creator_id": creator_id,
+        "title": title
+    } | gen_random_video_data()
+
+    cols = ", ".join(new_row.keys())
+    placeholders = ", ".join("?" for _ in new_row)
+    sql = f"INSERT INTO videos ({cols}) VALUES ({placeholders})"
+    cur = db.execute(sql, tuple(new_row.values()))
+    db.commit()
+    refresh_quality_scores(db, [cur.lastrowid])
+    return cur.lastrowid
 
 def gen_random_video_data():
     views = random.randint(100, 50000)
@@ -182,6 +372,32 @@ def gen_random_video_data():
         "compliance": random.randint(0, 1),
     }
 
+# ---- Background jobs ----
+# Post-processing for uploads runs here instead of inside the request
+jobs = JobQueue(pool)
+
+def process_upload(payload, progress):
+    video_id = payload["video_id"]
+    progress(0.1, "extracting thumbnail")
+    save_thumbnail(str(video_id))
+
+    # Update ad revenue split in videos table (incremental for the new video)
+    progress(0.4, "updating ad revenue split")
+    compute_optimised_values(video_id)
+
+    # Update coin split
+    progress(0.7, "updating coin split")
+    compute_coin_splits([video_id])
+
+jobs.register("process_upload", process_upload)
+
+@app.get("/jobs/<int:job_id>")
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job)
+
 # ---- POST ----
 @app.post("/upload-video")
 def upload_video():
@@ -191,32 +407,192 @@ def upload_video():
     if file.filename == "":
         return {"error": "no selected file"}, 400
 
-    new_row = {
-        "creator_id": request.form.get("creator_id"),
-        "title": request.form.get("title")
-    } | gen_random_video_data()
-
     db = get_db()
     try:
-        cols = ", ".join(new_row.keys())
-        placeholders = ", ".join("?" for _ in new_row)
-        sql = f"INSERT INTO videos ({cols}) VALUES ({placeholders})"
-        cur = db.execute(sql, tuple(new_row.values()))
-        db.commit()
+        video_id = insert_video(db, request.form.get("creator_id"), request.form.get("title"))
     except sqlite3.IntegrityError as e:
         return {"error": str(e)}, 409
 
-    video_id = cur.lastrowid
     save_video(video_id, file)
-    save_thumbnail(str(video_id))
-
-    # Update ad revenue split in videos table
-    compute_optimised_values()
+    metrics.inc("uploads_total", kind="multipart")
+
+    # Thumbnail, ad revenue split and coin split happen in the background
+    job_id = jobs.submit("process_upload", {"video_id": video_id})
+
+    return {"ok": True, "video_id": video_id, "job_id": job_id, "status_url": f"/jobs/{job_id}"}, 202
+
+# ---- Chunked uploads (init / append / finalize) ----
+uploads = UploadStore(pool, UPLOADS_TMP_DIR)
+
+@app.errorhandler(BadRequest)
+def bad_request(e):
+    # JSON like every other error here, not werkzeug's HTML page
+    return jsonify({"error": e.description}), 400
+
+@app.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({"error": str(e)} | e.extra), e.status
+
+@app.post("/uploads")
+def init_upload():
+    body = request.get_json(silent=True) or request.form
+    title = body.get("title")
+    if not title:
+        return {"error": "title is required"}, 400
+    size = body.get("size")
+    if size is not None:
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            return jsonify({"error": "size must be an integer"}), 400
+        if size < 0:
+            return jsonify({"error": "size must not be negative"}), 400
+    return uploads.create(body.get("creator_id"), title, size), 201
+
+@app.get("/uploads/<upload_id>")
+def get_upload(upload_id):
+    return jsonify(uploads.status(upload_id))
+
+@app.put("/uploads/<upload_id>")
+def append_upload(upload_id):
+    # Raw bytes in the body; offset from ?offset= or the Upload-Offset header
+    offset = request.args.get("offset", request.headers.get("Upload-Offset"))
+    if offset is None:
+        return {"error": "offset is required"}, 400
+    try:
+        offset = int(offset)
+    except ValueError:
+        return jsonify({"error": "offset must be an integer"}), 400
+    new_offset = uploads.append(upload_id, offset, request.stream)
+    return {"ok": True, "offset": new_offset}
 
-    # Update coin split
-    compute_coin_splits(video_id)
+@app.post("/uploads/<upload_id>/finalize")
+def finalize_upload(upload_id):
+    body = request.get_json(silent=True) or request.form
+    session, path, digest = uploads.finalize(upload_id, body.get("sha256"))
 
-    return {"ok": True, "video_id": video_id}, 201
+    db = get_db()
+    video_id = None
+    try:
+        video_id = insert_video(db, session["creator_id"], session["title"])
+        uploads.commit(upload_id, path, VIDEOS_DIR / f"{video_id}.mp4", video_id, digest)
+    except Exception:
+        # Undo the half-done finalize, so the session can be finalized again
+        db.rollback()
+        if video_id is not None:
+            db.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+            db.commit()
+        uploads.reopen(upload_id)
+        raise
+    metrics.inc("uploads_total", kind="chunked")
+
+    job_id = jobs.submit("process_upload", {"video_id": video_id})
+    return {"ok": True, "video_id": video_id, "sha256": digest, "job_id": job_id, "status_url": f"/jobs/{job_id}"}, 202
+
+# ---- Engagement ingestion ----
+def engagement_flushed(conn, video_ids):
+    # Views / quality moved some allocation shares; re-solve once they moved enough
+    if allocator.record_drift(conn, video_ids):
+        reopt.mark_dirty()
+
+engagement = EngagementBuffer(pool, on_flush=engagement_flushed)
+atexit.register(engagement.flush)
+metrics.registry.gauge("engagement_pending", lambda: {(("kind", k),): v for k, v in engagement.pending().items()})
+
+@app.errorhandler(EngagementError)
+def engagement_error(e):
+    return jsonify({"error": str(e)}), 400
+
+@app.post("/engagement")
+def ingest_engagement():
+    """
+    Batch of engagement events: {"events": [{"video_id": 1, "views": 3, "likes": 1, ...}, ...]}.
+    Buffered and written in bulk; "flush": true writes them before returning.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("events"), list):
+        return jsonify({"error": "expected a JSON object with an events list"}), 400
+    events = body["events"]
+    if len(events) > MAX_EVENTS_PER_CALL:
+        return jsonify({"error": f"at most {MAX_EVENTS_PER_CALL} events per call"}), 413
+    accepted = engagement.add(events)
+    if body.get("flush"):
+        engagement.flush()
+    return jsonify({"ok": True, "accepted": accepted, "pending": engagement.pending()}), 202
+
+# ---- Ad pools ----
+@app.get("/ad-pools")
+def list_ad_pools():
+    after, limit = parse_page_args()
+    rows = get_db().execute(
+        """
+        SELECT p.pool_id, p.name, p.budget, p.lambda_fair, p.lambda_eff, p.alpha,
+               (SELECT count(*) FROM ad_pool_members m WHERE m.pool_id = p.pool_id) AS videos,
+               (SELECT max(version) FROM allocation_versions a WHERE a.pool_id = p.pool_id) AS allocation_version
+        FROM ad_pools p WHERE p.pool_id > ? ORDER BY p.pool_id LIMIT ?
+        """,
+        (after, limit + 1),
+    ).fetchall()
+    return paged_response(rows, limit, "pool_id")
+
+@app.get("/ad-pools/<int:pool_id>/allocation")
+def ad_pool_allocation(pool_id):
+    """
+    The pool's last persisted payouts, paged by video_id.
+    """
+    after, limit = parse_page_args()
+    db = get_db()
+    if db.execute("SELECT 1 FROM ad_pools WHERE pool_id = ?", (pool_id,)).fetchone() is None:
+        return jsonify({"error": "not found"}), 404
+    rows = db.execute(
+        "SELECT video_id, payout, rev_prop, allocation_version FROM ad_pool_members "
+        "WHERE pool_id = ? AND video_id > ? ORDER BY video_id LIMIT ?",
+        (pool_id, after, limit + 1),
+    ).fetchall()
+    return paged_response(rows, limit, "video_id")
+
+@app.post("/ad-pools")
+def create_ad_pool():
+    """
+    {"name": ..., "budget": ..., "video_ids": [...], optional "lambda_fair", "lambda_eff", "alpha"}.
+    The pool is solved with the next (coalesced) re-solve.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not body.get("name") or not isinstance(body.get("video_ids"), list):
+        return jsonify({"error": "expected a JSON object with name, budget and a video_ids list"}), 400
+    params = {}
+    try:
+        budget = float(body["budget"])
+        for key, arg in (("lambda_fair", "lam_fair"), ("lambda_eff", "lam_eff"), ("alpha", "pool_alpha")):
+            if key in body:
+                params[arg] = float(body[key])
+        video_ids = [int(v) for v in body["video_ids"]]
+        db = get_db()
+        pool_id = create_pool(db, str(body["name"]), budget, video_ids=video_ids, **params)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"invalid pool: {e}"}), 400
+    except sqlite3.IntegrityError:
+        return jsonify({"error": "a pool with that name already exists"}), 409
+    reopt.mark_dirty()
+    return jsonify({"ok": True, "pool_id": pool_id, "videos": len(set(video_ids))}), 201
+
+@app.post("/what-if")
+def what_if():
+    """
+    {"grid": {"lambda_fair": [0.4, 0.6], "alpha": [0.5, 0.7, 0.9], ...}, optional "budget", "top"}.
+    Solves every grid point against the live catalogue without writing anything and returns the
+    frontier report of whatif.run_sweep.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("grid"), dict):
+        return jsonify({"error": "expected a JSON object with a grid of parameter values"}), 400
+    try:
+        top_n = max(0, min(int(body.get("top", TOP_CREATORS)), 100))
+        kwargs = {"budget": float(body["budget"])} if "budget" in body else {}
+        report = run_sweep(get_db(), body["grid"], top_n=top_n, **kwargs)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"invalid sweep: {e}"}), 400
+    return jsonify(report)
 
 # ---- GET (Creators) ----
 @app.get("/get-creator-by-name")
@@ -247,9 +623,46 @@ def get_creator_data():
 
 @app.get("/list-creators")
 def list_creators():
+    # The whole list unless the client pages (limit or after)
+    after, limit = parse_page_args(default=None)
     db = get_db()
-    rows = db.execute("SELECT creator_id, name, following, followers, likes FROM creators ORDER BY creator_id").fetchall()
-    return jsonify([dict(r) for r in rows])
+    cols = parse_fields(db, "creators", "creator_id")
+    rows = db.execute(
+        f"SELECT {cols} FROM creators WHERE creator_id > ? ORDER BY creator_id LIMIT ?",
+        (after, sql_limit(limit)),
+    ).fetchall()
+    return paged_response(rows, limit, "creator_id")
+
+@app.get("/creators/<int:creator_id>/stats")
+def creator_stats(creator_id):
+    # Totals over the creator's videos, maintained by triggers (one primary-key lookup)
+    stats = get_creator_stats(get_db(), creator_id)
+    if stats is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(stats)
+
+@app.get("/search")
+def search_catalogue():
+    """
+    Typeahead over creator names and video titles: ?q=&type=all|creators|videos&limit=&fuzzy=0|1.
+    Every word of q must match, the last one as a prefix; creators nothing matches fall back to
+    substring / one-typo matches on the trigram index unless fuzzy=0.
+    """
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    kind = request.args.get("type", "all")
+    if kind != "all" and kind not in KINDS:
+        return jsonify({"error": f"type must be all or one of {', '.join(KINDS)}"}), 400
+    try:
+        limit = int(request.args.get("limit", SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    fuzzy = request.args.get("fuzzy", "1") not in ("0", "false")
+    kinds = tuple(KINDS) if kind == "all" else (kind,)
+    results = search(get_db(), q, kinds, max(1, min(limit, MAX_SEARCH_LIMIT)), fuzzy)
+    return jsonify({"q": q, **results})
+
 # Read (get) a single video by video_id
 @app.get("/get-video")
 def get_video():
@@ -288,8 +701,13 @@ def get_video_thumbnail():
         ).fetchone()
         if not row:
             return jsonify({"error": "not found"}), 404
-        # If the video id exists, send the corresponding thumbnail
-        thumbnail_filepath = THUMBNAILS_DIR / f"{video_id}.jpg"
+        # If the video id exists, send the corresponding thumbnail (?size=grid for small tiles)
+        size = request.args.get("size", DEFAULT_SIZE)
+        if size not in THUMBNAIL_SIZES:
+            return jsonify({"error": f"size must be one of {list(THUMBNAIL_SIZES)}"}), 400
+        thumbnail_filepath = thumbnail_path(THUMBNAILS_DIR, video_id, size)
+        if not thumbnail_filepath.exists():
+            thumbnail_filepath = thumbnail_path(THUMBNAILS_DIR, video_id)
         return send_file(
             str(thumbnail_filepath),
             mimetype="image/jpeg",  # set your real mimetype if different
@@ -301,43 +719,140 @@ def get_all_videos_data():
     creator_id = request.args.get('creator_id')
     if not creator_id:
         return "creator_id parameter is missing."
+    # The whole list unless the client pages (limit or after)
+    after, limit = parse_page_args(default=None)
+    db = get_db()
+    cols = parse_fields(db, "videos", "video_id")
+    rows = db.execute(
+        f"SELECT {cols} FROM videos WHERE creator_id = ? AND video_id > ? ORDER BY video_id LIMIT ?",
+        (creator_id, after, sql_limit(limit)),
+    ).fetchall()
+    return paged_response(rows, limit, "video_id")
+
+@app.get("/get-videos-data")
+def get_videos_data():
+    """
+    Many videos in one round-trip: ?ids=1,2,3 (at most MAX_PAGE_SIZE), optional ?fields=.
+    Rows come back in the order asked for; unknown ids are left out.
+    """
+    try:
+        ids = [int(v) for v in request.args.get("ids", "").split(",") if v.strip()]
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of integers"}), 400
+    if not ids:
+        return jsonify({"error": "ids parameter is required"}), 400
+    if len(ids) > MAX_PAGE_SIZE:
+        return jsonify({"error": f"at most {MAX_PAGE_SIZE} ids per request"}), 400
     db = get_db()
-    rows = db.execute("SELECT * FROM videos WHERE creator_id = ?", (creator_id,)).fetchall()
-    return jsonify([dict(row) for row in rows])
+    cols = parse_fields(db, "videos", "video_id")
+    placeholders = ", ".join("?" for _ in ids)
+    rows = db.execute(f"SELECT {cols} FROM videos WHERE video_id IN ({placeholders})", ids).fetchall()
+    by_id = {r["video_id"]: dict(r) for r in rows}
+    return jsonify([by_id[i] for i in dict.fromkeys(ids) if i in by_id])
+
+# ORDER BY expressions must match the index definitions exactly to be served by them
+TOP_VIDEOS_ORDER = {
+    "quality": "quality_score DESC",
+    "weighted": "(views * quality_score) DESC",
+}
+
+@app.get("/top-videos")
+def top_videos():
+    """
+    Top videos by quality_score (?by=quality) or by views * quality_score (?by=weighted).
+    """
+    by = request.args.get("by", "quality")
+    if by not in TOP_VIDEOS_ORDER:
+        return jsonify({"error": f"by must be one of {list(TOP_VIDEOS_ORDER)}"}), 400
+    _, limit = parse_page_args(default=20)
+    db = get_db()
+    cols = parse_fields(db, "videos", "video_id")
+    rows = db.execute(
+        f"SELECT {cols} FROM videos ORDER BY {TOP_VIDEOS_ORDER[by]} LIMIT ?",
+        (limit,),
+    ).fetchall()
+    return jsonify([dict(r) for r in rows])
 
 @app.get("/get-all-videos-thumbnails")
 def get_all_videos_thumbnails():
     creator_id = request.args.get('creator_id')
     if not creator_id:
         return "creator_id parameter is missing."
-    db = get_db()
-    rows = db.execute("SELECT video_id FROM videos WHERE creator_id = ?", (creator_id,)).fetchall()
-    out = []
-    for (video_id,) in rows:
-        thumb = THUMBNAILS_DIR / f"{video_id}.jpg"
-        if thumb.exists():
-            with open(thumb, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("ascii")
-            out.append({
-                "video_id": video_id,
-                "content_type": "image/jpeg",
-                "data_uri": f"data:image/jpeg;base64,{b64}",
-            })
-    return jsonify({"ok": True, "images": out})
-
-@app.get("/get-video-data")
-def get_video_data():
-    video_id = request.args.get('video_id')
-    if not video_id:
-        return jsonify({"error": "video_id parameter is required"}), 400
-    
-    db = get_db()
-    row = db.execute("SELECT * FROM videos WHERE video_id = ?", (video_id,)).fetchone()
-    if not row:
-        return jsonify({"error": "Video not found"}), 404
-    
-    video_data = dict(row)
-    
+    # Full-size images and every thumbnail unless asked otherwise, as before paging; grid tiles
+    # only need size=grid
+    size = request.args.get("size", DEFAULT_SIZE)
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({"error": f"size must be one of {list(THUMBNAIL_SIZES)}"}), 400
+    after, limit = parse_page_args(default=None)
+    page, next_cursor, etag = creator_thumbnail_page(creator_id, size, after, limit)
+    if request.if_none_match.contains(etag):
+        return "", 304, {"ETag": f'"{etag}"'}
+
+    out = [encoded_thumbnail(video_id, size, path, file_tag) for video_id, path, file_tag in page]
+    resp = jsonify({"ok": True, "images": out, "next_cursor": next_cursor})
+    resp.set_etag(etag)
+    return resp
+
+@app.get("/get-thumbnail-sprite")
+def get_thumbnail_sprite():
+    """
+    A creator's grid thumbnails as one sprite sheet plus the tile map, a page at a time. The sheet
+    URL is content-addressed, so clients can cache it forever.
+    """
+    creator_id = request.args.get('creator_id')
+    if not creator_id:
+        return "creator_id parameter is missing."
+    try:
+        creator_id = int(creator_id)
+    except ValueError:
+        return jsonify({"error": "creator_id must be an integer"}), 400
+    after, limit = parse_page_args()
+    page, next_cursor, etag = creator_thumbnail_page(creator_id, "grid", after, limit)
+    if request.if_none_match.contains(etag):
+        return "", 304, {"ETag": f'"{etag}"'}
+
+    # One sheet per page on disk: building a page's new sheet removes the one it replaces
+    slot = f"{creator_id}-{after}-{limit}"
+    sprite = SPRITES_DIR / f"{slot}-{etag}.jpg"
+    if not sprite.exists():
+        if not cv2.available:
+            return jsonify({"ok": False, "error": "sprite not built and no media engine here"}), 503
+        build_sprite([path for _, path, _ in page], sprite)
+        prune_sprites(SPRITES_DIR, slot, sprite)
+    cols = max(1, min(len(page), SPRITE_COLUMNS))
+    tw, th = SPRITE_TILE
+    tiles = [
+        {"video_id": video_id, "x": (i % cols) * tw, "y": (i // cols) * th}
+        for i, (video_id, _, _) in enumerate(page)
+    ]
+    resp = jsonify({
+        "ok": True,
+        "sprite_url": f"/thumbnail-sprite/{sprite.name}",
+        "tile_width": tw,
+        "tile_height": th,
+        "columns": cols,
+        "tiles": tiles,
+        "next_cursor": next_cursor,
+    })
+    resp.set_etag(etag)
+    return resp
+
+@app.get("/thumbnail-sprite/<key>.jpg")
+def thumbnail_sprite(key):
+    if not re.fullmatch(r"\d+-\d+-\d+-[0-9a-f]{40}", key) or not (SPRITES_DIR / f"{key}.jpg").exists():
+        return jsonify({"error": "not found"}), 404
+    return send_file(str(SPRITES_DIR / f"{key}.jpg"), mimetype="image/jpeg", max_age=31536000)
+
+# Rendered /get-video-data bodies by video_id: (key, body, etag). An entry is only served while
+# the key (row_version, allocation_version, allocation_stale) still matches the video's row
+video_data_cache = LRUCache(maxsize=8192, maxbytes=32 * 1024 * 1024)
+
+def build_video_data(video_data, timeline):
+    """
+    Detail payload for one video. Only depends on the row (plus the allocation_versions join) and
+    its earnings timeline, which is only appended to together with a write to the row, so it can
+    be cached and given a strong ETag.
+    """
     # Calculate additional derived metrics for the detail view
     video_data['revenue_proportion_percent'] = video_data['rev_prop'] * 100
     video_data['quality_score_percent'] = video_data['quality_score'] * 100
@@ -370,24 +885,8 @@ def get_video_data():
         }
     }
     
-    # Add mock earnings over time data (7 days)
-    import datetime
-    base_date = datetime.datetime.now()
-    earnings_timeline = []
-    cumulative = 0
-    daily_earnings = video_data['proj_earnings'] / 7  # Spread over 7 days
-    
-    for i in range(7):
-        date = base_date - datetime.timedelta(days=6-i)
-        daily_amount = daily_earnings * (0.5 + random.random())  # Add some variation
-        cumulative += daily_amount
-        earnings_timeline.append({
-            'date': date.strftime('%m/%d'),
-            'daily_earnings': round(daily_amount, 2),
-            'cumulative_earnings': round(cumulative, 2)
-        })
-    
-    video_data['earnings_timeline'] = earnings_timeline
+    # Earnings over time: the last 7 days of recorded allocations (daily rollups, see earnings.py)
+    video_data['earnings_timeline'] = timeline
     
     # Calculate earnings per view
     if video_data['views'] > 0:
@@ -407,9 +906,89 @@ def get_video_data():
         }
     }
     
-    return jsonify(video_data)
+    return video_data
 
-if __name__ == "__main__":
+@app.get("/get-video-data")
+def get_video_data():
+    try:
+        video_id = int(request.args.get('video_id', ''))
+    except ValueError:
+        return jsonify({"error": "video_id parameter is required"}), 400
+
+    db = get_db()
+    head = db.execute("SELECT row_version, allocation_version FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+    if not head:
+        return jsonify({"error": "Video not found"}), 404
+
+    # Whether a newer allocation is pending is part of the payload; how long it has been is not
+    status = reopt.status()
+    key = (head["row_version"], head["allocation_version"], status["allocation_stale"])
+    cached = video_data_cache.get(video_id)
+    if cached is None or cached[0] != key:
+        row = db.execute(
+            """
+            SELECT v.*, a.created_at AS allocation_committed_at
+            FROM videos v LEFT JOIN allocation_versions a ON a.version = v.allocation_version
+            WHERE v.video_id = ?
+            """,
+            (video_id,),
+        ).fetchone()
+        if not row:
+            return jsonify({"error": "Video not found"}), 404
+        video_data = dict(row)
+        video_data['allocation_stale'] = status["allocation_stale"]
+        body = jsonify(build_video_data(video_data, daily_timeline(db, video_id))).get_data()
+        key = (row["row_version"], row["allocation_version"], status["allocation_stale"])
+        cached = (key, body, hashlib.sha1(body).hexdigest())
+        video_data_cache.put(video_id, cached, nbytes=len(body))
+
+    _, body, etag = cached
+    headers = {"X-Allocation-Stale-For": str(status["allocation_stale_for_s"]), "Cache-Control": "no-cache"}
+    if request.if_none_match.contains(etag):
+        return "", 304, {"ETag": f'"{etag}"', **headers}
+    resp = app.response_class(body, mimetype="application/json", headers=headers)
+    resp.set_etag(etag)
+    return resp
+
+@app.get("/videos/<int:video_id>/earnings")
+def video_earnings(video_id):
+    """
+    Earnings history of one video: ?grain=day|week|sample&start=&end= (YYYY-MM-DD in UTC or unix
+    seconds; end is exclusive and defaults to now, start to a window that depends on the grain).
+    One range scan of the grain's (video_id, bucket) primary key.
+    """
+    grain = request.args.get("grain", "day")
+    if grain not in GRAINS:
+        return jsonify({"error": f"grain must be one of {', '.join(GRAINS)}"}), 400
+    try:
+        end = parse_date(request.args["end"]) if "end" in request.args else int(time.time()) + 1
+        start = parse_date(request.args["start"]) if "start" in request.args else end - DEFAULT_WINDOW[grain]
+    except ValueError:
+        return jsonify({"error": "start and end must be YYYY-MM-DD or unix seconds"}), 400
+    db = get_db()
+    if db.execute("SELECT 1 FROM videos WHERE video_id = ?", (video_id,)).fetchone() is None:
+        return jsonify({"error": "Video not found"}), 404
+    return jsonify({
+        "video_id": video_id,
+        "grain": grain,
+        "start": start,
+        "end": end,
+        "points": earnings_range(db, video_id, grain, start, end),
+    })
+
+def start():
+    """
+    Process start-up: init_db, then pick up the jobs a previous process left
+    unfinished. `python app.py` calls it before serving; every other server (flask run, gunicorn)
+    gets it on import, unless APP_STARTUP=0 (tests and benchmarks that bring their own data).
+    """
     with app.app_context():
         init_db()
+    if not READ_ONLY:
+        jobs.resume()
+
+if __name__ == "__main__":
+    start()
     app.run(host="0.0.0.0", port=5000, debug=True)
+elif os.environ.get("APP_STARTUP", "1") == "1":
+    start()
@@ -0,0 +1,10 @@
+"""
+Benchmarks for the optimisers and the Flask routes at scale.
+
+    python -m bench --videos 10000,100000          # generate, time, write bench/results/<stamp>.json
+    python -m bench --compare old.json new.json     # p50 ratios between two runs
+    python -m bench.datagen --db scratch.db --videos 1000000
+    python -m bench.startup --db scratch.db          # import-time profile, cold start and RSS per mode
+
+Everything runs against a scratch database (APP_DB_PATH), never backend/app.db.
+"""
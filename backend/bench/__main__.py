@@ -0,0 +1,40 @@
+import argparse
+import sys
+
+from bench.datagen import check_scratch_db
+from bench.runner import run, compare, DEFAULT_SCALES, DEFAULT_DB, SOLVER_REPEATS, ROUTE_REQUESTS, GUROBI_MAX_VIDEOS, REGRESSION_RATIO, DEFAULT_POOLS
+
+parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark the optimisers and routes at scale")
+parser.add_argument("--videos", default=",".join(map(str, DEFAULT_SCALES)),
+                    help="comma-separated dataset sizes, e.g. 10000,100000,1000000")
+parser.add_argument("--db", default=str(DEFAULT_DB), help="scratch database (overwritten)")
+parser.add_argument("--out", default=None, help="results file (default bench/results/<timestamp>.json)")
+parser.add_argument("--repeats", type=int, default=SOLVER_REPEATS, help="timed runs per full solve")
+parser.add_argument("--requests", type=int, default=ROUTE_REQUESTS, help="timed requests per route")
+parser.add_argument("--gurobi-max", type=int, default=GUROBI_MAX_VIDEOS, help="skip the gurobi engine above this size")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--pools", type=int, default=DEFAULT_POOLS, help="regional ad pools for the multi-pool benchmarks")
+parser.add_argument("--force", action="store_true", help="allow --db to be the app's database")
+parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files instead of running")
+parser.add_argument("--threshold", type=float, default=REGRESSION_RATIO, help="p50 ratio counted as a regression")
+args = parser.parse_args()
+
+if args.compare:
+    sys.exit(1 if compare(*args.compare, threshold=args.threshold) else 0)
+
+try:
+    check_scratch_db(args.db, args.force)
+except ValueError as e:
+    parser.error(str(e))
+
+run(
+    scales=[int(v) for v in args.videos.split(",") if v.strip()],
+    db_path=args.db,
+    out=args.out,
+    repeats=args.repeats,
+    requests=args.requests,
+    gurobi_max=args.gurobi_max,
+    seed=args.seed,
+    pools=args.pools,
+    force=args.force,
+)
@@ -0,0 +1,154 @@
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from adrev_pools import create_pool, add_members
+from bootstrap import reset_tables, create_indexes
+from quality import refresh_quality_scores
+
+# Average videos per creator; the actual counts are heavy-tailed (a few creators own most videos)
+VIDEOS_PER_CREATOR = 50
+CREATOR_TAIL = 1.2  # Pareto shape of the videos-per-creator weights
+INSERT_BATCH = 50_000
+# Synthetic ad pools: every video sits in one regional pool (sizes are skewed like real regions)
+POOL_TAIL = 1.5
+POOL_BUDGET_PER_VIDEO = 2.0
+# The database app.py serves when APP_DB_PATH isn't set
+APP_DB = Path(__file__).resolve().parent.parent / "app.db"
+
+VIDEO_COLUMNS = (
+    "creator_id", "title", "views", "likes", "comments", "shares",
+    "watch_completion", "engagement_rate", "engagement_diversity", "rewatch", "nlp_quality", "compliance",
+    "norm_coins", "prem_coins",
+)
+
+
+def random_video_columns(rng, n):
+    """
+    gen_random_video_data (app.py) for n videos at once, same distributions, one array per column.
+    Coins aren't drawn there (uploads start at 0); here they scale with views so the coin split has work to do.
+    """
+    views = rng.integers(100, 50_001, n)
+    likes = rng.integers((views * 0.3).astype(np.int64), (views * 0.5).astype(np.int64) + 1)
+    return {
+        "views": views,
+        "likes": likes,
+        "shares": rng.integers((likes * 0.05).astype(np.int64), (likes * 0.1).astype(np.int64) + 1),
+        "comments": rng.integers((likes * 0.2).astype(np.int64), (likes * 0.3).astype(np.int64) + 1),
+        "watch_completion": rng.random(n),
+        "engagement_rate": rng.random(n),
+        "engagement_diversity": rng.random(n),
+        "rewatch": rng.random(n),
+        "nlp_quality": rng.random(n),
+        "compliance": rng.integers(0, 2, n),
+        "norm_coins": rng.integers(0, views // 10 + 1),
+        "prem_coins": rng.integers(0, views // 25 + 1),
+    }
+
+
+def check_scratch_db(db_path, force=False):
+    """
+    Raise ValueError if db_path is the app's database (backend/app.db or APP_DB_PATH), which
+    generate would wipe, unless force is set. Returns the resolved path.
+    """
+    path = Path(db_path).resolve()
+    app_dbs = {APP_DB}
+    if os.environ.get("APP_DB_PATH"):
+        app_dbs.add(Path(os.environ["APP_DB_PATH"]).resolve())
+    if path in app_dbs and not force:
+        raise ValueError(f"{path} is the app's database and would be overwritten; pass --force to use it anyway")
+    return path
+
+
+def generate(conn, n_videos, n_creators=None, seed=0):
+    """
+    Replace the videos and creators tables with n_videos synthetic videos spread over n_creators
+    creators, then build the indexes and materialise quality_score. Returns a summary dict.
+    """
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    n_creators = n_creators or max(1, n_videos // VIDEOS_PER_CREATOR)
+
+    reset_tables(conn)
+
+    weights = rng.pareto(CREATOR_TAIL, n_creators) + 1.0
+    owner = rng.choice(n_creators, size=n_videos, p=weights / weights.sum())
+    cols = random_video_columns(rng, n_videos)
+    cols["creator_id"] = owner + 1
+    cols["title"] = [f"video {i}" for i in range(1, n_videos + 1)]
+
+    sql = f"INSERT INTO videos ({', '.join(VIDEO_COLUMNS)}) VALUES ({', '.join('?' for _ in VIDEO_COLUMNS)})"
+    for start in range(0, n_videos, INSERT_BATCH):
+        end = min(start + INSERT_BATCH, n_videos)
+        conn.executemany(sql, zip(*(
+            cols[c][start:end] if c == "title" else cols[c][start:end].tolist() for c in VIDEO_COLUMNS
+        )))
+
+    creator_likes = np.bincount(owner, weights=cols["likes"], minlength=n_creators).astype(np.int64)
+    conn.executemany(
+        "INSERT INTO creators (name, following, followers, likes) VALUES (?, ?, ?, ?)",
+        zip(
+            (f"creator_{i:07d}" for i in range(1, n_creators + 1)),
+            rng.integers(0, 2_000, n_creators).tolist(),
+            rng.lognormal(7.0, 2.0, n_creators).astype(np.int64).tolist(),
+            creator_likes.tolist(),
+        ),
+    )
+    conn.commit()
+
+    create_indexes(conn)
+    refresh_quality_scores(conn)
+    return {"videos": n_videos, "creators": n_creators, "seed": seed, "seconds": time.perf_counter() - t0}
+
+
+def generate_pools(conn, n_pools, seed=0):
+    """
+    Replace all ad pools with n_pools regional pools covering every video once, each with a
+    budget proportional to its size and slightly different parameters. Returns a summary dict.
+    """
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed + 1)
+    conn.execute("DELETE FROM ad_pool_members;")
+    conn.execute("DELETE FROM ad_pools;")
+    video_ids = np.array([r[0] for r in conn.execute("SELECT video_id FROM videos ORDER BY video_id")], dtype=np.int64)
+    weights = rng.pareto(POOL_TAIL, n_pools) + 1.0
+    region = rng.choice(n_pools, size=len(video_ids), p=weights / weights.sum())
+    sizes = np.bincount(region, minlength=n_pools)
+    for i in range(n_pools):
+        pool_id = create_pool(
+            conn, f"region_{i + 1:04d}", max(1.0, float(sizes[i]) * POOL_BUDGET_PER_VIDEO),
+            lam_fair=float(rng.uniform(0.4, 0.8)), lam_eff=float(rng.uniform(0.2, 0.6)), pool_alpha=float(rng.uniform(0.5, 0.9)),
+        )
+        members = video_ids[region == i].tolist()
+        for start in range(0, len(members), INSERT_BATCH):
+            add_members(conn, pool_id, members[start:start + INSERT_BATCH])
+    conn.commit()
+    return {"pools": n_pools, "largest_pool": int(sizes.max()), "seconds": time.perf_counter() - t0}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Fill a scratch database with synthetic creators and videos")
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--videos", type=int, default=100_000)
+    parser.add_argument("--creators", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pools", type=int, default=0, help="also split the videos into this many regional ad pools")
+    parser.add_argument("--force", action="store_true", help="allow --db to be the app's database")
+    args = parser.parse_args()
+    try:
+        check_scratch_db(args.db, args.force)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with ConnectionPool(args.db).connection() as conn:
+        summary = generate(conn, args.videos, args.creators, args.seed)
+        print(f"Generated {summary['videos']} videos / {summary['creators']} creators in {summary['seconds']:.1f}s")
+        if args.pools:
+            pools = generate_pools(conn, args.pools, args.seed)
+            print(f"Generated {pools['pools']} ad pools (largest {pools['largest_pool']} videos) in {pools['seconds']:.1f}s")
@@ -0,0 +1,315 @@
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_DB = BENCH_DIR / "scratch.db"
+RESULTS_DIR = BENCH_DIR / "results"
+
+DEFAULT_SCALES = (10_000, 100_000)
+SOLVER_REPEATS = 5
+ROUTE_REQUESTS = 200
+SINGLE_VIDEO_SAMPLES = 50
+# A full Gurobi model above this many videos takes minutes (and needs a full licence)
+GUROBI_MAX_VIDEOS = 20_000
+# Regional ad pools the videos are split into for the multi-pool benchmarks
+DEFAULT_POOLS = 64
+# What-if benchmark: a 10 x 10 grid over the fairness weight and the concentration exponent
+SWEEP_GRID = {"lambda_fair": np.linspace(0.2, 0.9, 10).tolist(), "alpha": np.linspace(0.4, 0.9, 10).tolist()}
+# Compare mode flags p50 changes beyond this ratio
+REGRESSION_RATIO = 1.10
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silence the solvers' reports, including Gurobi's log, which is written to fd 1 directly.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        os.dup2(devnull.fileno(), 1)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+def measure(name, kind, n_videos, call, runs, warmup=1, **extra):
+    """
+    Time call(i) for i in range(runs) after `warmup` untimed calls. call returns the number of
+    rows it handled. One extra traced call gives the peak Python/numpy allocation; peak_rss_mb is
+    the process high-water mark so far, so it only ever grows within a run.
+    """
+    for i in range(warmup):
+        call(i)
+    times, rows = [], 0
+    for i in range(runs):
+        t0 = time.perf_counter()
+        rows += call(i) or 0
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        call(runs)
+        _, peak_alloc = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ms = np.array(times) * 1000
+    result = {
+        "name": name,
+        "kind": kind,
+        "n_videos": n_videos,
+        "runs": runs,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "rows_per_s": rows / sum(times) if sum(times) > 0 else None,
+        "peak_alloc_mb": peak_alloc / (1024 * 1024),
+        "peak_rss_mb": peak_rss_mb(),
+    } | extra
+    print(f"  {name:<28} p50 {result['p50_ms']:>10.2f} ms   p99 {result['p99_ms']:>10.2f} ms   "
+          f"{result['rows_per_s'] or 0:>12,.0f} rows/s   alloc {result['peak_alloc_mb']:>8.1f} MB")
+    return result
+
+
+def bench_solvers(pool, n_videos, repeats, gurobi_max, rng):
+    import adrev_opti
+    import adrev_pools
+    import donate_opti
+    import whatif
+
+    results = []
+    with pool.connection() as conn:
+        def allocation(engine, persist, engines_used):
+            def call(_):
+                with quiet():
+                    alloc = adrev_opti.get_optimised_values(conn, engine=engine, persist=persist)
+                engines_used.add(alloc.engine)
+                return len(alloc.video_ids)
+            return call
+
+        for engine, persist in (("numpy", False), ("numpy", True), ("gurobi", False)):
+            name = f"adrev.{engine}" + (".persist" if persist else "")
+            if engine == "gurobi" and n_videos > gurobi_max:
+                results.append({"name": name, "kind": "solver", "n_videos": n_videos,
+                                "skipped": f"more than {gurobi_max} videos"})
+                print(f"  {name:<28} skipped (more than {gurobi_max} videos)")
+                continue
+            engines_used = set()
+            call = allocation(engine, persist, engines_used)
+            # Without gurobipy or a usable licence the gurobi engine falls back to numpy, which is
+            # timed on its own row already
+            call(0)
+            if engine not in engines_used:
+                results.append({"name": name, "kind": "solver", "n_videos": n_videos,
+                                "skipped": f"{engine} unavailable, fell back to {'+'.join(sorted(engines_used))}"})
+                print(f"  {name:<28} skipped ({engine} unavailable)")
+                continue
+            r = measure(name, "solver", n_videos, call, repeats)
+            r["engine"] = "+".join(sorted(engines_used))
+            results.append(r)
+
+        # Same pools solved on one process and spread over every core
+        for name, workers, persist in (("adrev.pools.serial", 1, False), ("adrev.pools.parallel", None, False),
+                                       ("adrev.pools.parallel.persist", None, True)):
+            def pools(_, workers=workers, persist=persist):
+                with quiet():
+                    return sum(len(r.video_ids) for r in adrev_pools.solve_pools(conn, max_workers=workers, persist=persist).values())
+            results.append(measure(name, "solver", n_videos, pools, repeats, workers=workers or adrev_pools.POOL_WORKERS))
+
+        # rows are point x video solves
+        def sweep(_):
+            with quiet():
+                report = whatif.run_sweep(conn, SWEEP_GRID)
+            return report["points"] * report["videos"]
+        results.append(measure("whatif.sweep100", "solver", n_videos, sweep, repeats, workers=whatif.SWEEP_WORKERS))
+
+        allocator = adrev_opti.IncrementalAllocator(drift_tol=float("inf"))
+        with quiet():
+            allocator.full_solve(conn)
+        ids = rng.integers(1, n_videos + 1, SINGLE_VIDEO_SAMPLES * 2 + 2)
+
+        def incremental(i):
+            with quiet():
+                allocator.update(conn, int(ids[i]))
+            return 1
+        results.append(measure("adrev.incremental", "solver", n_videos, incremental, SINGLE_VIDEO_SAMPLES))
+
+        def coin_batch(_):
+            with quiet():
+                return donate_opti.get_coin_splits(conn)
+        results.append(measure("coin.batch", "solver", n_videos, coin_batch, repeats))
+
+        def coin_single(i):
+            with quiet():
+                donate_opti.get_coin_split(conn, int(ids[i]), persist=False)
+            return 1
+        engine = "gurobi" if donate_opti.gp.available else "batch-fallback"
+        results.append(measure("coin.single", "solver", n_videos, coin_single, SINGLE_VIDEO_SAMPLES, engine=engine))
+        # Same videos again: answered by the memo without solving
+        results.append(measure("coin.single.memo", "solver", n_videos, coin_single, SINGLE_VIDEO_SAMPLES, engine=engine))
+    return results
+
+
+def route_urls(n_videos, n_creators, top_creators, rng):
+    """
+    name -> function(i) building the i-th request URL. Thumbnail routes are left out: the
+    synthetic videos have no media files.
+    """
+    def video_id():
+        return int(rng.integers(1, n_videos + 1))
+
+    def creator_id():
+        return int(rng.integers(1, n_creators + 1))
+
+    return {
+        "/get-video-data": lambda i: f"/get-video-data?video_id={video_id()}",
+        # Repeat views of the same few videos: served from the rendered-body cache
+        "/get-video-data.repeat": lambda i: f"/get-video-data?video_id={1 + i % 10}",
+        "/get-videos-data": lambda i: "/get-videos-data?ids=" + ",".join(str(video_id()) for _ in range(100)),
+        "/get-all-videos-data": lambda i: f"/get-all-videos-data?creator_id={top_creators[i % len(top_creators)]}",
+        "/get-all-videos-data.fields": lambda i: (
+            f"/get-all-videos-data?creator_id={top_creators[i % len(top_creators)]}&fields=title,views,proj_earnings"
+        ),
+        "/list-creators": lambda i: f"/list-creators?after={creator_id() - 1}",
+        "/get-creator-data": lambda i: f"/get-creator-data?creator_id={creator_id()}",
+        "/get-creator-by-name": lambda i: f"/get-creator-by-name?name=creator_{creator_id():07d}",
+        "/top-videos.quality": lambda i: "/top-videos?by=quality&limit=100",
+        "/top-videos.weighted": lambda i: "/top-videos?by=weighted&limit=100",
+        # Typeahead: a prefix shared by about 100 names / titles
+        "/search.creators": lambda i: f"/search?type=creators&q=creator_{creator_id() // 100:05d}",
+        "/search.videos": lambda i: f"/search?type=videos&q=video%20{video_id() // 100}",
+    }
+
+
+def bench_routes(app_module, n_videos, n_creators, requests, rng):
+    client = app_module.app.test_client()
+    with app_module.pool.connection() as conn:
+        top_creators = [r[0] for r in conn.execute(
+            "SELECT creator_id FROM videos GROUP BY creator_id ORDER BY count(*) DESC LIMIT 10"
+        ).fetchall()]
+
+    results = []
+    for name, url in route_urls(n_videos, n_creators, top_creators, rng).items():
+        errors = []
+
+        def call(i, url=url, errors=errors):
+            resp = client.get(url(i))
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+                return 0
+            body = resp.get_json()
+            return len(body) if isinstance(body, list) else 1
+        r = measure(name, "route", n_videos, call, requests, warmup=3)
+        r["errors"] = len(errors)
+        results.append(r)
+    return results
+
+
+def environment():
+    import donate_opti
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "gurobipy": donate_opti.gp.available,
+    }
+
+
+def run(scales=DEFAULT_SCALES, db_path=DEFAULT_DB, out=None, repeats=SOLVER_REPEATS, requests=ROUTE_REQUESTS,
+        gurobi_max=GUROBI_MAX_VIDEOS, seed=0, pools=DEFAULT_POOLS, force=False):
+    """
+    Generate each scale into the scratch database, time the solvers and the routes on it and
+    write everything to one JSON file. Returns the path of that file. Refuses (ValueError) to
+    overwrite the app's database unless force is set.
+    """
+    from bench.datagen import check_scratch_db, generate, generate_pools
+
+    db_path = check_scratch_db(db_path, force)
+    # The app binds its database at import time, so this has to come first
+    os.environ["APP_DB_PATH"] = str(db_path)
+    os.environ["APP_STARTUP"] = "0"  # the generated data replaces the seeds; nothing to start
+    os.environ.setdefault("LOG_LEVEL", "WARNING")  # the solvers log every run at INFO
+    import app as app_module
+
+    report = {"environment": environment(), "datasets": [], "results": []}
+    rng = np.random.default_rng(seed)
+    for n_videos in scales:
+        print(f"\n== {n_videos:,} videos ==")
+        with app_module.pool.connection() as conn:
+            dataset = generate(conn, n_videos, seed=seed)
+            dataset["pools"] = generate_pools(conn, pools, seed=seed)
+        print(f"  generated {dataset['creators']:,} creators and {pools} ad pools in {dataset['seconds']:.1f}s")
+        report["datasets"].append(dataset)
+        report["results"] += bench_solvers(app_module.pool, n_videos, repeats, gurobi_max, rng)
+        report["results"] += bench_routes(app_module, n_videos, dataset["creators"], requests, rng)
+
+    if out is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = RESULTS_DIR / f"{stamp}.json"
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=1))
+    print(f"\nResults written to {out}")
+    return out
+
+
+def compare(old_path, new_path, threshold=REGRESSION_RATIO):
+    """
+    Print the p50 of every benchmark present in both files and the new/old ratio.
+    Returns the number of benchmarks that got slower than threshold.
+    """
+    def index(path):
+        report = json.loads(Path(path).read_text())
+        return {(r["name"], r["n_videos"]): r for r in report["results"] if "p50_ms" in r}
+
+    old, new = index(old_path), index(new_path)
+    slower = 0
+    print(f"{'benchmark':<30} {'videos':>10} {'old p50 ms':>12} {'new p50 ms':>12} {'ratio':>8}")
+    for key in sorted(old.keys() & new.keys(), key=lambda k: (k[1], k[0])):
+        ratio = new[key]["p50_ms"] / old[key]["p50_ms"] if old[key]["p50_ms"] > 0 else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  slower"
+            slower += 1
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        print(f"{key[0]:<30} {key[1]:>10,} {old[key]['p50_ms']:>12.2f} {new[key]['p50_ms']:>12.2f} {ratio:>8.2f}{flag}")
+    return slower
@@ -0,0 +1,100 @@
+"""
+Start-up report: where a worker's import time goes, and what cold start and RSS cost in
+read-write and read-only mode. Every measurement runs in a fresh interpreter.
+
+    cd backend
+    python -m bench.startup                   # against bench/scratch.db
+    python -m bench.startup --db app.db --top 30
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from bench.runner import DEFAULT_DB
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Runs in the child: import the app, bring it up, report timings, RSS and which engines got loaded
+CHILD = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.start()
+t2 = time.perf_counter()
+from engines import engine_status
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "import_s": t1 - t0,
+    "init_s": t2 - t1,
+    "peak_rss_mb": peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024,
+    "engines_loaded": sorted(k for k, v in engine_status().items() if v["loaded"]),
+}))
+"""
+
+
+def _env(db_path, read_only):
+    # Imported without starting, so import and start-up are timed separately
+    env = dict(os.environ, APP_DB_PATH=str(db_path), APP_READ_ONLY="1" if read_only else "0", APP_STARTUP="0")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    return env
+
+
+def import_profile(db_path, read_only=False):
+    """
+    `python -X importtime -c "import app"`, summed by top-level package.
+    Returns [(package, self seconds)] sorted by time, largest first.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BACKEND_DIR, env=_env(db_path, read_only), capture_output=True, text=True, check=True,
+    )
+    totals = defaultdict(float)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return sorted(totals.items(), key=lambda kv: -kv[1])
+
+
+def cold_start(db_path, read_only=False):
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=BACKEND_DIR, env=_env(db_path, read_only), capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def report(db_path=DEFAULT_DB, top=20):
+    db_path = Path(db_path).resolve()
+    runs = {}
+    # The first read-write start applies whatever the database is missing; the second one is a
+    # plain restart, and the read-only replica needs the schema they leave behind
+    for label, read_only in (("read-write (first)", False), ("read-write (restart)", False), ("read-only", True)):
+        runs[label] = cold_start(db_path, read_only)
+
+    print(f"{'mode':<22} {'import s':>9} {'init s':>9} {'peak RSS MB':>12}  engines loaded")
+    for label, r in runs.items():
+        print(f"{label:<22} {r['import_s']:>9.3f} {r['init_s']:>9.3f} {r['peak_rss_mb']:>12.1f}  "
+              f"{', '.join(r['engines_loaded']) or '-'}")
+
+    profile = import_profile(db_path, read_only=True)
+    total = sum(t for _, t in profile)
+    print(f"\nImport time by top-level package ({total:.3f}s in total)")
+    for name, seconds in profile[:top]:
+        print(f"  {name:<28} {seconds * 1000:>9.1f} ms  {seconds / total:>6.1%}")
+    return {"runs": runs, "imports": profile}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m bench.startup", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="database to start against (migrated if needed)")
+    parser.add_argument("--top", type=int, default=20, help="packages listed in the import profile")
+    args = parser.parse_args()
+    report(args.db, args.top)
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+
+from adrev_opti import init_allocation_table
+from adrev_pools import init_pool_tables
+from creator_stats import init_creator_stats
+from donate_opti import init_coin_cache_table
+from earnings import init_earnings_tables
+from search import init_search
+from thumbnails import file_sha256
+
+log = logging.getLogger(__name__)
+
+# table -> (seed file in tables_init, id column). Seed keys that aren't columns of the table are ignored
+SEED_TABLES = {
+    "videos": ("videos_init.json", "video_id"),
+    "creators": ("creators_init.json", "creator_id"),
+}
+
+
+# ---- Manifest ----
+# meta is a key/value table recording what has been applied to this database: the schema version,
+# the sha256 of each seed file (and the rows it owns) and a (sha256, size, mtime) entry per seed media file
+
+def init_meta_table(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);")
+    conn.commit()
+
+
+def get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row[0]
+
+
+def set_meta(conn, key, value):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, str(value)),
+    )
+
+
+# ---- Schema migrations ----
+# Applied in order, each at most once per database (meta.schema_version is the number applied).
+# Never drop anything: add tables and columns. Every step also tolerates a database that already
+# has its changes, since databases built before the manifest existed start at version 0.
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table});")}
+
+
+def _add_column(conn, table, ddl):
+    if ddl.split()[0] not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {ddl};")
+
+
+def _base_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            creator_id       INTEGER NOT NULL DEFAULT 0,
+            title      TEXT NOT NULL,
+            views      INTEGER NOT NULL DEFAULT 0,
+            likes      INTEGER NOT NULL DEFAULT 0,
+            comments   INTEGER NOT NULL DEFAULT 0,
+            shares     INTEGER NOT NULL DEFAULT 0,
+
+            watch_completion FLOAT NOT NULL DEFAULT 0.5,
+            engagement_rate FLOAT NOT NULL DEFAULT 0.5,
+            engagement_diversity FLOAT NOT NULL DEFAULT 0.5,
+            rewatch FLOAT NOT NULL DEFAULT 0.5,
+            nlp_quality FLOAT NOT NULL DEFAULT 0.5,
+            compliance INTEGER NOT NULL DEFAULT 0,
+
+            rev_prop FLOAT NOT NULL DEFAULT 0,
+            proj_earnings FLOAT NOT NULL DEFAULT 0,
+            quality_score FLOAT NOT NULL DEFAULT 0,
+
+            norm_coins INTEGER NOT NULL DEFAULT 0,
+            prem_coins INTEGER NOT NULL DEFAULT 0,
+            x_n FLOAT NOT NULL DEFAULT 0,
+            x_p FLOAT NOT NULL DEFAULT 0,
+
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS creators (
+            creator_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name       TEXT    NOT NULL,
+            following  INTEGER NOT NULL DEFAULT 0,
+            followers  INTEGER NOT NULL DEFAULT 0,
+            likes      INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+
+
+def _allocation_versions(conn):
+    # bumped by every writer of the row; allocation_versions.version it was priced in
+    _add_column(conn, "videos", "row_version INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "videos", "allocation_version INTEGER NOT NULL DEFAULT 0")
+    init_allocation_table(conn)
+
+
+def _ad_pools(conn):
+    # Pool solves are versioned in allocation_versions too; pool_id is NULL for the global pool
+    _add_column(conn, "allocation_versions", "pool_id INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_allocation_versions_pool ON allocation_versions(pool_id, version);")
+    init_pool_tables(conn)
+
+
+def _coin_split_cache(conn):
+    init_coin_cache_table(conn)
+
+
+def _creator_stats(conn):
+    # Triggers on videos keep it current from here on; filled from the existing rows
+    init_creator_stats(conn)
+
+
+def _earnings_history(conn):
+    init_earnings_tables(conn)
+
+
+def _search_index(conn):
+    init_search(conn)
+
+
+MIGRATIONS = (
+    _base_tables,
+    _allocation_versions,
+    _ad_pools,
+    _coin_split_cache,
+    _creator_stats,
+    _earnings_history,
+    _search_index,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn):
+    """
+    Bring the schema up to SCHEMA_VERSION. Returns the versions applied (empty when current).
+    """
+    init_meta_table(conn)
+    current = int(get_meta(conn, "schema_version", 0))
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema v{current} is newer than this code (v{SCHEMA_VERSION})")
+    applied = []
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[version - 1](conn)
+        set_meta(conn, "schema_version", version)
+        conn.commit()
+        applied.append(version)
+        log.info("schema migrated", extra={"version": version, "step": MIGRATIONS[version - 1].__name__})
+    return applied
+
+
+def check_schema(conn):
+    """
+    For read-only processes, which can't migrate: fail unless the schema is at SCHEMA_VERSION.
+    """
+    try:
+        current = int(get_meta(conn, "schema_version", 0))
+    except sqlite3.OperationalError:  # no meta table yet
+        current = 0
+    if current != SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema is v{current}, this code needs v{SCHEMA_VERSION}; "
+                           "start a read-write process first to migrate it")
+    return current
+
+
+def create_indexes(conn):
+    # Built after bulk loads, which is much cheaper than maintaining them row by row
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_creator ON videos(creator_id);")
+    # Ranking by quality (and by quality-weighted views) are index scans
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_quality ON videos(quality_score DESC);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_weighted_quality ON videos((views * quality_score) DESC);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_creators_name ON creators(name);")
+    # Search reads the most followed / viewed rows first when a short prefix matches most of the catalogue
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_creators_followers ON creators(followers DESC);")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_views ON videos(views DESC);")
+    conn.commit()
+
+
+def reset_tables(conn):
+    """
+    Empty the videos, creators, creator stats, earnings history, ad pool, coin-split memo and search
+    tables (as a fresh database would have them, without secondary indexes). For scratch databases
+    only: start-up never calls this.
+    """
+    for table in ("videos", "creators", "creator_stats", "earnings_samples", "earnings_daily", "earnings_weekly",
+                  "ad_pool_members", "ad_pools", "coin_split_cache", "creator_search", "video_search",
+                  "creator_names_trigram"):
+        conn.execute(f"DROP TABLE IF EXISTS {table};")
+    init_meta_table(conn)
+    conn.execute("DELETE FROM meta;")
+    conn.commit()
+    migrate(conn)
+
+
+# ---- Seed data and media ----
+
+def _row_sha1(row):
+    return hashlib.sha1(json.dumps(row, sort_keys=True).encode()).hexdigest()
+
+
+def sync_seeds(conn, seed_dir):
+    """
+    Apply each seed file whose sha256 differs from the one recorded in meta. Seed row i goes in as
+    id i + 1 (its media file is named by that id) with ON CONFLICT DO NOTHING, so a row that isn't
+    the seed's (an upload that took the id) is never touched. The ids the seed inserted and a sha1
+    per row are kept in meta (`seed_rows:<file>`); a changed file updates only those seed-owned
+    rows whose seed row changed. Returns the tables that were (re)seeded.
+    """
+    seeded = []
+    for table, (filename, id_column) in SEED_TABLES.items():
+        path = Path(seed_dir) / filename
+        if not path.exists():
+            continue
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        recorded = get_meta(conn, f"seed:{filename}")
+        owned = json.loads(get_meta(conn, f"seed_rows:{filename}", "null"))
+        if recorded == digest and owned is not None:
+            continue
+        rows = json.loads(raw)
+        if recorded == digest:
+            # Applied before seed ownership was recorded: the rows at ids 1..n are the ones it wrote
+            present = {r[0] for r in conn.execute(f"SELECT {id_column} FROM {table} WHERE {id_column} <= ?", (len(rows),))}
+            owned = {str(i): _row_sha1(row) for i, row in enumerate(rows, start=1) if i in present}
+            set_meta(conn, f"seed_rows:{filename}", json.dumps(owned))
+            conn.commit()
+            continue
+        owned = owned or {}
+        known = _columns(conn, table) - {id_column}
+        inserted = updated = skipped = 0
+        for i, row in enumerate(rows, start=1):
+            cols = [c for c in row if c in known]
+            row_sha1 = _row_sha1(row)
+            cur = conn.execute(
+                f"INSERT INTO {table} ({id_column}, {', '.join(cols)}) VALUES (?, {', '.join('?' for _ in cols)}) "
+                f"ON CONFLICT({id_column}) DO NOTHING",
+                (i, *(row[c] for c in cols)),
+            )
+            if cur.rowcount:
+                inserted += 1
+            elif str(i) not in owned:
+                # Someone else's row: leave it, and the seed row out
+                skipped += 1
+                continue
+            elif owned[str(i)] != row_sha1:
+                updates = ", ".join(f"{c} = ?" for c in cols)
+                if table == "videos":
+                    updates += ", row_version = row_version + 1"
+                conn.execute(f"UPDATE {table} SET {updates} WHERE {id_column} = ?", (*(row[c] for c in cols), i))
+                updated += 1
+            owned[str(i)] = row_sha1
+        set_meta(conn, f"seed_rows:{filename}", json.dumps(owned))
+        set_meta(conn, f"seed:{filename}", digest)
+        conn.commit()
+        seeded.append(table)
+        log.info("seed applied", extra={"table": table, "rows": len(rows), "inserted": inserted,
+                                        "updated": updated, "skipped": skipped})
+        if skipped:
+            log.warning("seed rows skipped: their ids belong to other rows", extra={"table": table, "rows": skipped})
+    return seeded
+
+
+def sync_media(conn, src_dir, dest_dir):
+    """
+    Copy seed media into dest_dir, skipping files whose content is already there. A source
+    whose size and mtime match its meta entry is skipped without reading it. Files in dest_dir
+    that aren't seed media (uploads) are left alone. Returns the names copied.
+    """
+    src_dir, dest_dir = Path(src_dir), Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    if not src_dir.exists():
+        return []
+    copied = []
+    for src in sorted(p for p in src_dir.iterdir() if p.is_file()):
+        dest = dest_dir / src.name
+        key = f"media:{src.name}"
+        st = src.stat()
+        entry = json.loads(get_meta(conn, key, "{}"))
+        if dest.exists() and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            continue
+        digest = file_sha256(src)
+        if not (dest.exists() and entry.get("sha256") == digest and file_sha256(dest) == digest):
+            tmp = dest.with_name(f".{dest.name}")
+            shutil.copy2(src, tmp)
+            os.replace(tmp, dest)
+            copied.append(src.name)
+        set_meta(conn, key, json.dumps({"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}))
+        conn.commit()
+    if copied:
+        log.info("seed media copied", extra={"files": copied})
+    return copied
+
+
+# ---- Derived data ----
+
+def data_fingerprint(conn):
+    """
+    Changes whenever a video row is added or written (every writer bumps row_version) and with
+    every persisted allocation. Recorded after the start-up solve; equal at the next start-up
+    means the stored payouts and coin splits are still those of the current data.
+    """
+    count, versions, last_id = conn.execute(
+        "SELECT count(*), total(row_version), coalesce(max(video_id), 0) FROM videos"
+    ).fetchone()
+    allocation = conn.execute("SELECT coalesce(max(version), 0) FROM allocation_versions").fetchone()[0]
+    return f"{count}:{int(versions)}:{last_id}:{allocation}"
@@ -0,0 +1,191 @@
+import logging
+import sqlite3
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Per-creator totals over their videos, kept current by triggers on `videos` so every writer
+# (uploads, imports, engagement, the optimisers' write-backs) maintains them without knowing about
+# them. A creator's dashboard is then one primary-key lookup however many videos they have.
+
+# creator_stats column -> its contribution from one videos row (r is "new", "old" or a table alias)
+STATS = {
+    "videos": "1",
+    "views": "{r}.views",
+    "proj_earnings": "{r}.proj_earnings",
+    "quality_total": "{r}.quality_score",
+    "norm_coins": "{r}.norm_coins",
+    "prem_coins": "{r}.prem_coins",
+    # coins passed on to the creator by the coin split
+    "coins_paid": "{r}.x_n * {r}.norm_coins + {r}.x_p * {r}.prem_coins",
+}
+# Integer totals are compared exactly by check_creator_stats, the others up to rounding
+INTEGER_STATS = ("videos", "views", "norm_coins", "prem_coins")
+# videos columns the totals depend on; updates that touch none of them don't fire a trigger
+WATCHED = ("creator_id", "views", "proj_earnings", "quality_score", "norm_coins", "prem_coins", "x_n", "x_p")
+TRIGGERS = ("creator_stats_insert", "creator_stats_delete", "creator_stats_update", "creator_stats_move")
+# Relative tolerance of the float totals (they drift by rounding as deltas are added)
+TOLERANCE = 1e-6
+
+
+def _terms(r):
+    return [expr.format(r=r) for expr in STATS.values()]
+
+
+def init_creator_stats(conn):
+    """
+    Create creator_stats and its triggers, then fill it from the current videos.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS creator_stats (
+            creator_id    INTEGER PRIMARY KEY,
+            videos        INTEGER NOT NULL DEFAULT 0,
+            views         INTEGER NOT NULL DEFAULT 0,
+            proj_earnings FLOAT   NOT NULL DEFAULT 0,
+            quality_total FLOAT   NOT NULL DEFAULT 0,
+            norm_coins    INTEGER NOT NULL DEFAULT 0,
+            prem_coins    INTEGER NOT NULL DEFAULT 0,
+            coins_paid    FLOAT   NOT NULL DEFAULT 0
+        );
+    """)
+    cols = ", ".join(STATS)
+    upsert_new = (
+        f"INSERT INTO creator_stats (creator_id, {cols}) VALUES (new.creator_id, {', '.join(_terms('new'))}) "
+        f"ON CONFLICT(creator_id) DO UPDATE SET videos = videos + 1, "
+        + ", ".join(f"{c} = {c} + {t}" for c, t in zip(STATS, _terms("new")) if c != "videos") + ";"
+    )
+    subtract_old = (
+        "UPDATE creator_stats SET videos = videos - 1, "
+        + ", ".join(f"{c} = {c} - ({t})" for c, t in zip(STATS, _terms("old")) if c != "videos")
+        + " WHERE creator_id = old.creator_id;"
+    )
+    delta = ", ".join(
+        f"{c} = {c} + ({new}) - ({old})"
+        for c, new, old in zip(STATS, _terms("new"), _terms("old")) if c != "videos"
+    )
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS creator_stats_insert AFTER INSERT ON videos BEGIN {upsert_new} END;")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS creator_stats_delete AFTER DELETE ON videos BEGIN {subtract_old} END;")
+    # Same creator (every optimiser and engagement write): one update by primary key
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS creator_stats_update AFTER UPDATE OF {', '.join(WATCHED)} ON videos "
+        f"WHEN old.creator_id = new.creator_id "
+        f"BEGIN UPDATE creator_stats SET {delta} WHERE creator_id = new.creator_id; END;"
+    )
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS creator_stats_move AFTER UPDATE OF {', '.join(WATCHED)} ON videos "
+        f"WHEN old.creator_id IS NOT new.creator_id "
+        f"BEGIN {subtract_old} {upsert_new} END;"
+    )
+    rebuild_creator_stats(conn)
+
+
+def _aggregate_sql():
+    sums = ", ".join(
+        f"{'sum' if c in INTEGER_STATS else 'total'}({t})" for c, t in zip(STATS, _terms("v"))
+    )
+    # A table scan + temp b-tree is about twice as fast as walking idx_videos_creator
+    return f"SELECT v.creator_id, {sums} FROM videos v NOT INDEXED GROUP BY v.creator_id"
+
+
+def _refill(conn):
+    conn.execute("DELETE FROM creator_stats;")
+    return conn.execute(f"INSERT INTO creator_stats (creator_id, {', '.join(STATS)}) {_aggregate_sql()};").rowcount
+
+
+def rebuild_creator_stats(conn):
+    """
+    Recompute every creator's totals from videos in one transaction. Returns the creators written.
+    """
+    creators = _refill(conn)
+    conn.commit()
+    log.info("creator stats rebuilt", extra={"creators": creators})
+    return creators
+
+
+@contextmanager
+def deferred_stats(conn):
+    """
+    For writers that rewrite (nearly) every video row: the triggers are dropped inside the caller's
+    transaction and creator_stats recomputed once at the end of the block, instead of one trigger
+    update per row (about 10x cheaper at 1M rows). The caller commits; a rollback brings the
+    triggers back with it. Without the triggers (a bulk import in progress) this does nothing.
+    """
+    found = conn.execute(
+        f"SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join('?' for _ in TRIGGERS)})",
+        TRIGGERS,
+    ).fetchall()
+    if not found:
+        yield
+        return
+    if not conn.in_transaction:
+        conn.execute("BEGIN;")
+    for name in TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name};")
+    yield
+    _refill(conn)
+    for (sql,) in found:
+        conn.execute(sql)
+
+
+def check_creator_stats(conn):
+    """
+    Compare creator_stats with totals recomputed from videos. Returns a list of
+    (creator_id, column, stored, expected) for every difference; empty when consistent.
+    """
+    stored = {row[0]: row[1:] for row in conn.execute(f"SELECT creator_id, {', '.join(STATS)} FROM creator_stats")}
+    mismatches = []
+    for row in conn.execute(_aggregate_sql()):
+        creator_id, expected = row[0], row[1:]
+        have = stored.pop(creator_id, None)
+        for i, (column, want) in enumerate(zip(STATS, expected)):
+            got = None if have is None else have[i]
+            if got is None or (got != want if column in INTEGER_STATS
+                               else abs(got - want) > TOLERANCE * max(1.0, abs(want))):
+                mismatches.append((creator_id, column, got, want))
+    # Rows left are creators without videos, which must be all zeros
+    for creator_id, have in stored.items():
+        mismatches.extend((creator_id, column, got, 0) for column, got in zip(STATS, have) if got)
+    return mismatches
+
+
+def get_creator_stats(conn, creator_id):
+    """
+    The creator's totals (zeros for a creator without videos), or None if there's no such creator.
+    """
+    row = conn.execute(
+        f"SELECT {', '.join(STATS)} FROM creator_stats WHERE creator_id = ?", (creator_id,)
+    ).fetchone()
+    if row is None:
+        if conn.execute("SELECT 1 FROM creators WHERE creator_id = ?", (creator_id,)).fetchone() is None:
+            return None
+        row = (0,) * len(STATS)
+    stats = {"creator_id": creator_id, **dict(zip(STATS, row))}
+    quality_total = stats.pop("quality_total")
+    stats["mean_quality"] = quality_total / stats["videos"] if stats["videos"] else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check creator_stats against videos, or rebuild it")
+    parser.add_argument("command", choices=("check", "rebuild"))
+    parser.add_argument("--db", default="app.db")
+    args = parser.parse_args()
+
+    from metrics import configure_logging
+    configure_logging()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == "rebuild":
+        print(f"creator_stats rebuilt: {rebuild_creator_stats(conn):,} creators")
+    else:
+        mismatches = check_creator_stats(conn)
+        for creator_id, column, got, want in mismatches[:50]:
+            print(f"creator {creator_id}: {column} is {got}, videos say {want}")
+        if len(mismatches) > 50:
+            print(f"... and {len(mismatches) - 50:,} more")
+        print(f"{len(mismatches):,} mismatches" + ("; run `python creator_stats.py rebuild`" if mismatches else ""))
+        conn.close()
+        raise SystemExit(1 if mismatches else 0)
+    conn.close()
@@ -0,0 +1,180 @@
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+
+import numpy as np
+
+from metrics import timed
+
+# Connections kept idle per pool (read-write and read-only are pooled separately)
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+# Prepared statements cached per connection by the sqlite3 module
+CACHED_STATEMENTS = 256
+# Rows per fetchmany() / executemany() batch when a whole table is streamed through numpy
+CHUNK_ROWS = int(os.environ.get("DB_CHUNK_ROWS", "65536"))
+# Max number of ids per "IN (...)" query (SQLite's default variable limit is 999)
+SQL_IN_CHUNK = 900
+
+PRAGMAS = (
+    "PRAGMA synchronous = NORMAL;",    # safe with WAL, far fewer fsyncs
+    "PRAGMA mmap_size = 268435456;",   # 256 MiB of the file memory-mapped
+    "PRAGMA cache_size = -65536;",     # 64 MiB page cache per connection
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA busy_timeout = 5000;",
+)
+
+
+def _statement_kind(sql):
+    word = sql.lstrip().split(None, 1)[:1]
+    kind = word[0].lower() if word else ""
+    return kind if kind in ("select", "insert", "update", "delete", "with", "pragma") else "other"
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        with timed("db_query_duration_seconds", span="db", op=_statement_kind(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with timed("db_query_duration_seconds", span="db", op=_statement_kind(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Every statement is timed into db_query_duration_seconds (and the request's Server-Timing).
+    For SELECTs this covers preparing the statement and producing the first row.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        with timed("db_query_duration_seconds", span="db", op=_statement_kind(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        with timed("db_query_duration_seconds", span="db", op=_statement_kind(sql)):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """
+    SQLite connection pool shared by the Flask app, the job/upload stores and the optimisers.
+
+    The database runs in WAL mode, so readers keep going while the optimiser rewrites the
+    allocation. GET routes get read-only connections (query_only), everything else gets a
+    read-write one. Connections are reused across requests, so per-request connect cost and
+    statement preparation (cached per connection) go away.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = str(db_path)
+        self._idle = {False: queue.LifoQueue(maxsize=size), True: queue.LifoQueue(maxsize=size)}
+        self._wal_checked = False
+
+    def _open(self, readonly):
+        if readonly:
+            conn = sqlite3.connect(
+                f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                cached_statements=CACHED_STATEMENTS, timeout=30, factory=TimedConnection,
+            )
+        else:
+            conn = sqlite3.connect(
+                self.db_path, check_same_thread=False, cached_statements=CACHED_STATEMENTS, timeout=30,
+                factory=TimedConnection,
+            )
+            if not self._wal_checked:
+                # journal_mode is stored in the file, so this only has to happen once
+                conn.execute("PRAGMA journal_mode = WAL;")
+                self._wal_checked = True
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only = ON;")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self, readonly=False):
+        if readonly and not self._wal_checked:
+            # Make sure the file exists and is in WAL mode before opening it read-only
+            self.release(self.acquire(readonly=False))
+        try:
+            return self._idle[readonly].get_nowait()
+        except queue.Empty:
+            return self._open(readonly)
+
+    def release(self, conn, readonly=None):
+        if readonly is None:
+            readonly = bool(conn.execute("PRAGMA query_only;").fetchone()[0])
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle[readonly].put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self, readonly=False):
+        conn = self.acquire(readonly)
+        try:
+            yield conn
+        finally:
+            self.release(conn, readonly)
+
+    def close_all(self):
+        for q in self._idle.values():
+            while True:
+                try:
+                    q.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+# ---- Streaming whole-table reads ----
+
+@contextmanager
+def snapshot(conn):
+    """
+    Run the block in one read transaction, so consecutive SELECTs (a count, then the rows) see
+    the same WAL snapshot. Inside an already open transaction this is a no-op.
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN;")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
+
+def fetch_chunks(conn, sql, params=(), chunk_rows=CHUNK_ROWS):
+    """
+    Stream a SELECT as float64 blocks of at most chunk_rows rows (one column per selected
+    expression), so only one chunk of Python row tuples exists at a time. Integer columns are
+    exact up to 2**53. Every selected value must be numeric and not NULL.
+    """
+    cur = conn.cursor()
+    cur.row_factory = None  # plain tuples, whatever the connection's row_factory
+    cur.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield np.array(rows, dtype=np.float64)
+
+
+def fetch_by_ids(conn, sql, ids, column="video_id"):
+    """
+    fetch_chunks for a list of ids: `sql` (without a WHERE clause) is run once per SQL_IN_CHUNK ids
+    with "WHERE column IN (...)" appended, one float64 block per chunk that found rows.
+    """
+    cur = conn.cursor()
+    cur.row_factory = None
+    for i in range(0, len(ids), SQL_IN_CHUNK):
+        chunk = ids[i:i + SQL_IN_CHUNK]
+        rows = cur.execute(f"{sql} WHERE {column} IN ({', '.join('?' for _ in chunk)})", chunk).fetchall()
+        if rows:
+            yield np.array(rows, dtype=np.float64)
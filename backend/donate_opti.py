@@ -1,34 +1,149 @@
-# pip install gurobipy  (requires a Gurobi license)
-import gurobipy as gp
-from gurobipy import GRB
+# pip install gurobipy  (optional: a Gurobi license for the single-video get_coin_split; falls back to the batch solver)
+import hashlib
+import json
+import logging
 import math
+import os
 import sqlite3
-import pandas as pd
+import time
+from contextlib import nullcontext
 
-phi_W, phi_E, phi_D, phi_R, phi_S = 0.35, 0.25, 0.15, 0.10, 0.15
+import numpy as np
 
-def get_quality_score(W: float, E: float, D: float, R: float, S: float, C: int = 1) -> float:
+from cache import LRUCache
+from creator_stats import deferred_stats
+from db import fetch_chunks, fetch_by_ids, SQL_IN_CHUNK
+from engines import gp, pd
+from metrics import timed, observe, inc
+from quality import QUALITY_INPUTS, quality_from_rows
+
+# gurobipy and pandas are imported on first use (engines.py); the batch solver is pure numpy
+
+# -----------------------------
+# Coin split parameters
+# -----------------------------
+theta   = 0.8
+eps     = 1e-6
+xn_max  = 0.75
+xp_max  = 0.95
+delta   = 0.05
+Delta   = 0.35
+rev_floor = 0.1  # TikTok will keep at least 10% of revenue of coins for any video
+
+lam_rev = 1.0   # weight on revenue
+lam_util= 6   # weight on creator utility
+lam_inc = 0.3   # weight on premium adoption incentive
+
+# Memo of solved splits. The optimum only depends on Q, the two coin counts and the constants above,
+# so results are keyed on Q quantised to Q_QUANTUM, (norm_coins, prem_coins) and a hash of the
+# constants and engine. Q is quantised before solving, so a hit returns exactly what solving would.
+Q_QUANTUM = 1e-4
+COIN_CACHE_SIZE = int(os.environ.get("COIN_CACHE_SIZE", "200000"))
+# Up to this many distinct keys per call go through the memo (LRU, then the coin_split_cache table).
+# Larger bulk re-splits only dedupe: one vectorised solve per distinct key is cheaper than the lookups
+COIN_CACHE_MAX_KEYS = 10_000
+
+log = logging.getLogger(__name__)
+
+# -----------------------------
+# Memo cache
+# -----------------------------
+
+def coin_params_hash(engine):
+    params = {
+        "theta": theta, "eps": eps, "xn_max": xn_max, "xp_max": xp_max, "delta": delta, "Delta": Delta,
+        "rev_floor": rev_floor, "lam_rev": lam_rev, "lam_util": lam_util, "lam_inc": lam_inc,
+        "q_quantum": Q_QUANTUM, "engine": engine,
+    }
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+def quantise_q(Q):
+    return np.rint(np.asarray(Q, dtype=np.float64) / Q_QUANTUM).astype(np.int64)
+
+def init_coin_cache_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS coin_split_cache (
+            params     TEXT    NOT NULL,
+            q_key      INTEGER NOT NULL,
+            norm_coins INTEGER NOT NULL,
+            prem_coins INTEGER NOT NULL,
+            x_n        FLOAT   NOT NULL,
+            x_p        FLOAT   NOT NULL,
+            ok         INTEGER NOT NULL,
+            PRIMARY KEY (params, q_key, norm_coins, prem_coins)
+        ) WITHOUT ROWID;
+    """)
+    conn.commit()
+
+def purge_coin_cache(conn):
     """
-    Geometric aggregation with fixed phi's, then compliance and clamp.
-    Q_v = C * min(1, W^phi_W * E^phi_E * D^phi_D * R^phi_R * S^phi_S).
-    Inputs W,E,D,R,S should already be in [0,1]; C in {0,1}.
+    Drop memo rows solved under other constants (they can never be hit again). Returns the count.
+    """
+    current = (coin_params_hash("gurobi"), coin_params_hash("numpy"))
+    cur = conn.execute("DELETE FROM coin_split_cache WHERE params NOT IN (?, ?);", current)
+    conn.commit()
+    return cur.rowcount
 
-    For detailed calculation of W,E,D,R and S, they require user specific interaction for each video, for which we will skip the calculation
-    The mathematical formula can be found in the pdf for calculation of quality score. The intention is that TikTok can calculate them
-    trivially as TikTok should easily have access to these data, (i.e. how a specific user interacts with this specific video)
+class CoinSplitCache:
+    """
+    Memo of (x_n, x_p, ok) by (params hash, q_key, norm_coins, prem_coins): an in-process LRU in
+    front of the coin_split_cache table, which survives restarts and is shared by every process.
     """
-    q = (W ** phi_W) \
-        * (E ** phi_E) \
-        * (D ** phi_D) \
-        * (R ** phi_R) \
-        * (S ** phi_S)
-    return C * min(1.0, q)
+
+    # Keys per row-value IN query: three variables each
+    TABLE_CHUNK = SQL_IN_CHUNK // 3
+
+    def __init__(self, maxsize=COIN_CACHE_SIZE):
+        self.lru = LRUCache(maxsize=maxsize)
+
+    def lookup(self, conn, params, keys):
+        """
+        keys: (q_key, norm_coins, prem_coins) tuples. Returns {key: (x_n, x_p, ok)} for the hits.
+        """
+        hits, missing = {}, []
+        for key in keys:
+            value = self.lru.get((params, *key))
+            if value is None:
+                missing.append(key)
+            else:
+                hits[key] = value
+        lru_hits = len(hits)
+        for i in range(0, len(missing), self.TABLE_CHUNK):
+            chunk = missing[i:i + self.TABLE_CHUNK]
+            rows = conn.execute(
+                "SELECT q_key, norm_coins, prem_coins, x_n, x_p, ok FROM coin_split_cache "
+                f"WHERE params = ? AND (q_key, norm_coins, prem_coins) IN (VALUES {', '.join('(?, ?, ?)' for _ in chunk)})",
+                (params, *(v for key in chunk for v in key)),
+            ).fetchall()
+            for r in rows:
+                key, value = (r[0], r[1], r[2]), (r[3], r[4], bool(r[5]))
+                hits[key] = value
+                self.lru.put((params, *key), value)
+        inc("coin_cache_lookups_total", lru_hits, result="lru")
+        inc("coin_cache_lookups_total", len(hits) - lru_hits, result="table")
+        inc("coin_cache_lookups_total", len(keys) - len(hits), result="miss")
+        return hits
+
+    def store(self, conn, params, entries):
+        """
+        entries: {key: (x_n, x_p, ok)}. Written to the LRU and the table (committed).
+        """
+        for key, value in entries.items():
+            self.lru.put((params, *key), value)
+        conn.executemany(
+            "INSERT OR REPLACE INTO coin_split_cache (params, q_key, norm_coins, prem_coins, x_n, x_p, ok) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?);",
+            ((params, *key, x_n, x_p, int(ok)) for key, (x_n, x_p, ok) in entries.items()),
+        )
+        conn.commit()
+
+coin_cache = CoinSplitCache()
 
 # -----------------------------
 # Inputs for video, query from database
 # -----------------------------
 
-def get_coin_split(conn, video_id):
+def get_coin_split(conn, video_id, persist=True, use_cache=True):
     q = """
         SELECT 
             video_id,
@@ -49,33 +164,51 @@ def get_coin_split(conn, video_id):
     if df.empty:
         raise ValueError(f"video_id {video_id} not found in videos table")
 
-    # Pull components and compute Q function
-    W = float(df.loc[0, "watch_completion"])
-    E = float(df.loc[0, "engagement_rate"])
-    D = float(df.loc[0, "engagement_diversity"])
-    Rcomp = float(df.loc[0, "rewatch"])
-    S = float(df.loc[0, "nlp_quality"])
-    C_gate = int(df.loc[0, "compliance"])  # 0/1
+    # Pull components and compute Q function: inputs clamped to [0,1] and compliance gated exactly as
+    # in the batch path, so Q is in [0,1] before it is quantised
     Nn = int(df.loc[0, "norm_coins"])
     Np = int(df.loc[0, "prem_coins"])
-    Q = get_quality_score(W, E, D, Rcomp, S, C_gate)
+    Q = float(quality_from_rows(df.loc[0, list(QUALITY_INPUTS)].to_numpy(dtype=np.float64))[0])
+    video_id = int(video_id)
+
+    if not gp.available:
+        return _coin_split_fallback(conn, video_id, Q, Nn, Np, persist, use_cache)
+
+    params = coin_params_hash("gurobi")
+    key = (int(quantise_q(Q)), Nn, Np)
+    if use_cache:
+        hit = coin_cache.lookup(conn, params, [key]).get(key)
+        if hit is not None:
+            return _cached_split(conn, video_id, hit, persist)
+        Q = key[0] * Q_QUANTUM
 
-    theta   = 0.8
-    eps     = 1e-6
-    xn_max  = 0.75
-    xp_max  = 0.95
-    delta   = 0.05
-    Delta   = 0.35
+    try:
+        split = solve_coin_split_gurobi(Q, Nn, Np, video_id)
+    except gp.GurobiError as e:
+        log.warning("gurobi unavailable, using the batch solver", extra={"error": str(e)})
+        inc("solver_status_total", solver="coin", engine="gurobi", status="unavailable")
+        return _coin_split_fallback(conn, video_id, Q, Nn, Np, persist, use_cache)
+    if split is None:
+        return None
+    if use_cache:
+        coin_cache.store(conn, params, {key: (*split, True)})
 
-    lam_rev = 1.0   # weight on revenue
-    lam_util= 6   # weight on creator utility
-    lam_inc = 0.3   # weight on premium adoption incentive
+    # --- Persist x_n and x_p back to the database for this video ---
+    if persist:
+        _write_split(conn, video_id, *split)
+    return split
 
+def solve_coin_split_gurobi(Q, Nn, Np, video_id=None):
+    """
+    The coin split model for one (Q, norm_coins, prem_coins), solved by Gurobi. Returns (x_n, x_p),
+    or None when the model isn't solved to optimality (video_id only labels the log lines).
+    Raises gp.GurobiError without a usable licence.
+    """
     # -----------------------------
     # Anchors for normalization
     # -----------------------------
     R_max = Nn + Np
-    R_min   = 0.1*R_max # TikTok will keep at least 10% of revenue of coins for any video
+    R_min   = rev_floor*R_max
     den_R = max(1e-9, R_max - R_min)
 
     pay_cap = xn_max*Nn + xp_max*Np
@@ -87,8 +220,10 @@ def get_coin_split(conn, video_id):
     # -----------------------------
     # Model
     # -----------------------------
+    t_build = time.perf_counter()
     m = gp.Model("single_video")
-    m.Params.OutputFlag = 1
+    # Gurobi's own console log is off; the outcome is logged below
+    m.Params.LogToConsole = 0
 
     # Decision variables
     xn = m.addVar(lb=0.0, ub=xn_max, name="x_n")
@@ -100,7 +235,7 @@ def get_coin_split(conn, video_id):
 
     # Log utility
     z = m.addVar(lb=eps, name="z_pay")
-    y = m.addVar(lb=-GRB.INFINITY, name="log_pay")
+    y = m.addVar(lb=-gp.GRB.INFINITY, name="log_pay")
     m.addConstr(z == eps + pay)
     m.addGenConstrLog(z, y)      # y = log(z)
 
@@ -117,34 +252,259 @@ def get_coin_split(conn, video_id):
     m.addConstr(R >= R_min,       name="revenue_floor")
 
     # Objective
-    m.setObjective(lam_rev*R_norm + lam_util*U_norm + lam_inc*I_norm, GRB.MAXIMIZE)
+    m.setObjective(lam_rev*R_norm + lam_util*U_norm + lam_inc*I_norm, gp.GRB.MAXIMIZE)
+    observe("solver_stage_duration_seconds", time.perf_counter() - t_build, solver="coin", engine="gurobi", stage="build")
 
-    m.optimize()
+    with timed("solver_stage_duration_seconds", span="solver", solver="coin", engine="gurobi", stage="solve"):
+        m.optimize()
+    inc("solver_status_total", solver="coin", engine="gurobi", status=str(m.Status))
 
     # -----------------------------
     # Results
     # -----------------------------
-    if m.Status == GRB.OPTIMAL:
-        print("\n=== Optimal solution ===")
-        print(f"x_n = {xn.X:.4f}, x_p = {xp.X:.4f}")
-        print(f"Revenue kept R = {R.getValue():.2f}")
-        print(f"Creator payout pay = {pay.getValue():.2f}")
-        print(f"U (quality util) = {U.getValue():.4f}")
-        print(f"Normalized terms: R={R_norm.getValue():.3f}, U={U_norm.getValue():.3f}, I={I_norm.getValue():.3f}")
-        print(f"Objective value = {m.ObjVal:.4f}")
-
-        # --- Persist x_n and x_p back to the database for this video ---
-        try:
+    if m.Status == gp.GRB.OPTIMAL:
+        log.info("coin split solved", extra={
+            "video_id": video_id, "x_n": xn.X, "x_p": xp.X, "revenue_kept": R.getValue(),
+            "creator_payout": pay.getValue(), "utility": U.getValue(), "objective": m.ObjVal,
+            "runtime_s": m.Runtime,
+        })
+        return float(xn.X), float(xp.X)
+    log.warning("coin split not optimal", extra={"video_id": video_id, "status": m.Status})
+    return None
+
+def _write_split(conn, video_id, xn, xp):
+    # --- Persist x_n and x_p back to the database for this video ---
+    try:
+        conn.execute(
+            "UPDATE videos SET x_n = ?, x_p = ?, row_version = row_version + 1 WHERE video_id = ?;",
+            (xn, xp, int(video_id)),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        log.exception("failed to write coin split", extra={"video_id": int(video_id)})
+
+def _cached_split(conn, video_id, hit, persist):
+    xn, xp, ok = hit
+    if not ok:
+        log.warning("coin split infeasible", extra={"video_id": int(video_id), "cached": True})
+        return None
+    if persist:
+        _write_split(conn, video_id, xn, xp)
+    return xn, xp
+
+def _coin_split_fallback(conn, video_id, Q, Nn, Np, persist, use_cache=True):
+    """
+    Licence-free get_coin_split: the batch solver on a single video (same optimum), through the memo.
+    """
+    if use_cache:
+        xn, xp, ok = cached_coin_splits(conn, np.array([Q]), np.array([Nn]), np.array([Np]))
+    else:
+        xn, xp, ok = solve_coin_splits(np.array([Q]), np.array([Nn], dtype=np.float64), np.array([Np], dtype=np.float64))
+        inc("solver_status_total", solver="coin", engine="numpy", status="optimal" if ok[0] else "infeasible")
+    if not ok[0]:
+        log.warning("coin split infeasible", extra={"video_id": int(video_id)})
+        return None
+    xn, xp = float(xn[0]), float(xp[0])
+    if persist:
+        _write_split(conn, video_id, xn, xp)
+    log.info("coin split solved", extra={"video_id": int(video_id), "x_n": xn, "x_p": xp, "engine": "numpy"})
+    return xn, xp
+
+# -----------------------------
+# Batch solver: every video's (x_n, x_p) at once
+# -----------------------------
+
+def solve_coin_splits(Q, Nn, Np, theta=theta, lam_rev=lam_rev, lam_util=lam_util, lam_inc=lam_inc):
+    """
+    Vectorised closed-form solve of the get_coin_split model for arrays of (Q, norm_coins, prem_coins).
+    The keyword arguments override the module's objective weights (what-if sweeps).
+
+    Write t = x_n*Nn + x_p*Np for the creator payout. Revenue is Ntot - t and the utility term is a
+    concave function of t, so only the incentive term depends on how t is split. For a fixed t the
+    best split maximises the gap g = x_p - x_n, which works out to
+        G(t) = min(Delta, t/Np, (xp_max*Ntot - t)/Nn),   x_n = (t - G*Np)/Ntot,   x_p = x_n + G
+    G is concave and piecewise linear, so the objective in t is concave with at most three pieces.
+    The optimum is one of the piece endpoints or a per-piece stationary point
+        t* = c / (r - k_inc*slope) - eps
+    and we simply evaluate every candidate and keep the best one.
+    Returns (x_n, x_p, ok) where ok is False for videos whose feasible set is empty.
+    """
+    Q = np.asarray(Q, dtype=np.float64)
+    Nn = np.asarray(Nn, dtype=np.float64)
+    Np = np.asarray(Np, dtype=np.float64)
+    Ntot = Nn + Np
+
+    # Anchors for normalization (same as get_coin_split)
+    R_min = rev_floor * Ntot
+    den_R = np.maximum(1e-9, Ntot - R_min)
+    pay_cap = xn_max*Nn + xp_max*Np
+    U_max = (1 + theta*Q) * np.log(eps + pay_cap)
+    den_U = np.maximum(1e-9, U_max)
+    den_I = max(1e-9, Delta - delta)
+
+    r = lam_rev / den_R                     # objective lost per coin paid out
+    c = lam_util * (1 + theta*Q) / den_U    # utility scale: c * log(eps + t)
+    k = lam_inc / den_I                     # objective gained per unit of gap
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_Np = np.where(Np > 0, 1.0 / Np, np.inf)
+        inv_Nn = np.where(Nn > 0, 1.0 / Nn, np.inf)
+
+        def gap(t):
+            return np.minimum.reduce([
+                np.full_like(t, Delta),
+                np.where(Np > 0, t * inv_Np, np.inf),
+                np.where(Nn > 0, (xp_max*Ntot - t) * inv_Nn, np.inf),
+            ])
+
+        def objective(t):
+            return lam_rev*(Ntot - t - R_min)/den_R + c*np.log(eps + t) + k*(gap(t) - delta)
+
+        # Feasible payout range: x_n = 0, x_p = delta at the bottom; bounds, gap cap and revenue floor at the top
+        t_lo = delta * Np
+        t_hi = np.minimum.reduce([
+            xp_max*Ntot - delta*Nn,
+            xn_max*Ntot + Delta*Np,
+            xn_max*Nn + xp_max*Np,
+            Ntot - R_min,
+        ])
+        ok = t_lo <= t_hi + 1e-9
+        t_hi = np.maximum(t_lo, t_hi)
+
+        candidates = [t_lo, t_hi, Delta*Np, xp_max*Ntot - Delta*Nn, xp_max*Np]
+        for slope in (0.0, inv_Np, -inv_Nn):
+            slope = np.where(np.isinf(slope), 0.0, slope)
+            den = r - k*slope
+            candidates.append(np.where(den > 0, c / den - eps, t_hi))
+        T = np.clip(np.stack(candidates), t_lo, t_hi)
+        best = np.argmax(objective(T), axis=0)
+        t = np.take_along_axis(T, best[None, :], axis=0)[0]
+
+        G = gap(t)
+        xn = np.where(Ntot > 0, (t - np.where(Np > 0, G*Np, 0.0)) / Ntot, 0.0)
+    # No coins at all: only the incentive term is left, so open the gap fully
+    G = np.where(Ntot > 0, G, Delta)
+    xn = np.clip(xn, 0.0, xn_max)
+    xp = np.clip(xn + G, 0.0, xp_max)
+    return xn, xp, ok
+
+def cached_coin_splits(conn, Q, Nn, Np):
+    """
+    solve_coin_splits with every input quantised to its memo key: each distinct key is solved at
+    most once per call, and with at most COIN_CACHE_MAX_KEYS distinct keys they are looked up in
+    (and new solves added to) the memo first. Returns (x_n, x_p, ok) like solve_coin_splits.
+    """
+    keys = np.stack([quantise_q(Q), np.asarray(Nn, dtype=np.int64), np.asarray(Np, dtype=np.int64)], axis=1)
+    # Distinct rows by lexsort (np.unique(axis=0) sorts a void view and costs more than the solve)
+    order = np.lexsort(keys.T[::-1])
+    ordered = keys[order]
+    first = np.r_[True, (ordered[1:] != ordered[:-1]).any(axis=1)]
+    uniq = ordered[first]
+    inverse = np.empty(len(keys), dtype=np.int64)
+    inverse[order] = np.cumsum(first) - 1
+    xn = np.empty(len(uniq))
+    xp = np.empty(len(uniq))
+    ok = np.zeros(len(uniq), dtype=bool)
+    todo = np.arange(len(uniq))
+
+    use_memo = len(uniq) <= COIN_CACHE_MAX_KEYS
+    if use_memo:
+        params = coin_params_hash("numpy")
+        ukeys = list(map(tuple, uniq.tolist()))
+        hits = coin_cache.lookup(conn, params, ukeys)
+        if hits:
+            found = np.array([k in hits for k in ukeys])
+            for i in np.flatnonzero(found):
+                xn[i], xp[i], ok[i] = hits[ukeys[i]]
+            todo = np.flatnonzero(~found)
+
+    if len(todo):
+        xn[todo], xp[todo], ok[todo] = solve_coin_splits(uniq[todo, 0] * Q_QUANTUM, uniq[todo, 1], uniq[todo, 2])
+        n_ok = int(ok[todo].sum())
+        inc("solver_status_total", n_ok, solver="coin", engine="numpy", status="optimal")
+        inc("solver_status_total", len(todo) - n_ok, solver="coin", engine="numpy", status="infeasible")
+        if use_memo:
+            coin_cache.store(conn, params, {
+                ukeys[i]: (float(xn[i]), float(xp[i]), bool(ok[i])) for i in todo.tolist()
+            })
+    return xn[inverse], xp[inverse], ok[inverse]
+
+def get_coin_splits(conn, video_ids=None):
+    """
+    Batch version of get_coin_split: one query for the inputs, one vectorised solve,
+    one executemany for the results. video_ids=None re-splits every video.
+    """
+    q = """
+        SELECT
+            video_id,
+            watch_completion,
+            engagement_rate,
+            engagement_diversity,
+            rewatch,
+            nlp_quality,
+            compliance,
+            norm_coins,
+            prem_coins
+        FROM videos
+    """
+    with timed("solver_stage_duration_seconds", span="solver", solver="coin", engine="numpy", stage="load"):
+        if video_ids is None:
+            # Streamed: only one chunk of row tuples exists at a time, however many videos there are
+            blocks = fetch_chunks(conn, q)
+        else:
+            video_ids = [int(v) for v in video_ids]
+            blocks = fetch_by_ids(conn, q, video_ids)
+        ids, Q, Nn, Np = [], [], [], []
+        for data in blocks:
+            ids.append(data[:, 0].astype(np.int64))
+            Q.append(quality_from_rows(data[:, 1:7]))
+            Nn.append(data[:, 7])
+            Np.append(data[:, 8])
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+    if not len(ids):
+        log.info("no videos to split")
+        return 0
+
+    with timed("solver_stage_duration_seconds", span="solver", solver="coin", engine="numpy", stage="solve"):
+        xn, xp, ok = cached_coin_splits(conn, np.concatenate(Q), np.concatenate(Nn), np.concatenate(Np))
+    n_ok = int(ok.sum())
+
+    if not ok.all():
+        log.warning("coin split infeasible; leaving these videos unchanged", extra={"video_ids": ids[~ok].tolist()})
+    updates = zip(xn[ok].tolist(), xp[ok].tolist(), ids[ok].tolist())
+    try:
+        with timed("solver_stage_duration_seconds", span="solver", solver="coin", engine="numpy", stage="write"):
             cur = conn.cursor()
-            cur.execute(
-                """
-                UPDATE videos
-                SET x_n = ?, x_p = ?
-                WHERE video_id = ?;
-                """,
-                (float(xn.X), float(xp.X), int(video_id))
-            )
+            # A whole-table re-split recomputes creator_stats once instead of by trigger per row
+            with deferred_stats(conn) if video_ids is None else nullcontext():
+                cur.executemany("UPDATE videos SET x_n = ?, x_p = ?, row_version = row_version + 1 WHERE video_id = ?;", updates)
             conn.commit()
-            print(f"DB updated: video_id={video_id} -> x_n={xn.X:.4f}, x_p={xp.X:.4f}")
-        except Exception as e:
-            print(f"WARNING: Failed to update DB for video_id={video_id}: {e}")
\ No newline at end of file
+        log.info("coin splits written", extra={"videos": n_ok})
+    except Exception:
+        conn.rollback()
+        log.exception("failed to write coin splits")
+    return n_ok
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Premium / normal coin split optimiser")
+    parser.add_argument("--db", default="app.db")
+    parser.add_argument("--compare", action="store_true", help="check the batch solver against Gurobi, video by video")
+    args = parser.parse_args()
+
+    from metrics import configure_logging
+    configure_logging()
+
+    conn = sqlite3.connect(args.db)
+    if args.compare:
+        q = f"SELECT video_id, {', '.join(QUALITY_INPUTS)}, norm_coins, prem_coins FROM videos"
+        for data in fetch_chunks(conn, q):
+            xn, xp, _ = solve_coin_splits(quality_from_rows(data[:, 1:7]), data[:, 7], data[:, 8])
+            for i, video_id in enumerate(data[:, 0].astype(np.int64).tolist()):
+                ref = get_coin_split(conn, video_id, persist=False, use_cache=False)
+                print(f"video_id={video_id}: batch=({xn[i]:.4f}, {xp[i]:.4f}) gurobi={ref}")
+    else:
+        get_coin_splits(conn)
+    conn.close()
@@ -0,0 +1,287 @@
+import datetime
+import logging
+import os
+import sqlite3
+import time
+
+from db import SQL_IN_CHUNK
+
+log = logging.getLogger(__name__)
+
+# Earnings history. Every allocation write-back appends one sample per priced video (projected
+# earnings and views at that moment) and folds it into daily and weekly rollups in the same
+# transaction, so a timeline for any window is one range scan of a rollup's (video_id, bucket)
+# primary key. Old samples and daily rollups are deleted after their retention period; the
+# weekly rollups (already maintained from every sample) keep the long-term history.
+
+DAY = 86400
+WEEK = 7 * DAY
+# Weeks start on Monday (1970-01-05 00:00 UTC)
+WEEK_ORIGIN = 4 * DAY
+
+# grain -> (table, bucket width in seconds, offset of bucket starts)
+GRAINS = {
+    "sample": ("earnings_samples", None, 0),
+    "day": ("earnings_daily", DAY, 0),
+    "week": ("earnings_weekly", WEEK, WEEK_ORIGIN),
+}
+# Default window of the range endpoint when no start is given
+DEFAULT_WINDOW = {"sample": 2 * DAY, "day": 30 * DAY, "week": 26 * WEEK}
+
+# Retention in days (0 keeps everything): raw samples, then daily rollups. Weekly rollups are kept
+SAMPLE_RETENTION_DAYS = int(os.environ.get("EARNINGS_SAMPLE_DAYS", "3"))
+DAILY_RETENTION_DAYS = int(os.environ.get("EARNINGS_DAILY_DAYS", "365"))
+# Retention runs at most this often (it scans the tables)
+COMPACT_INTERVAL_S = DAY
+
+
+def init_earnings_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS earnings_samples (
+            video_id           INTEGER NOT NULL,
+            ts                 INTEGER NOT NULL,
+            allocation_version INTEGER NOT NULL,
+            proj_earnings      FLOAT   NOT NULL,
+            views              INTEGER NOT NULL,
+            PRIMARY KEY (video_id, ts)
+        ) WITHOUT ROWID;
+    """)
+    # One row per video and day / week (bucket = unix time of its start)
+    for table in ("earnings_daily", "earnings_weekly"):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                video_id      INTEGER NOT NULL,
+                bucket        INTEGER NOT NULL,
+                samples       INTEGER NOT NULL,
+                earnings_sum  FLOAT   NOT NULL,
+                earnings_min  FLOAT   NOT NULL,
+                earnings_max  FLOAT   NOT NULL,
+                earnings_last FLOAT   NOT NULL,
+                views_last    INTEGER NOT NULL,
+                PRIMARY KEY (video_id, bucket)
+            ) WITHOUT ROWID;
+        """)
+    conn.commit()
+
+
+def bucket_start(ts, grain):
+    _, width, origin = GRAINS[grain]
+    return ts if width is None else ts - (ts - origin) % width
+
+
+def record_earnings(conn, version, video_ids=None, ts=None):
+    """
+    Append a sample of proj_earnings and views for the videos priced in allocation `version`
+    (every one of them, or just video_ids) and fold it into the daily and weekly rollups. Runs
+    inside the caller's transaction (the allocation write-back), which commits it. Returns the
+    number of samples.
+
+    A second recording in the same second replaces the video's sample at that ts; its rollup rows
+    then drop the old sample before adding the new one, so they always agree with the samples.
+    """
+    # bootstrap imports this module for its migration
+    from bootstrap import get_meta, set_meta
+
+    ts = int(time.time()) if ts is None else int(ts)
+    if video_ids is None:
+        selections = [("allocation_version = ?", [version])]
+    else:
+        video_ids = sorted({int(v) for v in video_ids})
+        selections = [
+            (f"video_id IN ({', '.join('?' for _ in chunk)})", chunk)
+            for chunk in (video_ids[i:i + SQL_IN_CHUNK] for i in range(0, len(video_ids), SQL_IN_CHUNK))
+        ]
+    # Samples can only exist at ts if something was recorded at ts or later: otherwise (nearly
+    # always) the lookup of samples being replaced is skipped
+    last_ts = int(get_meta(conn, "earnings_last_ts", 0))
+    recorded = sum(_record(conn, ts, where, params, ts <= last_ts) for where, params in selections)
+    if ts > last_ts:
+        set_meta(conn, "earnings_last_ts", ts)
+    return recorded
+
+
+def _record(conn, ts, where, params, replacing):
+    replaced = 0
+    if replacing:
+        conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS earnings_replaced (video_id INTEGER PRIMARY KEY, proj_earnings FLOAT NOT NULL);"
+        )
+        conn.execute("DELETE FROM earnings_replaced;")
+        replaced = conn.execute(
+            "INSERT INTO earnings_replaced (video_id, proj_earnings) SELECT s.video_id, s.proj_earnings "
+            f"FROM (SELECT video_id FROM videos WHERE {where}) v CROSS JOIN earnings_samples s "
+            "ON s.video_id = v.video_id AND s.ts = ?;",
+            [*params, ts],
+        ).rowcount
+        for grain in ("day", "week"):
+            table = GRAINS[grain][0]
+            conn.execute(
+                f"UPDATE {table} SET samples = samples - 1, earnings_sum = earnings_sum - r.proj_earnings "
+                f"FROM earnings_replaced r WHERE {table}.video_id = r.video_id AND {table}.bucket = ?;",
+                (bucket_start(ts, grain),),
+            )
+    cur = conn.execute(
+        "INSERT INTO earnings_samples (video_id, ts, allocation_version, proj_earnings, views) "
+        f"SELECT video_id, ?, allocation_version, proj_earnings, views FROM videos WHERE {where} "
+        "ON CONFLICT(video_id, ts) DO UPDATE SET allocation_version = excluded.allocation_version, "
+        "proj_earnings = excluded.proj_earnings, views = excluded.views;",
+        [ts, *params],
+    )
+    for grain in ("day", "week"):
+        conn.execute(
+            f"INSERT INTO {GRAINS[grain][0]} "
+            "(video_id, bucket, samples, earnings_sum, earnings_min, earnings_max, earnings_last, views_last) "
+            f"SELECT video_id, ?, 1, proj_earnings, proj_earnings, proj_earnings, proj_earnings, views "
+            f"FROM videos WHERE {where} "
+            "ON CONFLICT(video_id, bucket) DO UPDATE SET samples = samples + 1, "
+            "earnings_sum = earnings_sum + excluded.earnings_sum, "
+            "earnings_min = min(earnings_min, excluded.earnings_min), "
+            "earnings_max = max(earnings_max, excluded.earnings_max), "
+            "earnings_last = excluded.earnings_last, views_last = excluded.views_last;",
+            [bucket_start(ts, grain), *params],
+        )
+    if replaced:
+        # The replaced sample may have been the bucket's min or max: recompute those from the day's
+        # samples, then the week's from its days
+        day, week = bucket_start(ts, "day"), bucket_start(ts, "week")
+        conn.execute(
+            "UPDATE earnings_daily SET "
+            "earnings_min = (SELECT min(s.proj_earnings) FROM earnings_samples s "
+            "WHERE s.video_id = earnings_daily.video_id AND s.ts >= ? AND s.ts < ?), "
+            "earnings_max = (SELECT max(s.proj_earnings) FROM earnings_samples s "
+            "WHERE s.video_id = earnings_daily.video_id AND s.ts >= ? AND s.ts < ?) "
+            "WHERE bucket = ? AND video_id IN (SELECT video_id FROM earnings_replaced);",
+            (day, day + DAY, day, day + DAY, day),
+        )
+        conn.execute(
+            "UPDATE earnings_weekly SET "
+            "earnings_min = (SELECT min(d.earnings_min) FROM earnings_daily d "
+            "WHERE d.video_id = earnings_weekly.video_id AND d.bucket >= ? AND d.bucket < ?), "
+            "earnings_max = (SELECT max(d.earnings_max) FROM earnings_daily d "
+            "WHERE d.video_id = earnings_weekly.video_id AND d.bucket >= ? AND d.bucket < ?) "
+            "WHERE bucket = ? AND video_id IN (SELECT video_id FROM earnings_replaced);",
+            (week, week + WEEK, week, week + WEEK, week),
+        )
+    return cur.rowcount
+
+
+def earnings_range(conn, video_id, grain, start, end):
+    """
+    One video's history between unix times start (inclusive) and end (exclusive), oldest first:
+    a single range scan of the grain's (video_id, bucket) primary key.
+    """
+    table, _, _ = GRAINS[grain]
+    if grain == "sample":
+        return [
+            {"ts": ts, "allocation_version": version, "proj_earnings": earnings, "views": views}
+            for ts, version, earnings, views in conn.execute(
+                "SELECT ts, allocation_version, proj_earnings, views FROM earnings_samples "
+                "WHERE video_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (video_id, start, end),
+            )
+        ]
+    return [
+        {
+            "bucket": bucket,
+            "samples": samples,
+            "earnings_mean": total / samples,
+            "earnings_min": low,
+            "earnings_max": high,
+            "earnings_last": last,
+            "views_last": views,
+        }
+        for bucket, samples, total, low, high, last, views in conn.execute(
+            f"SELECT bucket, samples, earnings_sum, earnings_min, earnings_max, earnings_last, views_last FROM {table} "
+            "WHERE video_id = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+            (video_id, bucket_start(start, grain), end),
+        )
+    ]
+
+
+def daily_timeline(conn, video_id, days=7):
+    """
+    The earnings_timeline of /get-video-data: the video's last `days` days with samples, oldest
+    first. proj_earnings is a running projection, so cumulative_earnings is its value at the end of
+    the day and daily_earnings how much it grew that day (from the previous day with samples, or
+    from 0 on the first one). Only changes when a sample is recorded, which is always together
+    with a write to the video's row.
+    """
+    # One day more than shown, as the base of the first day's change
+    rows = conn.execute(
+        "SELECT bucket, earnings_last FROM earnings_daily WHERE video_id = ? ORDER BY bucket DESC LIMIT ?",
+        (video_id, days + 1),
+    ).fetchall()[::-1]
+    previous = rows.pop(0)[1] if len(rows) > days else 0.0
+    timeline = []
+    for bucket, last in rows:
+        timeline.append({
+            "date": datetime.datetime.fromtimestamp(bucket, datetime.timezone.utc).strftime("%m/%d"),
+            "daily_earnings": round(last - previous, 2),
+            "cumulative_earnings": round(last, 2),
+        })
+        previous = last
+    return timeline
+
+
+def compact_earnings(conn, now=None, force=False):
+    """
+    Apply retention: samples older than SAMPLE_RETENTION_DAYS and daily rollups older than
+    DAILY_RETENTION_DAYS are deleted (their weekly rollups stay). Skipped unless
+    COMPACT_INTERVAL_S has passed since the last run, or force=True. Returns the rows deleted
+    per table, or None when skipped.
+    """
+    # bootstrap imports this module for its migration
+    from bootstrap import get_meta, set_meta
+
+    now = int(time.time()) if now is None else int(now)
+    if not force and now - int(get_meta(conn, "earnings_compacted_at", 0)) < COMPACT_INTERVAL_S:
+        return None
+    deleted = {}
+    for table, column, days in (
+        ("earnings_samples", "ts", SAMPLE_RETENTION_DAYS),
+        ("earnings_daily", "bucket", DAILY_RETENTION_DAYS),
+    ):
+        if days > 0:
+            deleted[table] = conn.execute(f"DELETE FROM {table} WHERE {column} < ?;", (now - days * DAY,)).rowcount
+    set_meta(conn, "earnings_compacted_at", now)
+    conn.commit()
+    log.info("earnings history compacted", extra={"deleted": deleted})
+    return deleted
+
+
+def parse_date(value):
+    """
+    YYYY-MM-DD (UTC midnight) or unix seconds -> unix seconds.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Earnings history: apply retention, or print a video's timeline")
+    parser.add_argument("command", choices=("compact", "show"))
+    parser.add_argument("--db", default="app.db")
+    parser.add_argument("--video", type=int, help="video_id (show)")
+    parser.add_argument("--grain", choices=sorted(GRAINS), default="day")
+    args = parser.parse_args()
+
+    from metrics import configure_logging
+    configure_logging()
+
+    conn = sqlite3.connect(args.db)
+    if args.command == "compact":
+        for table, n in compact_earnings(conn, force=True).items():
+            print(f"{table}: {n:,} rows deleted")
+    else:
+        if args.video is None:
+            parser.error("show needs --video")
+        now = int(time.time())
+        for point in earnings_range(conn, args.video, args.grain, now - DEFAULT_WINDOW[args.grain], now + 1):
+            when = point.get("ts", point.get("bucket"))
+            print(datetime.datetime.fromtimestamp(when, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M"),
+                  {k: v for k, v in point.items() if k not in ("ts", "bucket")})
+    conn.close()
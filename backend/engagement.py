@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+
+from metrics import inc, observe
+from quality import QUALITY_INPUTS, refresh_quality_scores
+
+# Buffered events are written at most this many seconds after they arrive...
+FLUSH_INTERVAL_S = float(os.environ.get("ENGAGEMENT_FLUSH_S", "1.0"))
+# ...or as soon as this many distinct videos have pending changes
+MAX_PENDING_VIDEOS = int(os.environ.get("ENGAGEMENT_MAX_PENDING", "10000"))
+# A failed flush is retried after the interval, doubled per consecutive failure up to this
+FLUSH_RETRY_MAX_S = float(os.environ.get("ENGAGEMENT_RETRY_MAX_S", "30.0"))
+# Largest batch a single ingestion call may carry
+MAX_EVENTS_PER_CALL = 10_000
+
+COUNTERS = ("views", "likes", "comments", "shares")
+
+log = logging.getLogger(__name__)
+
+
+class EngagementError(ValueError):
+    pass
+
+
+def parse_event(event):
+    """
+    Validate one event: {"video_id": int, views/likes/comments/shares: non-negative int increments,
+    optionally any QUALITY_INPUTS as the latest observed value in [0, 1] (compliance: 0 or 1)}.
+    Returns (video_id, counter increments, quality values).
+    """
+    if not isinstance(event, dict):
+        raise EngagementError("every event must be an object")
+    try:
+        video_id = int(event["video_id"])
+    except (KeyError, TypeError, ValueError):
+        raise EngagementError("every event needs an integer video_id")
+    increments = []
+    for name in COUNTERS:
+        v = event.get(name, 0)
+        if not isinstance(v, int) or isinstance(v, bool) or v < 0:
+            raise EngagementError(f"{name} must be a non-negative integer")
+        increments.append(v)
+    quality = {}
+    for name in QUALITY_INPUTS:
+        if name in event:
+            v = event[name]
+            if not isinstance(v, (int, float)) or isinstance(v, bool) or not 0.0 <= v <= 1.0:
+                raise EngagementError(f"{name} must be a number in [0, 1]")
+            quality[name] = int(v == 1) if name == "compliance" else float(v)
+    return video_id, increments, quality
+
+
+class EngagementBuffer:
+    """
+    Absorbs engagement events in memory and writes them in bulk. Counter increments are summed
+    per video and quality inputs keep their latest value; flush() swaps the buffer out and applies
+    it in one transaction (one UPDATE per video, however many events it got). A flush happens
+    FLUSH_INTERVAL_S after the first pending event, or right away once MAX_PENDING_VIDEOS videos
+    are pending. on_flush(conn, video_ids) runs inside the flush, after the commit.
+
+    A failed flush puts its batch back and retries on its own, with backoff, so the events are
+    written even if no more arrive. Pending events live only in memory: a crash loses at most one
+    flush interval of them (or what is waiting for a retry).
+    """
+
+    def __init__(self, pool, on_flush=None, interval=FLUSH_INTERVAL_S, max_pending=MAX_PENDING_VIDEOS):
+        self.pool = pool
+        self.on_flush = on_flush
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._counts = {}   # video_id -> [views, likes, comments, shares]
+        self._quality = {}  # video_id -> {column: latest value}
+        self._events = 0
+        self._timer = None
+        self._failures = 0  # consecutive failed flushes
+
+    def add(self, events):
+        """
+        Buffer a batch of events (all validated before any is applied). Returns the number accepted.
+        """
+        parsed = [parse_event(e) for e in events]
+        with self._lock:
+            for video_id, increments, quality in parsed:
+                counts = self._counts.get(video_id)
+                if counts is None:
+                    self._counts[video_id] = increments
+                else:
+                    for i, v in enumerate(increments):
+                        counts[i] += v
+                if quality:
+                    self._quality.setdefault(video_id, {}).update(quality)
+            self._events += len(parsed)
+            full = len(self._counts) >= self.max_pending
+            if full:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            else:
+                self._arm(self.interval)
+        inc("engagement_events_total", len(parsed))
+        if full:
+            threading.Thread(target=self.flush, name="engagement-flush", daemon=True).start()
+        return len(parsed)
+
+    def _arm(self, delay):
+        # With self._lock held: schedule a flush unless one is already scheduled or nothing is pending
+        if self._timer is None and self._counts:
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def pending(self):
+        with self._lock:
+            return {"videos": len(self._counts), "events": self._events}
+
+    def _requeue(self, counts, quality, events):
+        # Put a failed batch back in front of whatever arrived since (newer quality values win)
+        with self._lock:
+            for video_id, c in counts.items():
+                newer = self._counts.get(video_id)
+                self._counts[video_id] = c if newer is None else [a + b for a, b in zip(c, newer)]
+            for video_id, values in quality.items():
+                self._quality[video_id] = {**values, **self._quality.get(video_id, {})}
+            self._events += events
+            self._failures += 1
+            # Retry even if nothing else arrives; a timer armed by add() in the meantime is kept
+            self._arm(min(self.interval * 2 ** self._failures, FLUSH_RETRY_MAX_S))
+
+    def flush(self):
+        """
+        Write everything buffered so far. Returns the number of videos updated.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                counts, self._counts = self._counts, {}
+                quality, self._quality = self._quality, {}
+                events, self._events = self._events, 0
+            if not counts:
+                return 0
+
+            t0 = time.perf_counter()
+            with self.pool.connection() as conn:
+                try:
+                    cur = conn.cursor()
+                    cur.executemany(
+                        "UPDATE videos SET views = views + ?, likes = likes + ?, comments = comments + ?, "
+                        "shares = shares + ?, row_version = row_version + 1 WHERE video_id = ?;",
+                        ((*c, video_id) for video_id, c in counts.items()),
+                    )
+                    updated = cur.rowcount
+                    for video_id, values in quality.items():
+                        cols = ", ".join(f"{k} = ?" for k in values)
+                        cur.execute(f"UPDATE videos SET {cols} WHERE video_id = ?;", (*values.values(), video_id))
+                    # Same transaction: refresh_quality_scores commits it when a score changed
+                    if quality:
+                        refresh_quality_scores(conn, list(quality))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    log.exception("engagement flush failed; keeping the batch for the next flush",
+                                  extra={"videos": len(counts), "events": events})
+                    self._requeue(counts, quality, events)
+                    return 0
+                with self._lock:
+                    self._failures = 0
+                if self.on_flush is not None:
+                    self.on_flush(conn, list(counts))
+            observe("engagement_flush_duration_seconds", time.perf_counter() - t0)
+            if updated < len(counts):
+                inc("engagement_unknown_videos_total", len(counts) - updated)
+            log.info("engagement flushed", extra={"videos": updated, "events": events})
+            return updated
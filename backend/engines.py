@@ -0,0 +1,88 @@
+import importlib
+import importlib.util
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy optional module (OpenCV, pandas, gurobipy) that is imported on first
+    attribute access, so processes that never touch it (read-only workers serving GET routes)
+    neither pay for the import nor need the package installed. `available` checks that the
+    package is installed without importing it.
+    """
+
+    def __init__(self, name, role):
+        self._name = name
+        self._role = role
+        self._module = None
+        self._available = None
+        self._load_seconds = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        if self._module is not None:
+            return True
+        if self._available is None:
+            self._available = importlib.util.find_spec(self._name) is not None
+        return self._available
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    @property
+    def load_seconds(self):
+        return self._load_seconds
+
+    def load(self):
+        """
+        Import the module (once) and return it. Raises ImportError when it isn't installed.
+        """
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    t0 = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    self._load_seconds = time.perf_counter() - t0
+                    self._module = module
+                    log.info("engine loaded", extra={
+                        "engine": self._role, "package": self._name, "seconds": round(self._load_seconds, 4),
+                    })
+        return self._module
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyModule {self._name!r} ({self._role}, {state})>"
+
+
+# The media engine (thumbnails, sprites), the DataFrame layer and the MIP solver backend
+cv2 = LazyModule("cv2", "media")
+pd = LazyModule("pandas", "dataframe")
+gp = LazyModule("gurobipy", "solver")
+
+ENGINES = {"media": cv2, "dataframe": pd, "solver": gp}
+
+
+def engine_status():
+    """
+    role -> {"module", "available", "loaded", "load_seconds"}. Checking availability never imports.
+    """
+    return {
+        role: {
+            "module": m._name,
+            "available": m.available,
+            "loaded": m.loaded,
+            "load_seconds": m.load_seconds,
+        }
+        for role, m in ENGINES.items()
+    }
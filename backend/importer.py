@@ -0,0 +1,369 @@
+import csv
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from bootstrap import SEED_TABLES, migrate, create_indexes, get_meta, set_meta
+from creator_stats import rebuild_creator_stats
+from quality import refresh_quality_scores
+from search import INDEXED, rebuild_search
+
+# Bulk import of creators / videos exports (JSONL or CSV, any size). Rows are streamed and mapped
+# onto the table's columns by name, written in large transactions with the table's secondary
+# indexes and triggers dropped (rebuilt once at the end), and every transaction also records a
+# checkpoint (byte offset into the source) in meta, so a failed import resumes where it stopped.
+
+# Rows per transaction (and per checkpoint)
+IMPORT_TXN_ROWS = int(os.environ.get("IMPORT_TXN_ROWS", "100000"))
+FORMATS = ("jsonl", "csv")
+# Import-only page cache (KiB, negative as in PRAGMA cache_size)
+IMPORT_CACHE_KIB = 262144
+
+log = logging.getLogger(__name__)
+
+
+class ImportFailed(Exception):
+    pass
+
+
+# ---- Readers ----
+# Each yields (row dict, byte offset just past the row), starting at a byte offset, so the offset
+# of the last committed row is a resumable position in the file
+
+def read_jsonl(path, start=0):
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for raw in f:
+            line_start, offset = offset, offset + len(raw)
+            if not raw.strip():
+                continue
+            try:
+                row = json.loads(raw)
+            except ValueError as e:
+                raise ImportFailed(f"{path}: invalid JSON at byte {line_start}: {e}") from None
+            if not isinstance(row, dict):
+                raise ImportFailed(f"{path}: expected a JSON object at byte {line_start}")
+            yield row, offset
+
+
+def read_csv(path, start=0):
+    """
+    Header row required. Empty fields count as missing, so the column default applies.
+    """
+    with open(path, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8-sig")]), None)
+        if not header:
+            raise ImportFailed(f"{path}: no header row")
+        header = [h.strip() for h in header]
+        offset = max(start, f.tell())
+        f.seek(offset)
+
+        def lines():
+            # csv.reader pulls exactly the lines of one record at a time, so after each record
+            # `offset` is the position right after it (quoted fields may span lines)
+            nonlocal offset
+            for raw in f:
+                offset += len(raw)
+                yield raw.decode("utf-8")
+
+        for record in csv.reader(lines()):
+            if not record:
+                continue
+            if len(record) > len(header):
+                raise ImportFailed(f"{path}: record ending at byte {offset} has more fields than the header")
+            yield {k: v for k, v in zip(header, record) if v != ""}, offset
+
+
+READERS = {"jsonl": read_jsonl, "csv": read_csv}
+
+
+def detect_format(path):
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ImportFailed(f"can't tell the format of {path}; pass one of {', '.join(FORMATS)}")
+
+
+# ---- Deferred indexes and triggers ----
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table});")]
+
+
+# CSV fields are text. Numbers are parsed here rather than by SQLite's column affinity, whose
+# text-to-REAL conversion can be off by one ulp; anything that doesn't parse is stored as given
+def _real(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _integer(value):
+    try:
+        return int(value)
+    except ValueError:
+        return _real(value)
+
+
+def column_parsers(conn, table):
+    """
+    column -> parser for CSV text, by declared type (INTEGER, FLOAT/REAL; others stay text).
+    """
+    parsers = {}
+    for row in conn.execute(f"PRAGMA table_info({table});"):
+        decl = (row[2] or "").upper()
+        parsers[row[1]] = _integer if "INT" in decl else _real if any(t in decl for t in ("REAL", "FLOA", "DOUB")) else None
+    return parsers
+
+
+def secondary_objects(conn, table):
+    """
+    [(type, name, sql)] for the table's explicit indexes and its triggers (not the primary key).
+    """
+    return [
+        tuple(row) for row in conn.execute(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL ORDER BY type, name",
+            (table,),
+        )
+    ]
+
+
+def drop_objects(conn, objects):
+    for kind, name, _ in objects:
+        conn.execute(f"DROP {kind.upper()} IF EXISTS {name};")
+
+
+def restore_objects(conn, objects):
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    for kind, name, sql in objects:
+        if name not in existing:
+            conn.execute(sql)
+
+
+# ---- Import ----
+
+def _checkpoint_key(table, path):
+    return f"import:{table}:{Path(path).resolve()}"
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def import_rows(conn, table, path, fmt=None, rename=None, txn_rows=IMPORT_TXN_ROWS, restart=False, progress=None):
+    """
+    Stream `path` into `table`, mapping fields onto columns by name (rename: {source field:
+    column}); unknown fields are ignored and reported. Rows carrying the id column are upserted
+    (a changed video row gets its row_version bumped), other rows are inserted with a new id.
+
+    Resumes from the checkpoint of an earlier, unfinished import of the same file; a finished or
+    changed file starts over only with restart=True. progress(rows, seconds) is called after each
+    transaction. Returns a summary dict.
+    """
+    if table not in SEED_TABLES:
+        raise ImportFailed(f"unknown table {table!r}; expected one of {', '.join(SEED_TABLES)}")
+    fmt = fmt or detect_format(path)
+    if fmt not in READERS:
+        raise ImportFailed(f"unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    id_column = SEED_TABLES[table][1]
+    rename = rename or {}
+    migrate(conn)
+
+    key = _checkpoint_key(table, path)
+    stamp = _source_stamp(path)
+    checkpoint = json.loads(get_meta(conn, key, "null") or "null")
+    if checkpoint and not restart:
+        if {k: checkpoint.get(k) for k in stamp} != stamp:
+            raise ImportFailed(f"{path} changed since the import checkpointed at byte {checkpoint['offset']}; "
+                               "use restart to import it from the start")
+        if checkpoint.get("done"):
+            log.info("import already done", extra={"table": table, "source": str(path), "rows": checkpoint["rows"]})
+            return {**checkpoint, "table": table, "skipped": True}
+    if not checkpoint or restart:
+        # The dropped index/trigger DDL lives in the checkpoint until the import finishes, so a
+        # resumed import (even after a crash) can still put it back. A restart after a crash finds
+        # them already dropped: keep the old checkpoint's DDL for every one missing from the schema
+        deferred = secondary_objects(conn, table)
+        present = {name for _, name, _ in deferred}
+        if checkpoint:
+            deferred += [tuple(obj) for obj in checkpoint.get("deferred", []) if obj[1] not in present]
+        checkpoint = {**stamp, "offset": 0, "rows": 0, "seconds": 0.0, "deferred": sorted(deferred)}
+    resumed = checkpoint["offset"] > 0
+    if resumed:
+        log.info("import resumed", extra={"table": table, "source": str(path), "offset": checkpoint["offset"],
+                                          "rows": checkpoint["rows"]})
+
+    columns = table_columns(conn, table)
+    parsers = column_parsers(conn, table) if fmt == "csv" else {}
+    bump_version = "row_version" in columns
+    statements = {}
+    layouts = {}
+    ignored = set()
+
+    def layout(fields):
+        """
+        (columns in table order, source fields in the same order, their parsers or None) for a
+        row with these fields. Keyed by the set of fields, so rows listing them in any order share
+        one statement.
+        """
+        found = layouts.get(fields)
+        if found is None:
+            source = {rename.get(f, f): f for f in fields}
+            ignored.update(c for c in source if c not in columns)
+            cols = tuple(c for c in columns if c in source)
+            convert = tuple(parsers.get(c) or str for c in cols) if parsers else None
+            found = layouts[fields] = (cols, tuple(source[c] for c in cols), convert)
+        return found
+
+    def statement(cols):
+        sql = statements.get(cols)
+        if sql is None:
+            sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)})"
+            if id_column in cols:
+                updates = [f"{c} = excluded.{c}" for c in cols if c != id_column]
+                if bump_version:
+                    updates.append("row_version = row_version + 1")
+                sql += f" ON CONFLICT({id_column}) DO " + (f"UPDATE SET {', '.join(updates)}" if updates else "NOTHING")
+            sql = statements[cols] = sql + ";"
+        return sql
+
+    def write(batch):
+        # Consecutive rows with the same columns go through one executemany
+        group, group_cols = [], None
+        for cols, values in batch:
+            if cols != group_cols and group:
+                conn.executemany(statement(group_cols), group)
+                group = []
+            group_cols = cols
+            group.append(values)
+        if group:
+            conn.executemany(statement(group_cols), group)
+
+    conn.execute(f"PRAGMA cache_size = -{IMPORT_CACHE_KIB};")
+    drop_objects(conn, checkpoint["deferred"])
+    set_meta(conn, key, json.dumps(checkpoint))
+    conn.commit()
+
+    t0 = time.perf_counter()
+    rows_before = checkpoint["rows"]
+    batch = []
+    try:
+        for row, offset in READERS[fmt](path, checkpoint["offset"]):
+            cols, fields, convert = layout(frozenset(row))
+            if not cols:
+                continue
+            if convert:
+                batch.append((cols, tuple([parse(row[f]) for parse, f in zip(convert, fields)])))
+            else:
+                batch.append((cols, tuple([row[f] for f in fields])))
+            if len(batch) >= txn_rows:
+                write(batch)
+                checkpoint.update(offset=offset, rows=checkpoint["rows"] + len(batch),
+                                  seconds=checkpoint["seconds"] + time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                set_meta(conn, key, json.dumps(checkpoint))
+                conn.commit()
+                batch = []
+                if progress:
+                    progress(checkpoint["rows"], checkpoint["seconds"])
+        write(batch)
+        checkpoint.update(offset=stamp["size"], rows=checkpoint["rows"] + len(batch),
+                          seconds=checkpoint["seconds"] + time.perf_counter() - t0)
+        set_meta(conn, key, json.dumps(checkpoint))
+        conn.commit()
+    except (sqlite3.Error, ImportFailed) as e:
+        conn.rollback()
+        log.exception("import failed", extra={"table": table, "source": str(path), "offset": checkpoint["offset"],
+                                              "rows": checkpoint["rows"]})
+        # Leave the table usable in the meantime; resuming defers them again (a crash leaves them
+        # dropped until the import is resumed, apart from the ones create_indexes makes at start-up)
+        restore_objects(conn, checkpoint["deferred"])
+        conn.commit()
+        if table == "videos":
+            rebuild_creator_stats(conn)
+        if table in INDEXED:
+            rebuild_search(conn, table)
+        if isinstance(e, ImportFailed):
+            raise
+        raise ImportFailed(f"the transaction starting at byte {checkpoint['offset']} of {path} failed: {e} "
+                           f"({checkpoint['rows']:,} rows before it are committed and the checkpoint is kept)") from e
+
+    # Derived columns first (no index or trigger to maintain yet), then what was deferred. The
+    # creator_stats and search triggers missed every imported row, so those are rebuilt as a whole
+    t0 = time.perf_counter()
+    rescored = refresh_quality_scores(conn) if table == "videos" else 0
+    restore_objects(conn, checkpoint["deferred"])
+    create_indexes(conn)
+    if table == "videos":
+        rebuild_creator_stats(conn)
+    if table in INDEXED:
+        rebuild_search(conn, table)
+    checkpoint.update(done=True, deferred=[], seconds=checkpoint["seconds"] + time.perf_counter() - t0)
+    set_meta(conn, key, json.dumps(checkpoint))
+    conn.commit()
+
+    imported = checkpoint["rows"] - rows_before
+    summary = {
+        "table": table,
+        "source": str(path),
+        "format": fmt,
+        "rows": imported,
+        "total_rows": checkpoint["rows"],
+        "resumed": resumed,
+        "ignored_fields": sorted(ignored),
+        "quality_rescored": rescored,
+        "seconds": checkpoint["seconds"],
+        "rows_per_s": checkpoint["rows"] / checkpoint["seconds"] if checkpoint["seconds"] > 0 else None,
+    }
+    log.info("import done", extra=summary)
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stream a JSONL/CSV export into the creators or videos table")
+    parser.add_argument("table", choices=sorted(SEED_TABLES))
+    parser.add_argument("source", help="JSONL (one object per line) or CSV with a header row")
+    parser.add_argument("--db", default="app.db")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--map", action="append", default=[], metavar="FIELD=COLUMN",
+                        help="import source field FIELD into COLUMN (repeatable)")
+    parser.add_argument("--txn-rows", type=int, default=IMPORT_TXN_ROWS, help="rows per transaction / checkpoint")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and start from the top")
+    args = parser.parse_args()
+
+    from metrics import configure_logging
+    configure_logging()
+
+    rename = dict(m.split("=", 1) for m in args.map)
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA journal_mode = WAL;")
+
+    def progress(rows, seconds):
+        print(f"\r{rows:>12,} rows  {rows / seconds if seconds else 0:>10,.0f} rows/s", end="", flush=True)
+
+    try:
+        result = import_rows(conn, args.table, args.source, args.format, rename, args.txn_rows, args.restart, progress)
+    except ImportFailed as e:
+        parser.exit(1, f"\nimport failed: {e}\n")
+    finally:
+        conn.close()
+    print()
+    if result.get("skipped"):
+        print(f"{args.source} was already imported ({result['rows']:,} rows); --restart to import it again")
+    else:
+        resumed = f", resumed: {result['total_rows']:,} rows in total" if result["resumed"] else ""
+        print(f"{result['rows']:,} rows into {result['table']} ({result['rows_per_s'] or 0:,.0f} rows/s "
+              f"over {result['seconds']:.1f}s including index rebuilds{resumed})")
+        if result["ignored_fields"]:
+            print(f"ignored fields: {', '.join(result['ignored_fields'])}")
@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import inc
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+
+log = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    Small durable job system: jobs live in a SQLite `jobs` table and run on a local thread pool.
+    A handler is a function handler(payload, progress) where progress(fraction, message) records
+    how far along the job is. Jobs still queued or running when the process stopped are picked
+    up again by resume(), so handlers should be safe to re-run.
+    """
+
+    def __init__(self, pool, max_workers=JOB_WORKERS):
+        self.pool = pool
+        self.handlers = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+
+    def init_table(self):
+        with self.pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind       TEXT    NOT NULL,
+                    payload    TEXT    NOT NULL DEFAULT '{}',
+                    status     TEXT    NOT NULL DEFAULT 'queued',
+                    progress   FLOAT   NOT NULL DEFAULT 0,
+                    message    TEXT,
+                    error      TEXT,
+                    attempts   INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT    NOT NULL DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);")
+            conn.commit()
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind, payload):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        with self.pool.connection() as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (kind, payload) VALUES (?, ?)",
+                (kind, json.dumps(payload)),
+            )
+            conn.commit()
+            job_id = cur.lastrowid
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def get(self, job_id):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def resume(self):
+        """
+        Re-queue jobs left unfinished by a previous run. Returns how many were picked up.
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT job_id FROM jobs WHERE status IN ('queued', 'running') ORDER BY job_id").fetchall()
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP WHERE status = 'running'"
+            )
+            conn.commit()
+        for (job_id,) in rows:
+            self._executor.submit(self._run, job_id)
+        if rows:
+            log.info("resumed unfinished jobs", extra={"jobs": len(rows)})
+        return len(rows)
+
+    def _update(self, job_id, **fields):
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self.pool.connection() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {cols}, updated_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+                (*fields.values(), job_id),
+            )
+            conn.commit()
+
+    def _claim(self, job_id):
+        # Only one worker gets to move a job from queued to running
+        with self.pool.connection() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP "
+                "WHERE job_id = ? AND status = 'queued'",
+                (job_id,),
+            )
+            conn.commit()
+            if cur.rowcount != 1:
+                return None
+            return conn.execute("SELECT kind, payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    def _run(self, job_id):
+        row = self._claim(job_id)
+        if row is None:
+            return
+        kind, payload = row["kind"], json.loads(row["payload"])
+
+        def progress(fraction, message=None):
+            self._update(job_id, progress=max(0.0, min(1.0, float(fraction))), message=message)
+
+        try:
+            self.handlers[kind](payload, progress)
+            self._update(job_id, status="done", progress=1.0, message="done")
+            inc("jobs_total", kind=kind, status="done")
+        except Exception as e:
+            log.exception("job failed", extra={"job_id": job_id, "kind": kind})
+            self._update(job_id, status="failed", error=str(e))
+            inc("jobs_total", kind=kind, status="failed")
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
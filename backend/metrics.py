@@ -0,0 +1,196 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets in seconds: sub-millisecond SQLite reads up to multi-second full solves
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Per-request Server-Timing header (off by default: it tells clients how the time was spent)
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+
+# span name -> [total seconds, count] for the request being handled, None outside a request
+_spans = contextvars.ContextVar("metrics_spans", default=None)
+
+
+class Registry:
+    """
+    Process-local counters and histograms, rendered in the Prometheus text format.
+    Metrics are keyed by name and a sorted tuple of label pairs; gauges are callbacks
+    evaluated at scrape time (e.g. cache stats that are counted elsewhere).
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}    # name -> {labels: value}
+        self._histograms = {}  # name -> {labels: [bucket counts..., sum, count]}
+        self._gauges = {}      # name -> fn() -> number or {labels: number}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    def gauge(self, name, fn):
+        self._gauges[name] = fn
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            histograms = {n: {k: list(v) for k, v in s.items()} for n, s in self._histograms.items()}
+
+        for name in sorted(counters):
+            self._header(lines, name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_labels(key)} {value}")
+
+        for name in sorted(histograms):
+            self._header(lines, name, "histogram")
+            for key, h in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, h):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(key + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {h[-1]}")
+                lines.append(f"{name}_sum{_labels(key)} {h[-2]}")
+                lines.append(f"{name}_count{_labels(key)} {h[-1]}")
+
+        for name, fn in sorted(self._gauges.items()):
+            value = fn()
+            self._header(lines, name, "gauge")
+            if isinstance(value, dict):
+                for labels, v in sorted(value.items()):
+                    lines.append(f"{name}{_labels(tuple(sorted(labels)))} {v}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _labels(key):
+    if not key:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+
+@contextmanager
+def timed(name, span=None, **labels):
+    """
+    Time the block into histogram `name`; with span=..., also add it to the current
+    request's Server-Timing entry of that name.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        registry.observe(name, elapsed, **labels)
+        if span is not None:
+            spans = _spans.get()
+            if spans is not None:
+                entry = spans.setdefault(span, [0.0, 0])
+                entry[0] += elapsed
+                entry[1] += 1
+
+
+def start_request():
+    return _spans.set({})
+
+
+def end_request(token):
+    """
+    Stop collecting spans for this request; returns the Server-Timing header value.
+    """
+    spans = _spans.get() or {}
+    _spans.reset(token)
+    return ", ".join(
+        f'{name};dur={total * 1000:.2f};desc="{count}x"' for name, (total, count) in spans.items()
+    )
+
+
+# ---- Structured logging ----
+# Fields every LogRecord has; anything else was passed through extra= and goes into the JSON line
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg and whatever was passed as extra=.
+    """
+
+    def format(self, record):
+        out = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        out.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS})
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+
+def configure_logging(level=LOG_LEVEL):
+    """
+    Send every logger to stderr as JSON lines. Leaves an already configured root logger alone.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+registry.describe("http_requests_total", "HTTP requests by route, method and status.")
+registry.describe("http_request_duration_seconds", "Time spent in each route.")
+registry.describe("db_query_duration_seconds", "SQLite statement execution time by statement type.")
+registry.describe("thumbnail_extract_duration_seconds", "Decode + resize + encode time per video.")
+registry.describe("solver_stage_duration_seconds", "Optimiser time by solver, engine and stage (load, build, solve, write).")
+registry.describe("solver_status_total", "Optimiser outcomes by solver, engine and status.")
+registry.describe("uploads_total", "Uploaded videos by upload kind.")
+registry.describe("reopt_total", "Ad-pool re-pricing runs by mode (incremental, deferred, full).")
+registry.describe("jobs_total", "Finished background jobs by kind and status.")
+registry.describe("engagement_events_total", "Engagement events accepted by /engagement.")
+registry.describe("engagement_flush_duration_seconds", "Time to write one buffered engagement batch.")
+registry.describe("engagement_unknown_videos_total", "Buffered videos whose row no longer exists at flush time.")
+registry.describe("startup_stage_duration_seconds", "Start-up time by stage (schema, seeds, media, solve); skipped stages aren't recorded.")
+registry.describe("adrev_pool_solve_duration_seconds", "Solve time of one ad pool (measured in the worker process).")
+registry.describe("coin_cache_lookups_total", "Coin-split memo lookups by where they were answered (lru, table) or miss.")
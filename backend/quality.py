@@ -0,0 +1,115 @@
+from contextlib import nullcontext
+
+import numpy as np
+
+from creator_stats import deferred_stats
+from db import fetch_chunks, fetch_by_ids, CHUNK_ROWS
+
+# ----------------------------
+# Quality score weights (the single source for every module)
+# ----------------------------
+phi_W = 0.35  # watch completion
+phi_E = 0.25  # engagement rate
+phi_D = 0.15  # engagement diversity
+phi_R = 0.10  # rewatch
+phi_S = 0.15  # nlp quality (S)
+PHI = (phi_W, phi_E, phi_D, phi_R, phi_S)
+
+# Columns of `videos` that feed the quality score, in W, E, D, R, S, C order
+QUALITY_INPUTS = (
+    "watch_completion",
+    "engagement_rate",
+    "engagement_diversity",
+    "rewatch",
+    "nlp_quality",
+    "compliance",
+)
+
+
+def get_quality_score(W: float, E: float, D: float, R: float, S: float, C: int = 1) -> float:
+    """
+    Geometric aggregation with fixed phi's, then compliance and clamp.
+    Q_v = C * min(1, W^phi_W * E^phi_E * D^phi_D * R^phi_R * S^phi_S).
+    Inputs W,E,D,R,S should already be in [0,1]; C in {0,1}.
+
+    For detailed calculation of W,E,D,R and S, they require user specific interaction for each video, for which we will skip the calculation
+    The mathematical formula can be found in the pdf for calculation of quality score. The intention is that TikTok can calculate them
+    trivially as TikTok should easily have access to these data, (i.e. how a specific user interacts with this specific video)
+    """
+    q = (W ** phi_W) \
+        * (E ** phi_E) \
+        * (D ** phi_D) \
+        * (R ** phi_R) \
+        * (S ** phi_S)
+    return C * min(1.0, q)
+
+
+def get_quality_scores(W, E, D, R, S, C, phi=PHI):
+    """
+    Vectorised get_quality_score over whole columns (numpy arrays). phi overrides the
+    (phi_W, phi_E, phi_D, phi_R, phi_S) weights, for what-if sweeps.
+    """
+    p_W, p_E, p_D, p_R, p_S = phi
+    q = (W ** p_W) \
+        * (E ** p_E) \
+        * (D ** p_D) \
+        * (R ** p_R) \
+        * (S ** p_S)
+    return C * np.minimum(1.0, q)
+
+
+def clamp01(x: float) -> float:
+    try:
+        return max(0.0, min(1.0, float(x)))
+    except Exception:
+        return 0.0
+
+
+def clamp01_array(x) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    return np.clip(np.nan_to_num(x, nan=0.0), 0.0, 1.0)
+
+
+def quality_from_rows(data, phi=PHI):
+    """
+    Q for an (n, 6) array of QUALITY_INPUTS columns: inputs clamped to [0,1], compliance gated.
+    """
+    data = np.asarray(data, dtype=np.float64).reshape(-1, len(QUALITY_INPUTS))
+    C = (data[:, 5] == 1).astype(np.float64)
+    return get_quality_scores(*(clamp01_array(data[:, i]) for i in range(5)), C, phi)
+
+
+def refresh_quality_scores(conn, video_ids=None):
+    """
+    Recompute the materialised quality_score column from the W/E/D/R/S/C inputs, for the given
+    videos or for every video. Only rows whose score actually changed are written. A whole-table
+    refresh is streamed in chunks, keeping only the changed (id, score) pairs until the scan is
+    done. Returns the number of rows updated.
+    """
+    cols = ", ".join(QUALITY_INPUTS)
+    q = f"SELECT video_id, quality_score, {cols} FROM videos"
+    if video_ids is None:
+        blocks = fetch_chunks(conn, q)
+    else:
+        blocks = fetch_by_ids(conn, q, [int(v) for v in video_ids])
+
+    ids, scores = [], []
+    for data in blocks:
+        Q = quality_from_rows(data[:, 2:])
+        changed = ~np.isclose(Q, data[:, 1], rtol=0.0, atol=1e-12)
+        ids.append(data[changed, 0].astype(np.int64))
+        scores.append(Q[changed])
+    if not ids:
+        return 0
+    ids, scores = np.concatenate(ids), np.concatenate(scores)
+    if not len(ids):
+        return 0
+    # A whole-table refresh recomputes creator_stats once instead of by trigger per row
+    with deferred_stats(conn) if video_ids is None else nullcontext():
+        for start in range(0, len(ids), CHUNK_ROWS):
+            conn.executemany(
+                "UPDATE videos SET quality_score = ?, row_version = row_version + 1 WHERE video_id = ?;",
+                zip(scores[start:start + CHUNK_ROWS].tolist(), ids[start:start + CHUNK_ROWS].tolist()),
+            )
+    conn.commit()
+    return len(ids)
@@ -0,0 +1,101 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Debounce window: every mark_dirty() inside this many seconds is folded into one solve
+REOPT_WINDOW_S = float(os.environ.get("REOPT_WINDOW_S", "2.0"))
+
+log = logging.getLogger(__name__)
+
+
+class ReoptScheduler:
+    """
+    Coalesces ad-pool re-solves. Writers call mark_dirty(); the first call arms a timer and
+    every further call inside the window is absorbed by it. Only one solve runs at a time;
+    if the allocation is marked dirty again while a solve is running, another solve is
+    scheduled one window after it finishes. So solver CPU is capped at one solve per window.
+
+    Readers use status() to get the last committed allocation version and whether a newer
+    one is pending.
+    """
+
+    def __init__(self, solve_fn, window=REOPT_WINDOW_S):
+        self._solve_fn = solve_fn
+        self.window = window
+        self._lock = threading.Lock()
+        self._solve_lock = threading.Lock()  # only one solve at a time
+        self._timer = None
+        self._dirty = False
+        self._dirty_since = None
+        self._running = False
+        self.version = 0
+        self.committed_at = None
+        self.last_error = None
+
+    def mark_dirty(self):
+        with self._lock:
+            self._dirty = True
+            if self._dirty_since is None:
+                self._dirty_since = time.time()
+            if self._timer is None and not self._running:
+                self._arm()
+
+    def run_now(self):
+        """
+        Solve synchronously (used at startup). Cancels a pending timer, waits for a running solve.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._dirty = True
+        self._run()
+
+    def status(self):
+        with self._lock:
+            stale = self._dirty or self._running
+            return {
+                "allocation_version": self.version,
+                "allocation_committed_at": (
+                    datetime.fromtimestamp(self.committed_at, timezone.utc).isoformat() if self.committed_at else None
+                ),
+                "allocation_stale": stale,
+                "allocation_stale_for_s": round(time.time() - self._dirty_since, 3) if stale and self._dirty_since else 0.0,
+            }
+
+    def _arm(self):
+        # caller holds self._lock
+        self._timer = threading.Timer(self.window, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self):
+        with self._solve_lock:
+            with self._lock:
+                self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                self._running = True
+                dirty_since = self._dirty_since
+                self._dirty_since = None
+            try:
+                self._solve_fn()
+                with self._lock:
+                    self.version += 1
+                    self.committed_at = time.time()
+                    self.last_error = None
+            except Exception as e:
+                log.exception("ad-pool re-solve failed")
+                with self._lock:
+                    # keep it dirty; the next mark_dirty() retries
+                    self._dirty = True
+                    self._dirty_since = self._dirty_since or dirty_since
+                    self.last_error = str(e)
+            finally:
+                with self._lock:
+                    self._running = False
+                    if self._dirty and self.last_error is None and self._timer is None:
+                        self._arm()
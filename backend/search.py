@@ -0,0 +1,206 @@
+import logging
+import re
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+# Typeahead search over creator names and video titles: FTS5 indexes that point back at the
+# creators / videos rows (external content, so the text isn't stored twice), kept current by
+# triggers on those tables. Creator names also get a trigram index, which finds substrings and
+# one-typo matches when the prefix search comes up empty.
+
+# Results per kind, by default and at most
+SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+# Every match is ranked up to RANK_ALL matches. Past that (a one- or two-letter prefix over a large
+# catalogue) only matches among the CANDIDATES most followed / viewed rows are, found through the
+# popularity index; at that density they hold the top results
+RANK_ALL = 50_000
+CANDIDATES = 1000
+# Query lengths (characters) the trigram fallback runs for
+FUZZY_MIN_CHARS = 4
+FUZZY_MAX_CHARS = 16
+
+# kind -> (FTS table, source table, id column, text column, popularity column, extra result columns)
+KINDS = {
+    "creators": ("creator_search", "creators", "creator_id", "name", "followers", ()),
+    "videos": ("video_search", "videos", "video_id", "title", "views", ("creator_id",)),
+}
+TRIGRAM_TABLE = "creator_names_trigram"
+# source table -> FTS tables indexing its text column
+INDEXED = {"creators": ("creator_search", TRIGRAM_TABLE), "videos": ("video_search",)}
+# unicode61 keeps letters and digits; 1-4 character prefixes are indexed, longer ones are merged
+TOKENIZE = "unicode61 remove_diacritics 2"
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def init_search(conn):
+    """
+    Create the search indexes and the triggers that keep them in sync, then index the current rows.
+    """
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS creator_search USING fts5("
+        f"name, content='creators', content_rowid='creator_id', tokenize='{TOKENIZE}', prefix='1 2 3 4');"
+    )
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS video_search USING fts5("
+        f"title, content='videos', content_rowid='video_id', tokenize='{TOKENIZE}', prefix='1 2 3 4');"
+    )
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TRIGRAM_TABLE} USING fts5("
+        f"name, content='creators', content_rowid='creator_id', tokenize='trigram', detail='none');"
+    )
+    for table, fts_tables in INDEXED.items():
+        _, _, id_column, column, _, _ = KINDS[table]
+        add = " ".join(f"INSERT INTO {f} (rowid, {column}) VALUES (new.{id_column}, new.{column});" for f in fts_tables)
+        remove = " ".join(
+            f"INSERT INTO {f} ({f}, rowid, {column}) VALUES ('delete', old.{id_column}, old.{column});" for f in fts_tables
+        )
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN {add} END;")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {remove} END;")
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {column} ON {table} "
+            f"BEGIN {remove} {add} END;"
+        )
+    for table in INDEXED:
+        rebuild_search(conn, table)
+
+
+def rebuild_search(conn, table):
+    """
+    Re-index every row of creators or videos (after writes that bypassed the triggers).
+    """
+    for fts in INDEXED[table]:
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild');")
+    conn.commit()
+    log.info("search index rebuilt", extra={"table": table})
+
+
+def tokens(text):
+    return _TOKEN.findall(text.lower())
+
+
+def match_query(words):
+    """
+    FTS5 query for typeahead: every word must match, the last one as a prefix. Words are quoted,
+    so nothing typed is FTS5 syntax.
+    """
+    return " ".join(f'"{w}"' for w in words) + "*"
+
+
+def _prefix_search(conn, kind, words, limit):
+    fts, table, id_column, column, popularity, extra = KINDS[kind]
+    query = match_query(words)
+    typed = " ".join(words)
+    names = (id_column, column, popularity, *extra)
+    columns = ", ".join(f"s.{c}" for c in names)
+    # Names / titles that start with what was typed first, then the most followed / viewed
+    order = f"ORDER BY substr(lower(s.{column}), 1, ?) = ? DESC, s.{popularity} DESC, s.{id_column} DESC LIMIT ?"
+    params = (len(typed), typed, limit)
+    (matches,) = conn.execute(
+        f"SELECT count(*) FROM (SELECT rowid FROM {fts} WHERE {fts} MATCH ? LIMIT ?)", (query, RANK_ALL + 1)
+    ).fetchone()
+    rows = []
+    if matches > RANK_ALL:
+        rows = conn.execute(
+            f"SELECT {columns} FROM (SELECT {', '.join(names)} FROM {table} ORDER BY {popularity} DESC LIMIT ?) s "
+            f"WHERE EXISTS (SELECT 1 FROM {fts} WHERE {fts} MATCH ? AND rowid = s.{id_column}) {order}",
+            (CANDIDATES, query, *params),
+        ).fetchall()
+    # Too few of the popular rows match: rank them all after all
+    if len(rows) < limit:
+        rows = conn.execute(
+            f"SELECT {columns} FROM {fts} m JOIN {table} s ON s.{id_column} = m.rowid "
+            f"WHERE {fts} MATCH ? {order}",
+            (query, *params),
+        ).fetchall()
+    return [{**dict(zip(names, row)), "match": "prefix"} for row in rows]
+
+
+def fuzzy_patterns(typed):
+    """
+    LIKE patterns for the trigram index: the text anywhere in the name, then with one character
+    substituted, missing or extra in its last word (a typo in an earlier word already emptied the
+    results while that word was being typed). Patterns without a 3-character literal run are
+    skipped, since the trigram index can't narrow those down.
+    """
+    exact = [f"%{typed}%"]
+    edits = []
+    for i in range(typed.rfind(" ") + 1, len(typed)):
+        edits.append(f"%{typed[:i]}_{typed[i + 1:]}%")  # substituted
+        edits.append(f"%{typed[:i]}{typed[i + 1:]}%")   # typed an extra character
+        edits.append(f"%{typed[:i]}_{typed[i:]}%")      # left one out
+    usable = [p for p in dict.fromkeys(edits) if max(len(run) for run in re.split(r"[%_]", p)) >= 3]
+    return exact, usable
+
+
+def _fuzzy_creators(conn, words, limit):
+    typed = " ".join(words)
+    if not FUZZY_MIN_CHARS <= len(typed) <= FUZZY_MAX_CHARS:
+        return []
+    found = {}
+    for match, patterns in zip(("substring", "fuzzy"), fuzzy_patterns(typed)):
+        for pattern in patterns:
+            for (creator_id,) in conn.execute(
+                f"SELECT rowid FROM {TRIGRAM_TABLE} WHERE name LIKE ? LIMIT ?", (pattern, limit)
+            ):
+                found.setdefault(creator_id, match)
+            if len(found) >= limit:
+                break
+        # One-typo matches only when the text itself isn't anywhere
+        if found:
+            break
+    if not found:
+        return []
+    ids = list(found)
+    rows = conn.execute(
+        f"SELECT creator_id, name, followers FROM creators WHERE creator_id IN ({', '.join('?' for _ in ids)}) "
+        "ORDER BY followers DESC, creator_id DESC LIMIT ?",
+        (*ids, limit),
+    ).fetchall()
+    return [{"creator_id": c, "name": n, "followers": f, "match": found[c]} for c, n, f in rows]
+
+
+def search(conn, text, kinds=tuple(KINDS), limit=SEARCH_LIMIT, fuzzy=True):
+    """
+    Typeahead results for `text`: {kind: [rows]} for each of kinds ("creators", "videos"), at most
+    `limit` each. Creators that no prefix matches fall back to the trigram index with fuzzy=True.
+    """
+    words = tokens(text)
+    results = {}
+    for kind in kinds:
+        rows = _prefix_search(conn, kind, words, limit) if words else []
+        if fuzzy and kind == "creators" and words and not rows:
+            rows = _fuzzy_creators(conn, words, limit)
+        results[kind] = rows
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Query the creator / video search indexes, or rebuild them")
+    parser.add_argument("query", nargs="?", help="text to search for (omit with --rebuild)")
+    parser.add_argument("--db", default="app.db")
+    parser.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    parser.add_argument("--rebuild", action="store_true", help="re-index every creator and video")
+    args = parser.parse_args()
+
+    from metrics import configure_logging
+    configure_logging()
+
+    conn = sqlite3.connect(args.db)
+    if args.rebuild:
+        for table in INDEXED:
+            rebuild_search(conn, table)
+    if args.query:
+        t0 = time.perf_counter()
+        results = search(conn, args.query, limit=args.limit)
+        elapsed = time.perf_counter() - t0
+        for kind, rows in results.items():
+            print(f"{kind}:")
+            for row in rows:
+                print("  ", row)
+        print(f"{elapsed * 1000:.2f} ms")
+    conn.close()
@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+from bootstrap import migrate
+from db import ConnectionPool
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """
+    A migrated, empty database (the full schema with its triggers), as start-up leaves it.
+    """
+    conn = sqlite3.connect(tmp_path / "test.db")
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def app_module(conn, tmp_path, monkeypatch):
+    """
+    The app module serving the test database, with its media under tmp_path. It is imported
+    without start-up (APP_STARTUP=0), which would write to the repo's static directories.
+    """
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    monkeypatch.setenv("APP_STARTUP", "0")
+    monkeypatch.setenv("APP_DB_PATH", path)
+    monkeypatch.setenv("LOG_LEVEL", "WARNING")
+    import app
+
+    # Only the first test's import reads APP_DB_PATH; the routes look the pool up on every request
+    monkeypatch.setattr(app, "pool", ConnectionPool(path, size=2))
+    monkeypatch.setattr(app, "THUMBNAILS_DIR", tmp_path / "thumbnails")
+    monkeypatch.setattr(app, "SPRITES_DIR", tmp_path / "thumbnails" / "sprites")
+    app.thumb_cache.clear()
+    app.video_data_cache.clear()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,289 @@
+import numpy as np
+import pytest
+
+import adrev_opti
+from adrev_opti import (
+    P, DRIFT_TOL, lambda_fair, lambda_eff, solve_allocation, solve_allocation_gurobi, allocation_objective,
+    get_allocation_weights, get_payout_bounds, get_optimised_values, load_allocation_inputs, IncrementalAllocator,
+)
+from creator_stats import check_creator_stats
+
+# Relative tolerance of the budget and of the KKT stationarity checks
+RTOL = 1e-7
+
+
+def random_case(seed, n=200, noncompliant=0.2):
+    rng = np.random.default_rng(seed)
+    views = rng.integers(1, 100_000, n).astype(np.float64)
+    Q = rng.random(n)
+    C = (rng.random(n) >= noncompliant).astype(np.int8)
+    _, s, w = get_allocation_weights(views, Q, C)
+    return s, w, C
+
+
+def gradient(p, s, w, pool=P):
+    # d/dp_v of the objective; p_v > 0 wherever w_v > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fair = np.where(w > 0, lambda_fair * w / p, 0.0)
+    return fair + lambda_eff * s / pool
+
+
+def assert_kkt(p, mu, s, w, lb, ub, pool=P):
+    assert p.sum() == pytest.approx(pool, rel=RTOL)
+    assert np.all(p >= lb - 1e-12)
+    assert np.all(p <= ub + 1e-12)
+    g = gradient(p, s, w, pool)
+    at_lb = np.isclose(p, lb, rtol=1e-9, atol=1e-12)
+    at_ub = np.isclose(p, ub, rtol=1e-9, atol=1e-12)
+    free = ~at_lb & ~at_ub & (w > 0)
+    # Stationary inside the bounds, can't gain by moving off a bound
+    np.testing.assert_allclose(g[free], mu, rtol=1e-6)
+    assert np.all(g[at_lb & ~at_ub] <= mu * (1 + 1e-6))
+    assert np.all(g[at_ub & ~at_lb] >= mu * (1 - 1e-6))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_kkt_with_default_bounds(seed):
+    s, w, C = random_case(seed)
+    lb, ub = get_payout_bounds(C)
+    p, mu = solve_allocation(s, w, lb, ub)
+    assert mu > 0
+    assert np.all(p[C != 1] == 0)
+    assert_kkt(p, mu, s, w, lb, ub)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_kkt_with_floors_and_caps(seed):
+    s, w, C = random_case(seed, noncompliant=0.0)
+    n = len(s)
+    lb = np.full(n, 0.5 * P / n)
+    ub = np.full(n, 1.5 * P / n)
+    p, mu = solve_allocation(s, w, lb, ub)
+    # Both kinds of bound are active somewhere, so the checks above aren't vacuous
+    assert np.isclose(p, lb).any() and np.isclose(p, ub).any()
+    assert_kkt(p, mu, s, w, lb, ub)
+
+
+def test_warm_start_matches_cold_solve():
+    s, w, C = random_case(7)
+    lb, ub = get_payout_bounds(C)
+    p, mu = solve_allocation(s, w, lb, ub)
+    p_warm, mu_warm = solve_allocation(s, w, lb, ub, mu0=mu * 1.3)
+    assert mu_warm == pytest.approx(mu, rel=1e-9)
+    np.testing.assert_allclose(p_warm, p, rtol=1e-7)
+
+
+def test_zero_weight_videos_stay_on_their_floor():
+    s = np.array([0.5, 0.3, 0.2, 0.0])
+    w = np.array([0.6, 0.4, 0.0, 0.0])
+    lb = np.full(4, 1.0)
+    ub = np.full(4, np.inf)
+    p, mu = solve_allocation(s, w, lb, ub)
+    assert p[2] == 1.0 and p[3] == 1.0
+    assert_kkt(p, mu, s, w, lb, ub)
+
+
+def test_all_zero_shares_are_rejected():
+    s = np.zeros(5)
+    w = np.zeros(5)
+    lb, ub = np.zeros(5), np.full(5, np.inf)
+    with pytest.raises(ValueError, match="No eligible videos"):
+        solve_allocation(s, w, lb, ub)
+    with pytest.raises(ValueError, match="M_total=0"):
+        get_allocation_weights(np.zeros(5), np.ones(5), np.ones(5, dtype=np.int8))
+
+
+def test_equal_bounds_pin_every_payout():
+    s, w, _ = random_case(3, n=10, noncompliant=0.0)
+    lb = ub = np.full(10, P / 10)
+    p, mu = solve_allocation(s, w, lb, ub)
+    np.testing.assert_allclose(p, lb)
+    assert mu == 0.0
+
+
+def test_capped_videos_leave_the_rest_to_zero_weight_videos():
+    s = np.array([0.6, 0.4, 0.0])
+    w = np.array([0.7, 0.5, 0.0])
+    lb = np.zeros(3)
+    ub = np.array([100.0, 100.0, np.inf])
+    p, mu = solve_allocation(s, w, lb, ub, pool=1000.0)
+    np.testing.assert_allclose(p, [100.0, 100.0, 800.0])
+    assert mu == 0.0
+
+
+def test_pool_below_the_floors_is_infeasible():
+    s, w, _ = random_case(1, n=10, noncompliant=0.0)
+    lb = np.full(10, P / 5)
+    with pytest.raises(ValueError, match="minimum payouts"):
+        solve_allocation(s, w, lb, np.full(10, np.inf))
+
+
+def test_pool_above_the_caps_is_infeasible():
+    s, w, _ = random_case(1, n=10, noncompliant=0.0)
+    with pytest.raises(ValueError, match="payout caps"):
+        solve_allocation(s, w, np.zeros(10), np.full(10, P / 20))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_agrees_with_gurobi(seed):
+    gp = pytest.importorskip("gurobipy")
+    # Small enough for a size-limited licence
+    s, w, C = random_case(seed, n=100)
+    lb, ub = get_payout_bounds(C)
+    p, _ = solve_allocation(s, w, lb, ub)
+    try:
+        p_grb, _ = solve_allocation_gurobi(np.arange(len(s)), s, w, C, np.zeros(len(s)), np.full(len(s), np.inf))
+    except gp.GurobiError as e:
+        pytest.skip(f"no usable Gurobi licence: {e}")
+    assert p_grb is not None
+    assert p_grb.sum() == pytest.approx(P, rel=1e-6)
+    # The PWL log (60 breakpoints) moves individual payouts by at most a few percent of the pool
+    assert np.abs(p - p_grb).max() <= 0.03 * P
+    # Scored on the exact objective, the exact optimum is never beaten and Gurobi comes close
+    exact = allocation_objective(p, s, w)
+    approx = allocation_objective(p_grb, s, w)
+    assert approx <= exact + 1e-9
+    assert approx == pytest.approx(exact, rel=2e-3)
+
+
+def test_compare_engines_loads_the_inputs_once(conn, monkeypatch):
+    gp = pytest.importorskip("gurobipy")
+    rng = np.random.default_rng(4)
+    conn.executemany(
+        "INSERT INTO videos (title, views, watch_completion, compliance) VALUES ('v', ?, ?, 1)",
+        [(int(rng.integers(100, 50_000)), float(rng.random())) for _ in range(50)],
+    )
+    conn.commit()
+    loads = []
+
+    def load(conn):
+        loads.append(1)
+        return load_allocation_inputs(conn)
+
+    monkeypatch.setattr(adrev_opti, "load_allocation_inputs", load)
+    try:
+        report = adrev_opti.compare_engines(conn)
+    except (gp.GurobiError, RuntimeError) as e:
+        pytest.skip(f"no usable Gurobi licence: {e}")
+    assert loads == [1]
+    assert report["max_pct_of_pool_diff"] <= 0.03
+    assert report["objective_gurobi_exact"] <= report["objective_numpy"] + 1e-9
+
+
+# ---- IncrementalAllocator ----
+
+def add_videos(conn, views, compliance=1):
+    for v in views:
+        conn.execute("INSERT INTO videos (title, views, compliance) VALUES ('v', ?, ?)", (int(v), compliance))
+    conn.commit()
+    return conn.execute("SELECT max(video_id) FROM videos").fetchone()[0]
+
+
+def stored_payouts(conn):
+    rows = conn.execute("SELECT video_id, proj_earnings FROM videos ORDER BY video_id").fetchall()
+    return np.array([r[0] for r in rows]), np.array([r[1] for r in rows])
+
+
+def test_incremental_update_tracks_a_full_resolve(conn):
+    add_videos(conn, np.random.default_rng(0).integers(100, 10_000, 200))
+    allocator = IncrementalAllocator(drift_tol=0.05)
+    allocator.full_solve(conn)
+
+    video_id = add_videos(conn, [3000])
+    assert allocator.update(conn, video_id) == "incremental"
+    drift = allocator.drift
+    assert 0 < drift < 0.05
+    ids, incremental = stored_payouts(conn)
+    np.testing.assert_array_equal(allocator.video_ids, ids)
+    np.testing.assert_allclose(allocator.payouts, incremental)
+
+    # A full solve of the same data moves every payout (the new one included) by about the drift
+    full = get_optimised_values(conn, persist=False)
+    np.testing.assert_array_equal(full.video_ids, ids)
+    np.testing.assert_allclose(incremental, full.payouts, rtol=2 * drift)
+
+    # ... and after the re-solve the allocator holds exactly what solve_allocation gives
+    allocator.full_solve(conn)
+    _, views, Q, C = load_allocation_inputs(conn)
+    _, s, w = get_allocation_weights(views, Q, C)
+    p, mu = solve_allocation(s, w, *get_payout_bounds(C))
+    assert allocator.drift == 0.0 and allocator.mu == pytest.approx(mu)
+    np.testing.assert_allclose(allocator.payouts, p)
+    np.testing.assert_allclose(stored_payouts(conn)[1], p)
+
+
+def test_incremental_update_falls_back_to_a_full_solve(conn):
+    add_videos(conn, [1000] * 50)
+    allocator = IncrementalAllocator(drift_tol=0.01)
+    allocator.full_solve(conn)
+    version = allocator.version
+    # One video with as many views as all the others moves far more than 1% of the mass
+    video_id = add_videos(conn, [50_000])
+    assert allocator.update(conn, video_id, defer_full=True) == "deferred"
+    assert allocator.version == version
+    assert allocator.update(conn, video_id) == "full"
+    assert allocator.version > version and allocator.drift == 0.0
+    assert video_id in allocator.video_ids
+
+
+def test_record_drift_triggers_past_drift_tol(conn):
+    # 200 videos with the same Q: mass moves in proportion to views
+    add_videos(conn, [1000] * 200)
+    allocator = IncrementalAllocator(drift_tol=DRIFT_TOL)
+    allocator.full_solve(conn)
+    M_total = allocator.M_total
+    per_view = M_total / 200_000
+
+    # Just under the tolerance: 90% of it in views added to one video
+    extra = int(0.9 * DRIFT_TOL * 200_000)
+    conn.execute("UPDATE videos SET views = views + ? WHERE video_id = 1", (extra,))
+    assert allocator.record_drift(conn, [1]) is False
+    assert allocator.moved == pytest.approx(extra * per_view)
+    assert allocator.drift < DRIFT_TOL
+
+    # Another 20% of it on a second video crosses it
+    conn.execute("UPDATE videos SET views = views + ? WHERE video_id = 2", (int(0.2 * DRIFT_TOL * 200_000),))
+    assert allocator.record_drift(conn, [2]) is True
+    assert allocator.drift > DRIFT_TOL
+
+    # Videos the last solve hasn't seen don't count (update() prices them)
+    video_id = add_videos(conn, [100_000])
+    moved = allocator.moved
+    allocator.record_drift(conn, [video_id])
+    assert allocator.moved == moved
+
+
+def test_record_drift_without_a_full_solve(conn):
+    add_videos(conn, [1000] * 3)
+    allocator = IncrementalAllocator()
+    assert allocator.record_drift(conn, [1]) is True
+    assert allocator.record_drift(conn, []) is False
+
+
+# ---- Chunked load and write-back ----
+
+def test_tiny_chunks_load_and_persist_the_same_allocation(conn, monkeypatch):
+    rng = np.random.default_rng(3)
+    conn.executemany(
+        "INSERT INTO videos (title, creator_id, views, watch_completion, nlp_quality, compliance) VALUES ('v', ?, ?, ?, ?, ?)",
+        [(int(rng.integers(1, 6)), int(rng.integers(100, 50_000)), float(rng.random()), float(rng.random()),
+          int(rng.random() > 0.1)) for _ in range(103)],
+    )
+    conn.commit()
+    whole = load_allocation_inputs(conn)
+    for a, b in zip(whole, load_allocation_inputs(conn, chunk_rows=7)):
+        np.testing.assert_array_equal(a, b)
+
+    expected = get_optimised_values(conn, engine="numpy")
+    stored = stored_payouts(conn)
+    monkeypatch.setattr(adrev_opti, "CHUNK_ROWS", 7)
+    chunked = get_optimised_values(conn, engine="numpy")
+    np.testing.assert_array_equal(chunked.payouts, expected.payouts)
+    assert chunked.version == expected.version + 1
+    ids, payouts = stored_payouts(conn)
+    np.testing.assert_array_equal(ids, stored[0])
+    np.testing.assert_array_equal(payouts, stored[1])
+    # Every row was written, once per persist
+    assert conn.execute("SELECT min(allocation_version), max(allocation_version), min(row_version), "
+                        "max(row_version) FROM videos").fetchone() == (chunked.version, chunked.version, 2, 2)
+    assert check_creator_stats(conn) == []
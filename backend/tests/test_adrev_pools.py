@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import adrev_pools
+from adrev_pools import create_pool, solve_pools
+
+
+def add_videos(conn, n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [
+        (int(views), *map(float, rng.random(5)), int(compliant))
+        for views, compliant in zip(rng.integers(100, 50_000, n), rng.random(n) > 0.1)
+    ]
+    conn.executemany(
+        "INSERT INTO videos (title, views, watch_completion, engagement_rate, engagement_diversity, rewatch, "
+        "nlp_quality, compliance) VALUES ('v', ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    return [r[0] for r in conn.execute("SELECT video_id FROM videos ORDER BY video_id")]
+
+
+def add_pools(conn, ids):
+    # Three regions, plus a campaign pool overlapping two of them
+    pools = {
+        create_pool(conn, "eu", 500.0, video_ids=ids[:120]): 500.0,
+        create_pool(conn, "us", 1200.0, video_ids=ids[120:260]): 1200.0,
+        create_pool(conn, "apac", 80.0, lam_fair=0.3, lam_eff=0.7, video_ids=ids[260:]): 80.0,
+        create_pool(conn, "campaign", 250.0, pool_alpha=0.5, video_ids=ids[100:140]): 250.0,
+    }
+    return pools
+
+
+def test_each_pool_pays_out_its_budget(conn):
+    budgets = add_pools(conn, add_videos(conn, 300))
+    results = solve_pools(conn, max_workers=1)
+    assert results.keys() == budgets.keys()
+    for pool_id, r in results.items():
+        assert r.status == "optimal" and r.version is not None
+        assert r.payouts.sum() == pytest.approx(budgets[pool_id], rel=1e-7)
+        stored = conn.execute("SELECT total(payout) FROM ad_pool_members WHERE pool_id = ?", (pool_id,)).fetchone()[0]
+        assert stored == pytest.approx(budgets[pool_id], rel=1e-7)
+
+
+def test_parallel_solve_equals_serial(conn, monkeypatch):
+    add_pools(conn, add_videos(conn, 300))
+    serial = solve_pools(conn, max_workers=1, persist=False)
+    # Small enough to be solved inline otherwise
+    monkeypatch.setattr(adrev_pools, "PARALLEL_MIN_ROWS", 0)
+    parallel = solve_pools(conn, max_workers=2, persist=False)
+    assert serial.keys() == parallel.keys()
+    for pool_id, r in serial.items():
+        np.testing.assert_array_equal(r.video_ids, parallel[pool_id].video_ids)
+        np.testing.assert_array_equal(r.payouts, parallel[pool_id].payouts)
+        assert r.objective == parallel[pool_id].objective
+
+
+def test_video_in_two_pools_keeps_both_allocations(conn):
+    ids = add_videos(conn, 300)
+    budgets = add_pools(conn, ids)
+    results = solve_pools(conn)
+    shared = ids[110]
+    rows = conn.execute(
+        "SELECT pool_id, payout, rev_prop, allocation_version FROM ad_pool_members WHERE video_id = ? ORDER BY pool_id",
+        (shared,),
+    ).fetchall()
+    assert len(rows) == 2
+    for pool_id, payout, rev_prop, version in rows:
+        r = results[pool_id]
+        expected = r.payouts[list(r.video_ids).index(shared)]
+        assert (payout, version) == (pytest.approx(expected), r.version)
+        assert rev_prop == pytest.approx(expected / budgets[pool_id])
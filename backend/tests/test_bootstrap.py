@@ -0,0 +1,76 @@
+import json
+
+from bootstrap import get_meta, set_meta, sync_seeds
+
+
+def write_seeds(seed_dir, videos, creators=()):
+    seed_dir.mkdir(exist_ok=True)
+    (seed_dir / "videos_init.json").write_text(json.dumps(list(videos)))
+    (seed_dir / "creators_init.json").write_text(json.dumps(list(creators)))
+    return seed_dir
+
+
+def seed_video(title, views=100):
+    return {"creator_id": 1, "title": title, "views": views, "not_a_column": 1}
+
+
+def videos(conn):
+    return conn.execute("SELECT video_id, title, views, row_version FROM videos ORDER BY video_id").fetchall()
+
+
+def test_seeds_apply_once(conn, tmp_path):
+    seed_dir = write_seeds(tmp_path / "seeds", [seed_video("a"), seed_video("b")], [{"name": "c", "followers": 3}])
+    assert sync_seeds(conn, seed_dir) == ["videos", "creators"]
+    assert [(v[0], v[1]) for v in videos(conn)] == [(1, "a"), (2, "b")]
+    assert sync_seeds(conn, seed_dir) == []
+
+
+def test_changed_seed_never_overwrites_uploads(conn, tmp_path):
+    seed_dir = write_seeds(tmp_path / "seeds", [seed_video("a"), seed_video("b")])
+    sync_seeds(conn, seed_dir)
+    # An upload takes id 3; engagement moves seed video 1
+    conn.execute("INSERT INTO videos (title, views) VALUES ('upload', 7)")
+    conn.execute("UPDATE videos SET views = 150 WHERE video_id = 1")
+    conn.commit()
+    before = videos(conn)
+
+    # The seed file gains a row (at the upload's id) and edits its second row
+    write_seeds(seed_dir, [seed_video("a"), seed_video("b2", 200), seed_video("c")])
+    assert sync_seeds(conn, seed_dir) == ["videos"]
+    after = videos(conn)
+    assert after[2] == before[2] == (3, "upload", 7, before[2][3])
+    assert after[1][:3] == (2, "b2", 200) and after[1][3] == before[1][3] + 1
+    # Unchanged seed rows aren't rewritten
+    assert after[0] == before[0]
+    assert len(after) == 3
+
+    # Reordered: only seed-owned rows change
+    write_seeds(seed_dir, [seed_video("b2", 200), seed_video("a"), seed_video("c")])
+    sync_seeds(conn, seed_dir)
+    assert [v[1] for v in videos(conn)] == ["b2", "a", "upload"]
+
+
+def test_seeds_applied_before_ownership_was_recorded(conn, tmp_path):
+    seed_dir = write_seeds(tmp_path / "seeds", [seed_video("a"), seed_video("b")])
+    sync_seeds(conn, seed_dir)
+    # As an older version left it: the file digest, no seed_rows entry
+    conn.execute("DELETE FROM meta WHERE key LIKE 'seed_rows:%'")
+    conn.commit()
+    assert sync_seeds(conn, seed_dir) == []
+    assert json.loads(get_meta(conn, "seed_rows:videos_init.json")).keys() == {"1", "2"}
+
+    write_seeds(seed_dir, [seed_video("a"), seed_video("b", 999)])
+    sync_seeds(conn, seed_dir)
+    assert videos(conn)[1][2] == 999
+
+
+def test_deleted_seed_rows_come_back_only_with_a_changed_file(conn, tmp_path):
+    seed_dir = write_seeds(tmp_path / "seeds", [seed_video("a"), seed_video("b")])
+    sync_seeds(conn, seed_dir)
+    conn.execute("DELETE FROM videos WHERE video_id = 2")
+    conn.commit()
+    assert sync_seeds(conn, seed_dir) == []
+    assert [v[0] for v in videos(conn)] == [1]
+    set_meta(conn, "seed:videos_init.json", "stale")
+    sync_seeds(conn, seed_dir)
+    assert [v[0] for v in videos(conn)] == [1, 2]
@@ -0,0 +1,113 @@
+import sqlite3
+
+import pytest
+
+from creator_stats import TRIGGERS, check_creator_stats, deferred_stats, get_creator_stats, rebuild_creator_stats
+
+
+def add_video(conn, creator_id, views=100, proj_earnings=1.5, quality_score=0.5, norm_coins=10, prem_coins=4,
+              x_n=0.5, x_p=0.75):
+    cur = conn.execute(
+        "INSERT INTO videos (title, creator_id, views, proj_earnings, quality_score, norm_coins, prem_coins, x_n, x_p) "
+        "VALUES ('v', ?, ?, ?, ?, ?, ?, ?, ?)",
+        (creator_id, views, proj_earnings, quality_score, norm_coins, prem_coins, x_n, x_p),
+    )
+    return cur.lastrowid
+
+
+def triggers(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'creator_stats%'")}
+
+
+def test_insert(conn):
+    for creator_id in (1, 1, 2):
+        add_video(conn, creator_id)
+    assert check_creator_stats(conn) == []
+    stats = get_creator_stats(conn, 1)
+    assert (stats["videos"], stats["views"], stats["norm_coins"], stats["prem_coins"]) == (2, 200, 20, 8)
+    assert stats["proj_earnings"] == pytest.approx(3.0)
+    assert stats["coins_paid"] == pytest.approx(2 * (0.5 * 10 + 0.75 * 4))
+    assert stats["mean_quality"] == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("assignment", [
+    "views = views + 7",
+    "proj_earnings = proj_earnings * 3",
+    "quality_score = 0.9",
+    "norm_coins = norm_coins + 5, prem_coins = 0",
+    "x_n = 0.1, x_p = 0.2",
+])
+def test_update(conn, assignment):
+    ids = [add_video(conn, creator_id) for creator_id in (1, 1, 2)]
+    conn.execute(f"UPDATE videos SET {assignment} WHERE video_id = ?", (ids[0],))
+    assert check_creator_stats(conn) == []
+    # Every row at once, as the optimisers' write-backs do
+    conn.execute(f"UPDATE videos SET {assignment}")
+    assert check_creator_stats(conn) == []
+
+
+def test_update_of_unwatched_columns_leaves_the_totals_alone(conn):
+    video_id = add_video(conn, 1)
+    conn.execute("UPDATE videos SET title = 'renamed', likes = 5 WHERE video_id = ?", (video_id,))
+    assert check_creator_stats(conn) == []
+
+
+def test_reassigning_a_video_moves_its_totals(conn):
+    first, second = add_video(conn, 1), add_video(conn, 1, views=50)
+    conn.execute("UPDATE videos SET creator_id = 2 WHERE video_id = ?", (first,))
+    assert check_creator_stats(conn) == []
+    assert (get_creator_stats(conn, 1)["views"], get_creator_stats(conn, 2)["views"]) == (50, 100)
+    # Moved and changed in the same statement; then the last video leaves creator 1
+    conn.execute("UPDATE videos SET creator_id = 3, views = 60 WHERE video_id = ?", (second,))
+    assert check_creator_stats(conn) == []
+    assert conn.execute("SELECT videos, views FROM creator_stats WHERE creator_id = 1").fetchone() == (0, 0)
+
+
+def test_delete(conn):
+    ids = [add_video(conn, creator_id) for creator_id in (1, 1, 2)]
+    conn.execute("DELETE FROM videos WHERE video_id = ?", (ids[0],))
+    assert check_creator_stats(conn) == []
+    conn.execute("DELETE FROM videos WHERE creator_id = 2")
+    assert check_creator_stats(conn) == []
+    assert get_creator_stats(conn, 1)["videos"] == 1
+
+
+def test_bulk_import_inside_deferred_stats(conn):
+    add_video(conn, 1)
+    conn.commit()
+    with deferred_stats(conn):
+        assert triggers(conn) == set()
+        conn.executemany(
+            "INSERT INTO videos (title, creator_id, views, proj_earnings) VALUES ('v', ?, ?, ?)",
+            ((i % 7, i, i / 3) for i in range(1000)),
+        )
+        conn.execute("UPDATE videos SET views = views * 2 WHERE creator_id = 3")
+        conn.execute("DELETE FROM videos WHERE creator_id = 5")
+    conn.commit()
+    # Recomputed once at the end, and the triggers are back for the next writer
+    assert triggers(conn) == set(TRIGGERS)
+    assert check_creator_stats(conn) == []
+    add_video(conn, 4)
+    assert check_creator_stats(conn) == []
+
+
+def test_rollback_of_a_deferred_block_restores_the_triggers(conn):
+    add_video(conn, 1)
+    conn.commit()
+    with pytest.raises(sqlite3.IntegrityError):
+        with deferred_stats(conn):
+            conn.execute("UPDATE videos SET views = 500")
+            conn.execute("INSERT INTO videos (video_id, title) VALUES (1, 'duplicate')")
+    conn.rollback()
+    assert triggers(conn) == set(TRIGGERS)
+    assert check_creator_stats(conn) == []
+
+
+def test_check_reports_drift_until_rebuilt(conn):
+    add_video(conn, 1)
+    conn.execute("UPDATE creator_stats SET views = views + 1, coins_paid = coins_paid + 1 WHERE creator_id = 1")
+    conn.execute("INSERT INTO creator_stats (creator_id, videos) VALUES (9, 1)")
+    assert sorted((c, col) for c, col, _, _ in check_creator_stats(conn)) == [(1, "coins_paid"), (1, "views"), (9, "videos")]
+    assert rebuild_creator_stats(conn) == 1
+    assert check_creator_stats(conn) == []
+    assert get_creator_stats(conn, 42) is None
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pytest
+
+from db import ConnectionPool
+
+
+@pytest.fixture
+def pool(conn):
+    pool = ConnectionPool(conn.execute("PRAGMA database_list").fetchone()[2], size=1)
+    yield pool
+    pool.close_all()
+
+
+def test_read_only_connections_reject_writes(pool):
+    with pool.connection(readonly=True) as ro:
+        assert ro.execute("SELECT count(*) FROM videos").fetchone()[0] == 0
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            ro.execute("INSERT INTO videos (title) VALUES ('v')")
+    with pool.connection() as rw:
+        rw.execute("INSERT INTO videos (title) VALUES ('v')")
+        rw.commit()
+        assert rw.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_released_connections_are_reused(pool):
+    with pool.connection() as first:
+        pass
+    with pool.connection() as again:
+        assert again is first
+        # An open transaction is rolled back on release, never handed to the next user
+        again.execute("INSERT INTO videos (title) VALUES ('uncommitted')")
+    with pool.connection(readonly=True) as ro:
+        # Read-only and read-write connections are pooled apart
+        assert ro is not first
+        assert ro.execute("SELECT count(*) FROM videos").fetchone()[0] == 0
+    with pool.connection(readonly=True) as ro_again:
+        assert ro_again is ro
+    # Beyond `size` idle connections per kind, extras are closed instead of kept
+    a, b = pool.acquire(), pool.acquire()
+    pool.release(a)
+    pool.release(b)
+    with pytest.raises(sqlite3.ProgrammingError):
+        b.execute("SELECT 1")
@@ -0,0 +1,190 @@
+import itertools
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import donate_opti
+from donate_opti import (
+    theta, eps, xn_max, xp_max, delta, Delta, rev_floor, lam_rev, lam_util, lam_inc,
+    CoinSplitCache, Q_QUANTUM, solve_coin_splits, solve_coin_split_gurobi, get_coin_split, get_coin_splits,
+    cached_coin_splits, purge_coin_cache,
+)
+
+QS = (0.0, 0.25, 0.7, 1.0)
+COINS = (0, 1, 7, 500)
+GRID = list(itertools.product(QS, COINS, COINS))
+
+
+def objective(Q, Nn, Np, xn, xp):
+    # The get_coin_split model's objective, written out independently of both solvers
+    Ntot = Nn + Np
+    R_min = rev_floor * Ntot
+    pay = xn * Nn + xp * Np
+    U_max = (1 + theta * Q) * math.log(eps + xn_max * Nn + xp_max * Np)
+    return (lam_rev * ((Ntot - pay) - R_min) / max(1e-9, Ntot - R_min)
+            + lam_util * (1 + theta * Q) * math.log(eps + pay) / max(1e-9, U_max)
+            + lam_inc * ((xp - xn) - delta) / max(1e-9, Delta - delta))
+
+
+def assert_feasible(Q, Nn, Np, xn, xp):
+    tol = 1e-7
+    assert -tol <= xn <= xn_max + tol
+    assert -tol <= xp <= xp_max + tol
+    assert delta - tol <= xp - xn <= Delta + tol
+    assert (1 - xn) * Nn + (1 - xp) * Np >= rev_floor * (Nn + Np) - tol * max(1, Nn + Np)
+
+
+@pytest.fixture
+def gurobi():
+    gp = pytest.importorskip("gurobipy")
+    try:
+        gp.Model("licence_check").dispose()
+    except gp.GurobiError as e:
+        pytest.skip(f"no usable Gurobi licence: {e}")
+
+
+@pytest.mark.parametrize("Q,Nn,Np", GRID)
+def test_batch_matches_gurobi(gurobi, Q, Nn, Np):
+    xn, xp, ok = solve_coin_splits([Q], [Nn], [Np])
+    ref = solve_coin_split_gurobi(Q, Nn, Np)
+    assert ok[0] and ref is not None
+    assert_feasible(Q, Nn, Np, xn[0], xp[0])
+    # Same optimum; with no coins at all x_n is not unique, so only the objective is compared there
+    assert objective(Q, Nn, Np, xn[0], xp[0]) == pytest.approx(objective(Q, Nn, Np, *ref), abs=1e-6)
+    assert objective(Q, Nn, Np, xn[0], xp[0]) >= objective(Q, Nn, Np, *ref) - 1e-6
+    if Nn and Np:
+        assert xn[0] == pytest.approx(ref[0], abs=1e-5)
+        assert xp[0] == pytest.approx(ref[1], abs=1e-5)
+
+
+def test_batch_is_elementwise():
+    Q, Nn, Np = (np.array(col, dtype=np.float64) for col in zip(*GRID))
+    xn, xp, ok = solve_coin_splits(Q, Nn, Np)
+    assert ok.all()
+    for i, (q, n, p) in enumerate(GRID):
+        one = solve_coin_splits([q], [n], [p])
+        assert (xn[i], xp[i]) == (one[0][0], one[1][0])
+        assert_feasible(q, n, p, xn[i], xp[i])
+
+
+def add_videos(conn):
+    """
+    One video per (Q, Nn, Np) of the grid: Q = 1 with every input at 1, Q = 0 without compliance.
+    """
+    inputs = {0.0: (0.5, 0), 0.25: (0.25, 1), 0.7: (0.7, 1), 1.0: (1.0, 1)}
+    for Q, Nn, Np in GRID:
+        level, compliance = inputs[Q]
+        conn.execute(
+            "INSERT INTO videos (title, watch_completion, engagement_rate, engagement_diversity, rewatch, nlp_quality, "
+            "compliance, norm_coins, prem_coins) VALUES ('v', ?, ?, ?, ?, ?, ?, ?, ?)",
+            (level, level, level, level, level, compliance, Nn, Np),
+        )
+    conn.commit()
+    return [r[0] for r in conn.execute("SELECT video_id FROM videos ORDER BY video_id")]
+
+
+def stored_splits(conn):
+    return {r[0]: (r[1], r[2]) for r in conn.execute("SELECT video_id, x_n, x_p FROM videos")}
+
+
+def test_batch_and_single_video_paths_agree(conn, gurobi):
+    ids = add_videos(conn)
+    assert get_coin_splits(conn) == len(ids)
+    batch = stored_splits(conn)
+    for video_id in ids:
+        single = get_coin_split(conn, video_id, persist=False, use_cache=False)
+        assert single == pytest.approx(batch[video_id], abs=1e-5)
+
+
+def test_batch_and_fallback_paths_agree(conn, monkeypatch):
+    # Without gurobipy the single-video path is the batch solver on one row: the same splits (up to
+    # rounding of the unquantised Q when the memo is bypassed)
+    monkeypatch.setattr(donate_opti, "gp", SimpleNamespace(available=False))
+    ids = add_videos(conn)
+    get_coin_splits(conn)
+    batch = stored_splits(conn)
+    for video_id in ids:
+        assert get_coin_split(conn, video_id, persist=False) == batch[video_id]
+        assert get_coin_split(conn, video_id, persist=False, use_cache=False) == pytest.approx(batch[video_id], abs=1e-12)
+
+
+def test_out_of_range_inputs_are_clamped_like_the_batch_path(conn, monkeypatch):
+    monkeypatch.setattr(donate_opti, "gp", SimpleNamespace(available=False))
+    # Inputs above 1 and below 0 (Q = 1 and Q = 0 once clamped), and a compliance flag that isn't 1
+    for level, rewatch, compliance in ((1.7, 1.2, 1), (0.8, -0.3, 1), (0.9, 0.9, 2)):
+        conn.execute(
+            "INSERT INTO videos (title, watch_completion, engagement_rate, engagement_diversity, rewatch, nlp_quality, "
+            "compliance, norm_coins, prem_coins) VALUES ('v', ?, ?, ?, ?, ?, ?, 40, 9)",
+            (level, level, level, rewatch, level, compliance),
+        )
+    conn.commit()
+    get_coin_splits(conn)
+    batch = stored_splits(conn)
+    assert batch[1] == tuple(x[0] for x in solve_coin_splits([1.0], [40], [9])[:2])
+    assert batch[2] == batch[3] == tuple(x[0] for x in solve_coin_splits([0.0], [40], [9])[:2])
+    for video_id, split in batch.items():
+        assert get_coin_split(conn, video_id, persist=False) == split
+
+
+def counting_solver(monkeypatch):
+    # solve_coin_splits, recording how many rows each call actually solves
+    solved = []
+
+    def solve(Q, Nn, Np):
+        solved.append(len(Q))
+        return solve_coin_splits(Q, Nn, Np)
+
+    monkeypatch.setattr(donate_opti, "solve_coin_splits", solve)
+    return solved
+
+
+def test_memo_hits_return_the_fresh_solve(conn, monkeypatch):
+    monkeypatch.setattr(donate_opti, "coin_cache", CoinSplitCache())
+    solved = counting_solver(monkeypatch)
+    Q, Nn, Np = (np.array(col, dtype=np.float64) for col in zip(*GRID))
+    fresh = cached_coin_splits(conn, Q, Nn, Np)
+    assert solved == [len(GRID)]
+    # Second call from the LRU, third from the table (a new process has an empty LRU)
+    for cache in (donate_opti.coin_cache, CoinSplitCache()):
+        monkeypatch.setattr(donate_opti, "coin_cache", cache)
+        hit = cached_coin_splits(conn, Q, Nn, Np)
+        assert solved == [len(GRID)]
+        for a, b in zip(hit, fresh):
+            assert a.tolist() == b.tolist()
+
+
+def test_parameter_change_misses_the_memo(conn, monkeypatch):
+    monkeypatch.setattr(donate_opti, "coin_cache", CoinSplitCache())
+    solved = counting_solver(monkeypatch)
+    cached_coin_splits(conn, [0.7], [40], [9])
+    old = donate_opti.coin_params_hash("numpy")
+    monkeypatch.setattr(donate_opti, "lam_util", lam_util + 1)
+    assert donate_opti.coin_params_hash("numpy") != old
+    cached_coin_splits(conn, [0.7], [40], [9])
+    assert solved == [1, 1]
+    # The rows stored under the old constants can never be hit again
+    assert purge_coin_cache(conn) == 1
+    assert conn.execute("SELECT DISTINCT params FROM coin_split_cache").fetchall() == [
+        (donate_opti.coin_params_hash("numpy"),)
+    ]
+
+
+def test_q_quantisation_stays_within_tolerance(conn, monkeypatch):
+    # Memo keys round Q to Q_QUANTUM; the split for the rounded Q must still be the optimum for the
+    # video's own Q, to the same tolerance the batch solver is held to against Gurobi
+    monkeypatch.setattr(donate_opti, "coin_cache", CoinSplitCache())
+    rng = np.random.default_rng(0)
+    Q = rng.random(500)
+    Nn = rng.integers(0, 500, 500)
+    Np = rng.integers(0, 500, 500)
+    assert np.abs(donate_opti.quantise_q(Q) * Q_QUANTUM - Q).max() <= Q_QUANTUM / 2
+    xn, xp, ok = cached_coin_splits(conn, Q, Nn, Np)
+    ref_n, ref_p, ref_ok = solve_coin_splits(Q, Nn, Np)
+    assert ok.tolist() == ref_ok.tolist()
+    np.testing.assert_allclose(xn, ref_n, atol=1e-5)
+    np.testing.assert_allclose(xp, ref_p, atol=1e-5)
+    for i in range(len(Q)):
+        assert objective(Q[i], Nn[i], Np[i], xn[i], xp[i]) == pytest.approx(
+            objective(Q[i], Nn[i], Np[i], ref_n[i], ref_p[i]), abs=1e-6)
@@ -0,0 +1,132 @@
+import pytest
+
+from earnings import DAY, WEEK, WEEK_ORIGIN, bucket_start, record_earnings, earnings_range, daily_timeline
+from db import SQL_IN_CHUNK
+
+# 2026-03-02 00:00 UTC, a Monday
+MONDAY = 1772409600
+
+
+def add_video(conn, proj_earnings=0.0, views=0):
+    cur = conn.execute(
+        "INSERT INTO videos (title, proj_earnings, views, allocation_version) VALUES ('v', ?, ?, 1)",
+        (proj_earnings, views),
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def record(conn, video_id, proj_earnings, ts):
+    conn.execute("UPDATE videos SET proj_earnings = ? WHERE video_id = ?", (proj_earnings, video_id))
+    n = record_earnings(conn, 1, [video_id], ts=ts)
+    conn.commit()
+    return n
+
+
+def rollup(conn, table, video_id):
+    return [
+        tuple(r) for r in conn.execute(
+            f"SELECT bucket, samples, earnings_sum, earnings_min, earnings_max, earnings_last FROM {table} "
+            "WHERE video_id = ? ORDER BY bucket",
+            (video_id,),
+        )
+    ]
+
+
+def assert_rollups_match_samples(conn):
+    # Every rollup row is exactly the aggregate of its samples (nothing has been compacted here)
+    for table, width, origin in (("earnings_daily", DAY, 0), ("earnings_weekly", WEEK, WEEK_ORIGIN)):
+        expected = conn.execute(
+            f"SELECT video_id, ts - (ts - {origin}) % {width} AS bucket, count(*), total(proj_earnings), "
+            "min(proj_earnings), max(proj_earnings) FROM earnings_samples GROUP BY video_id, bucket ORDER BY 1, 2"
+        ).fetchall()
+        stored = conn.execute(
+            f"SELECT video_id, bucket, samples, earnings_sum, earnings_min, earnings_max FROM {table} ORDER BY 1, 2"
+        ).fetchall()
+        assert stored == [pytest.approx(tuple(r)) for r in expected]
+
+
+def test_bucket_boundaries():
+    assert bucket_start(MONDAY, "day") == MONDAY
+    assert bucket_start(MONDAY - 1, "day") == MONDAY - DAY
+    assert bucket_start(MONDAY + DAY - 1, "day") == MONDAY
+    assert bucket_start(MONDAY, "week") == MONDAY
+    assert bucket_start(MONDAY - 1, "week") == MONDAY - WEEK
+    assert bucket_start(MONDAY + WEEK - 1, "week") == MONDAY
+    assert bucket_start(MONDAY + 123, "sample") == MONDAY + 123
+    # The first week starts on Monday 1970-01-05
+    assert bucket_start(WEEK_ORIGIN, "week") == WEEK_ORIGIN
+    assert bucket_start(WEEK_ORIGIN - 1, "week") == WEEK_ORIGIN - WEEK
+
+
+def test_samples_either_side_of_midnight_and_monday(conn):
+    video_id = add_video(conn)
+    # Sunday 23:59:59, Monday 00:00:00, Monday 23:59:59, Tuesday 00:00:00
+    for ts, value in ((MONDAY - 1, 1.0), (MONDAY, 2.0), (MONDAY + DAY - 1, 4.0), (MONDAY + DAY, 8.0)):
+        record(conn, video_id, value, ts)
+    assert rollup(conn, "earnings_daily", video_id) == [
+        (MONDAY - DAY, 1, 1.0, 1.0, 1.0, 1.0),
+        (MONDAY, 2, 6.0, 2.0, 4.0, 4.0),
+        (MONDAY + DAY, 1, 8.0, 8.0, 8.0, 8.0),
+    ]
+    assert rollup(conn, "earnings_weekly", video_id) == [
+        (MONDAY - WEEK, 1, 1.0, 1.0, 1.0, 1.0),
+        (MONDAY, 3, 14.0, 2.0, 8.0, 8.0),
+    ]
+    # Ranges are [start, end) over bucket starts
+    days = earnings_range(conn, video_id, "day", MONDAY, MONDAY + DAY)
+    assert [(p["bucket"], p["earnings_mean"]) for p in days] == [(MONDAY, 3.0)]
+    assert_rollups_match_samples(conn)
+
+
+def test_same_second_writes_replace_the_sample(conn):
+    video_id = add_video(conn)
+    record(conn, video_id, 10.0, MONDAY + 100)
+    record(conn, video_id, 5.0, MONDAY + 200)
+    # Replaces the 5.0 sample: counted once, and no longer the minimum
+    record(conn, video_id, 30.0, MONDAY + 200)
+    samples = conn.execute("SELECT ts, proj_earnings FROM earnings_samples WHERE video_id = ? ORDER BY ts",
+                           (video_id,)).fetchall()
+    assert samples == [(MONDAY + 100, 10.0), (MONDAY + 200, 30.0)]
+    assert rollup(conn, "earnings_daily", video_id) == [(MONDAY, 2, 40.0, 10.0, 30.0, 30.0)]
+    assert rollup(conn, "earnings_weekly", video_id) == [(MONDAY, 2, 40.0, 10.0, 30.0, 30.0)]
+    # ... and again, replacing the maximum
+    record(conn, video_id, 20.0, MONDAY + 200)
+    assert rollup(conn, "earnings_daily", video_id) == [(MONDAY, 2, 30.0, 10.0, 20.0, 20.0)]
+    assert rollup(conn, "earnings_weekly", video_id) == [(MONDAY, 2, 30.0, 10.0, 20.0, 20.0)]
+    assert_rollups_match_samples(conn)
+
+
+def test_same_second_full_and_single_video_writes(conn):
+    ids = [add_video(conn, proj_earnings=float(i), views=i) for i in range(1, 6)]
+    ts = MONDAY + 3600
+    assert record_earnings(conn, 1, ts=ts) == 5
+    conn.execute("UPDATE videos SET proj_earnings = proj_earnings * 10")
+    # One video re-priced in the same second, then the whole allocation again
+    assert record_earnings(conn, 1, [ids[0]], ts=ts) == 1
+    assert record_earnings(conn, 1, ts=ts) == 5
+    conn.commit()
+    assert conn.execute("SELECT count(*), total(samples) FROM earnings_daily").fetchone() == (5, 5)
+    assert_rollups_match_samples(conn)
+
+
+def test_long_id_lists_are_chunked(conn):
+    ids = [add_video(conn, proj_earnings=1.0) for _ in range(SQL_IN_CHUNK + 10)]
+    assert record_earnings(conn, 1, ids, ts=MONDAY) == len(ids)
+    conn.commit()
+    assert conn.execute("SELECT count(*) FROM earnings_weekly").fetchone()[0] == len(ids)
+    assert_rollups_match_samples(conn)
+
+
+def test_daily_timeline_is_the_running_projection(conn):
+    video_id = add_video(conn)
+    for ts, value in ((MONDAY + 10, 50.0), (MONDAY + 20, 100.0), (MONDAY + DAY, 130.0), (MONDAY + 3 * DAY, 125.0)):
+        record(conn, video_id, value, ts)
+    timeline = daily_timeline(conn, video_id)
+    assert [(p["daily_earnings"], p["cumulative_earnings"]) for p in timeline] == [
+        (100.0, 100.0), (30.0, 130.0), (-5.0, 125.0),
+    ]
+    assert timeline[-1]["cumulative_earnings"] == 125.0
+    # A shorter window still starts from the day before it
+    assert [p["daily_earnings"] for p in daily_timeline(conn, video_id, days=2)] == [30.0, -5.0]
+    assert daily_timeline(conn, add_video(conn)) == []
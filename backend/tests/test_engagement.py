@@ -0,0 +1,101 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from db import ConnectionPool
+from engagement import EngagementBuffer, EngagementError
+
+
+class FlakyPool:
+    """
+    A ConnectionPool on the test database whose first `failures` connections fail every flush, as
+    if the database were locked.
+    """
+
+    def __init__(self, conn, failures):
+        self.pool = ConnectionPool(conn.execute("PRAGMA database_list").fetchone()[2], size=2)
+        self.failures = failures
+
+    @contextmanager
+    def connection(self, readonly=False):
+        with self.pool.connection(readonly) as conn:
+            if self.failures:
+                self.failures -= 1
+                yield FailingConnection(conn)
+            else:
+                yield conn
+
+
+class FailingConnection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self):
+        raise sqlite3.OperationalError("database is locked")
+
+    def rollback(self):
+        self.conn.rollback()
+
+
+def add_video(conn):
+    video_id = conn.execute("INSERT INTO videos (title) VALUES ('v')").lastrowid
+    conn.commit()
+    return video_id
+
+
+def counters(conn, video_id):
+    return conn.execute("SELECT views, likes FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_events_are_summed_per_video(conn):
+    video_id = add_video(conn)
+    buffer = EngagementBuffer(FlakyPool(conn, 0), interval=60)
+    buffer.add([{"video_id": video_id, "views": 3}, {"video_id": video_id, "views": 2, "likes": 1}])
+    assert buffer.pending() == {"videos": 1, "events": 2}
+    assert buffer.flush() == 1
+    assert counters(conn, video_id) == (5, 1)
+    assert buffer.pending() == {"videos": 0, "events": 0}
+
+
+def test_invalid_batches_are_rejected_whole(conn):
+    buffer = EngagementBuffer(FlakyPool(conn, 0), interval=60)
+    with pytest.raises(EngagementError):
+        buffer.add([{"video_id": 1, "views": 1}, {"video_id": 2, "views": -1}])
+    assert buffer.pending() == {"videos": 0, "events": 0}
+
+
+def test_failed_flush_is_retried_without_new_events(conn):
+    video_id = add_video(conn)
+    flushed = []
+    buffer = EngagementBuffer(FlakyPool(conn, 2), on_flush=lambda c, ids: flushed.extend(ids), interval=0.05)
+    buffer.add([{"video_id": video_id, "views": 7, "likes": 2}])
+    # The first flush fails and requeues; nothing else is added, yet the retries (after 0.1 s, then
+    # 0.2 s) write the batch
+    assert buffer.flush() == 0
+    assert buffer.pending() == {"videos": 1, "events": 1}
+    assert wait_for(lambda: counters(conn, video_id) == (7, 2))
+    assert flushed == [video_id]
+    assert buffer.pending() == {"videos": 0, "events": 0}
+    assert buffer._failures == 0
+
+
+def test_requeued_batch_merges_with_newer_events(conn):
+    video_id = add_video(conn)
+    buffer = EngagementBuffer(FlakyPool(conn, 1), interval=60)
+    buffer.add([{"video_id": video_id, "views": 1, "watch_completion": 0.2}])
+    assert buffer.flush() == 0
+    buffer.add([{"video_id": video_id, "views": 4, "watch_completion": 0.9}])
+    assert buffer.flush() == 1
+    assert counters(conn, video_id) == (5, 0)
+    assert conn.execute("SELECT watch_completion FROM videos WHERE video_id = ?", (video_id,)).fetchone()[0] == 0.9
@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from engines import LazyModule
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+HEAVY = ("cv2", "pandas", "gurobipy")
+
+# Runs in a fresh interpreter, since this test process may already have imported any of them
+CHILD = f"""
+import json, sys
+import app
+with app.app.test_client() as client:
+    client.get("/health")
+    client.get("/list-creators")
+print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))
+"""
+
+
+@pytest.mark.parametrize("read_only", ["0", "1"])
+def test_importing_the_app_loads_no_heavy_engine(conn, read_only):
+    env = dict(os.environ, APP_STARTUP="0", APP_READ_ONLY=read_only, LOG_LEVEL="WARNING",
+               APP_DB_PATH=conn.execute("PRAGMA database_list").fetchone()[2])
+    proc = subprocess.run([sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    assert json.loads(proc.stdout.splitlines()[-1]) == []
+
+
+def test_lazy_module_imports_on_first_use():
+    json_module = LazyModule("json", "test")
+    assert json_module.available and not json_module.loaded
+    assert json_module.dumps([1]) == "[1]"
+    assert json_module.loaded and json_module.load_seconds is not None
+    missing = LazyModule("no_such_package_here", "test")
+    assert not missing.available
+    with pytest.raises(ImportError):
+        missing.load()
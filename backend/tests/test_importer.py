@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from bootstrap import create_indexes
+from creator_stats import check_creator_stats
+from importer import ImportFailed, import_rows, secondary_objects
+from search import search
+
+
+class Crash(Exception):
+    """
+    Stands in for the process being killed: import_rows doesn't catch it, so nothing is restored.
+    """
+
+
+def crash_after_first_transaction(rows, seconds):
+    raise Crash
+
+
+def write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    return path
+
+
+def videos(n, title="clip"):
+    return [{"title": f"{title} {i}", "creator_id": i % 3 + 1, "views": 10 * i} for i in range(n)]
+
+
+def started(conn):
+    # Start-up also builds the indexes; the import rebuilds them at the end
+    create_indexes(conn)
+    return schema(conn)
+
+
+def schema(conn, table="videos"):
+    return {name for _, name, _ in secondary_objects(conn, table)}
+
+
+def test_crashed_import_resumes_from_the_checkpoint(conn, tmp_path):
+    expected = started(conn)
+    source = write_jsonl(tmp_path / "videos.jsonl", videos(5))
+    with pytest.raises(Crash):
+        import_rows(conn, "videos", source, txn_rows=2, progress=crash_after_first_transaction)
+    # Killed mid-import: the first transaction is in, the triggers are still dropped
+    assert conn.execute("SELECT count(*) FROM videos").fetchone()[0] == 2
+    assert "creator_stats_insert" not in schema(conn)
+
+    result = import_rows(conn, "videos", source, txn_rows=2)
+    assert (result["resumed"], result["rows"], result["total_rows"]) == (True, 3, 5)
+    assert conn.execute("SELECT count(*) FROM videos").fetchone()[0] == 5
+    assert schema(conn) == expected
+    assert check_creator_stats(conn) == []
+    assert len(search(conn, "clip", kinds=("videos",), limit=10)["videos"]) == 5
+    # Finished: a second run is a no-op
+    assert import_rows(conn, "videos", source).get("skipped")
+
+
+def test_restart_after_a_crash_puts_every_trigger_back(conn, tmp_path):
+    expected = started(conn)
+    source = write_jsonl(tmp_path / "videos.jsonl", videos(5))
+    with pytest.raises(Crash):
+        import_rows(conn, "videos", source, txn_rows=2, progress=crash_after_first_transaction)
+    write_jsonl(source, videos(4, "other"))
+
+    import_rows(conn, "videos", source, txn_rows=2, restart=True)
+    assert schema(conn) == expected
+    # ... and they work again for later writes
+    conn.execute("INSERT INTO videos (title, creator_id, views) VALUES ('later', 1, 7)")
+    assert check_creator_stats(conn) == []
+    assert [v["title"] for v in search(conn, "later", kinds=("videos",))["videos"]] == ["later"]
+
+
+def test_changed_file_needs_restart(conn, tmp_path):
+    source = write_jsonl(tmp_path / "videos.jsonl", videos(5))
+    with pytest.raises(Crash):
+        import_rows(conn, "videos", source, txn_rows=2, progress=crash_after_first_transaction)
+    write_jsonl(source, videos(6))
+    with pytest.raises(ImportFailed, match="changed since the import"):
+        import_rows(conn, "videos", source, txn_rows=2)
+
+
+def test_csv_fields_are_mapped_and_parsed(conn, tmp_path):
+    source = tmp_path / "creators.csv"
+    source.write_text(
+        "creator_id,display_name,followers,likes,country\n"
+        "7,Ann,12,,FR\n"
+        '8,"Bell, Jr.",3,4,US\n'
+    )
+    result = import_rows(conn, "creators", source, rename={"display_name": "name"})
+    assert (result["rows"], result["ignored_fields"]) == (2, ["country"])
+    rows = conn.execute("SELECT creator_id, name, followers, likes FROM creators ORDER BY creator_id").fetchall()
+    # Numbers arrive as numbers; an empty field takes the column default
+    assert rows == [(7, "Ann", 12, 0), (8, "Bell, Jr.", 3, 4)]
+    assert [c["name"] for c in search(conn, "bell")["creators"]] == ["Bell, Jr."]
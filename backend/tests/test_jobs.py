@@ -0,0 +1,27 @@
+import json
+
+from db import ConnectionPool
+from jobs import JobQueue
+
+
+def queue(conn, handler):
+    jobs = JobQueue(ConnectionPool(conn.execute("PRAGMA database_list").fetchone()[2], size=2), max_workers=1)
+    jobs.init_table()
+    jobs.register("thumb", handler)
+    return jobs
+
+
+def test_resume_reruns_jobs_left_unfinished(conn):
+    ran = []
+    jobs = queue(conn, lambda payload, progress: ran.append(payload["video_id"]))
+    # A previous process stopped while job 1 was running and before job 2 was picked up
+    conn.executemany(
+        "INSERT INTO jobs (kind, payload, status, attempts) VALUES ('thumb', ?, ?, ?)",
+        [(json.dumps({"video_id": 1}), "running", 1), (json.dumps({"video_id": 2}), "queued", 0),
+         (json.dumps({"video_id": 3}), "done", 1)],
+    )
+    conn.commit()
+    assert jobs.resume() == 2
+    jobs.shutdown()
+    assert sorted(ran) == [1, 2]
+    assert [(j["status"], j["attempts"]) for j in map(jobs.get, (1, 2, 3))] == [("done", 2), ("done", 1), ("done", 1)]
@@ -0,0 +1,55 @@
+import pytest
+
+from metrics import Registry
+
+
+def scrape(client):
+    """
+    /metrics as {series with labels: value}, plus the TYPE of every metric.
+    """
+    resp = client.get("/metrics")
+    assert resp.status_code == 200 and resp.mimetype == "text/plain"
+    values, types = {}, {}
+    for line in resp.get_data(as_text=True).splitlines():
+        if line.startswith("# TYPE "):
+            name, kind = line[len("# TYPE "):].split()
+            types[name] = kind
+        elif line and not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            values[series] = float(value)
+    return values, types
+
+
+def test_requests_show_up_in_counters_and_histograms(client):
+    before, _ = scrape(client)
+    for _ in range(3):
+        assert client.get("/list-creators").status_code == 200
+    client.get("/no-such-route")
+    after, types = scrape(client)
+
+    ok = 'http_requests_total{method="GET",route="/list-creators",status="200"}'
+    assert after[ok] - before.get(ok, 0) == 3
+    assert after['http_requests_total{method="GET",route="unmatched",status="404"}'] >= 1
+    assert (types["http_requests_total"], types["http_request_duration_seconds"]) == ("counter", "histogram")
+
+    count = 'http_request_duration_seconds_count{method="GET",route="/list-creators"}'
+    assert after[count] - before.get(count, 0) == 3
+    assert after['http_request_duration_seconds_bucket{method="GET",route="/list-creators",le="+Inf"}'] == after[count]
+    # The route's queries are timed too
+    assert after['db_query_duration_seconds_count{op="select"}'] > before.get('db_query_duration_seconds_count{op="select"}', 0)
+    assert types["thumbnail_cache"] == "gauge"
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry(buckets=(0.1, 1.0))
+    registry.describe("work_seconds", "Time spent working.")
+    for seconds in (0.05, 0.5, 0.5, 3.0):
+        registry.observe("work_seconds", seconds, kind='a "quoted" label')
+    registry.inc("work_total", 2, kind="x")
+    registry.gauge("queue_depth", lambda: 7)
+    lines = registry.render().splitlines()
+    assert "# HELP work_seconds Time spent working." in lines
+    assert [line.rsplit(" ", 1)[1] for line in lines if line.startswith("work_seconds_bucket")] == ["1", "3", "4"]
+    assert 'work_seconds_bucket{kind="a \\"quoted\\" label",le="+Inf"} 4' in lines
+    assert float(next(line for line in lines if line.startswith("work_seconds_sum")).rsplit(" ", 1)[1]) == pytest.approx(4.05)
+    assert 'work_total{kind="x"} 2' in lines and "queue_depth 7" in lines
@@ -0,0 +1,47 @@
+import pytest
+
+
+def add_rows(conn, creators=23, videos=37):
+    conn.executemany("INSERT INTO creators (name) VALUES (?)", [(f"c{i}",) for i in range(creators)])
+    conn.executemany("INSERT INTO videos (title, creator_id) VALUES (?, 1)", [(f"v{i}",) for i in range(videos)])
+    # Gaps in the ids, as deletes leave them
+    conn.execute("DELETE FROM creators WHERE creator_id % 5 = 0")
+    conn.execute("DELETE FROM videos WHERE video_id % 7 = 0")
+    conn.commit()
+
+
+def walk(client, url, limit):
+    seen, after = [], None
+    while True:
+        resp = client.get(f"{url}&limit={limit}" + (f"&after={after}" if after is not None else ""))
+        assert resp.status_code == 200
+        page = resp.get_json()
+        assert len(page) <= limit
+        seen += page
+        after = resp.headers.get("X-Next-Cursor")
+        if after is None:
+            return seen
+
+
+@pytest.mark.parametrize("url,key,table", [
+    ("/list-creators?fields=name", "creator_id", "creators"),
+    ("/get-all-videos-data?creator_id=1&fields=title", "video_id", "videos"),
+])
+def test_keyset_pages_return_every_row_once(client, conn, url, key, table):
+    add_rows(conn)
+    expected = [r[0] for r in conn.execute(f"SELECT {key} FROM {table} ORDER BY {key}")]
+    for limit in (1, 4, len(expected), len(expected) + 5):
+        rows = walk(client, url, limit)
+        assert [r[key] for r in rows] == expected
+        # Projected to the requested fields plus the cursor column
+        assert set(rows[0]) == {key, url.rsplit("=", 1)[1]}
+    # Without limit or after: the whole list in one response
+    assert [r[key] for r in client.get(url).get_json()] == expected
+
+
+def test_bad_paging_and_fields_are_400(client, conn):
+    add_rows(conn)
+    for url in ("/list-creators?fields=name,password", "/get-all-videos-data?creator_id=1&fields=nope",
+                "/list-creators?limit=ten", "/list-creators?after=x"):
+        resp = client.get(url)
+        assert resp.status_code == 400 and "error" in resp.get_json()
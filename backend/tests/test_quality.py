@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from db import SQL_IN_CHUNK
+from quality import QUALITY_INPUTS, clamp01, get_quality_score, get_quality_scores, refresh_quality_scores
+
+
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    W, E, D, R, S = rng.random((5, n))
+    # Exact zeros and ones, where the powers and the min(1, q) cap are at their edges
+    W[:3], E[3:6], S[6:9] = 0.0, 1.0, 1.0
+    C = (rng.random(n) > 0.2).astype(np.int64)
+    return W, E, D, R, S, C
+
+
+def test_batch_scores_match_the_scalar_score_row_by_row():
+    W, E, D, R, S, C = random_inputs(500)
+    batch = get_quality_scores(W, E, D, R, S, C)
+    for i in range(len(W)):
+        assert batch[i] == pytest.approx(get_quality_score(W[i], E[i], D[i], R[i], S[i], int(C[i])), rel=1e-12, abs=0)
+
+
+def test_refresh_stores_the_scalar_score_for_every_row(conn):
+    W, E, D, R, S, C = random_inputs(SQL_IN_CHUNK + 50, seed=1)
+    # Out-of-range inputs are clamped first
+    W[10], E[11] = 1.7, -0.2
+    conn.executemany(
+        f"INSERT INTO videos (title, {', '.join(QUALITY_INPUTS)}) VALUES ('v', ?, ?, ?, ?, ?, ?)",
+        zip(*(a.tolist() for a in (W, E, D, R, S, C))),
+    )
+    conn.commit()
+    ids = [r[0] for r in conn.execute("SELECT video_id FROM videos ORDER BY video_id")]
+    # A list of ids longer than one IN chunk, then the whole table
+    assert refresh_quality_scores(conn, ids[::-1]) > 0
+    assert refresh_quality_scores(conn) == 0
+    stored = conn.execute(f"SELECT quality_score, {', '.join(QUALITY_INPUTS)} FROM videos ORDER BY video_id").fetchall()
+    for score, *inputs in stored:
+        assert score == pytest.approx(get_quality_score(*map(clamp01, inputs[:5]), inputs[5]), rel=1e-12, abs=0)
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from reopt_scheduler import ReoptScheduler
+
+WINDOW = 0.05
+
+
+def settle(scheduler, timeout=5.0):
+    # Until nothing is pending or running, then a few more windows in case another solve gets armed
+    deadline = time.monotonic() + timeout
+    while scheduler.status()["allocation_stale"] and time.monotonic() < deadline:
+        time.sleep(WINDOW / 5)
+    time.sleep(WINDOW * 4)
+
+
+def test_marks_inside_the_window_make_one_solve():
+    solves = []
+    scheduler = ReoptScheduler(lambda: solves.append(time.monotonic()), window=WINDOW)
+    for _ in range(20):
+        scheduler.mark_dirty()
+    assert scheduler.status()["allocation_stale"]
+    settle(scheduler)
+    assert len(solves) == 1
+    assert scheduler.status()["allocation_version"] == 1 and not scheduler.status()["allocation_stale"]
+
+
+def test_marks_during_a_solve_schedule_one_follow_up():
+    started, release = threading.Event(), threading.Event()
+    solves = []
+
+    def solve():
+        solves.append(time.monotonic())
+        if len(solves) == 1:
+            started.set()
+            release.wait(5)
+
+    scheduler = ReoptScheduler(solve, window=WINDOW)
+    scheduler.mark_dirty()
+    assert started.wait(5)
+    for _ in range(10):
+        scheduler.mark_dirty()
+    release.set()
+    settle(scheduler)
+    assert len(solves) == 2
+    assert scheduler.status()["allocation_version"] == 2
+    # The follow-up waits a window after the first solve
+    assert solves[1] - solves[0] >= WINDOW
@@ -0,0 +1,98 @@
+import pytest
+
+import search
+from search import search as run_search, fuzzy_patterns, match_query, tokens
+
+
+def add_creators(conn, *creators):
+    conn.executemany("INSERT INTO creators (name, followers) VALUES (?, ?)", creators)
+    conn.commit()
+
+
+def add_videos(conn, *videos):
+    conn.executemany("INSERT INTO videos (title, views) VALUES (?, ?)", videos)
+    conn.commit()
+
+
+def names(results, kind="creators", column="name"):
+    return [r[column] for r in results[kind]]
+
+
+def test_query_words_are_quoted():
+    assert tokens("John-Doe's 2nd") == ["john", "doe", "s", "2nd"]
+    assert match_query(["john", "d"]) == '"john" "d"*'
+    # FTS5 syntax in the text is just more words
+    assert match_query(tokens('a OR "b" NEAR(c')) == '"a" "or" "b" "near" "c"*'
+
+
+def test_every_word_matches_the_last_as_a_prefix(conn):
+    add_creators(conn, ("John Doe", 1), ("John Smith", 2), ("Jane Doe", 3), ("José Dominguez", 4))
+    assert names(run_search(conn, "john d")) == ["John Doe"]
+    # Words match in any order
+    assert names(run_search(conn, "doe j")) == ["Jane Doe", "John Doe"]
+    assert names(run_search(conn, "smith jane")) == []
+    assert names(run_search(conn, "jo")) == ["José Dominguez", "John Smith", "John Doe"]
+    # Case and accents don't matter
+    assert names(run_search(conn, "JOSE d")) == ["José Dominguez"]
+    assert run_search(conn, "  ") == {"creators": [], "videos": []}
+    assert {r["match"] for r in run_search(conn, "j")["creators"]} == {"prefix"}
+
+
+def test_names_starting_with_the_text_rank_first_then_popularity(conn):
+    add_creators(conn, ("Bella Anna", 1000), ("Annabel", 500), ("Anna Bell", 10), ("Ann", 10))
+    assert names(run_search(conn, "ann")) == ["Annabel", "Ann", "Anna Bell", "Bella Anna"]
+    assert names(run_search(conn, "ann", limit=2)) == ["Annabel", "Ann"]
+    add_videos(conn, ("cat video", 5), ("best cat", 50), ("cats", 1))
+    assert names(run_search(conn, "cat", kinds=("videos",)), "videos", "title") == ["cat video", "cats", "best cat"]
+
+
+def test_large_match_sets_rank_the_popular_rows(conn, monkeypatch):
+    # The oldest creators are the most followed, so the newest matches would be the wrong ones to rank
+    add_creators(conn, *((f"creator {i}", 100 - i) for i in range(1, 41)), ("creator zero", 0))
+    expected = run_search(conn, "cr", limit=5)
+    assert names(expected) == [f"creator {i}" for i in range(1, 6)]
+    # Past RANK_ALL matches only the CANDIDATES most followed are read: same results
+    monkeypatch.setattr(search, "RANK_ALL", 10)
+    monkeypatch.setattr(search, "CANDIDATES", 8)
+    assert run_search(conn, "cr", limit=5) == expected
+    # ... unless fewer than `limit` of them match, then every match is ranked after all
+    add_creators(conn, *((f"zed {i}", 1000 + i) for i in range(8)))
+    assert names(run_search(conn, "creator z", limit=5)) == ["creator zero"]
+    assert run_search(conn, "c", limit=5) == expected
+
+
+def test_fuzzy_fallback_for_creators(conn):
+    add_creators(conn, ("Johnny Doe", 5), ("Johanna Doerr", 50), ("Mary Jones", 500))
+    # No word starts with "ohnny", but the names contain it
+    results = run_search(conn, "ohnny")
+    assert [(r["name"], r["match"]) for r in results["creators"]] == [("Johnny Doe", "substring")]
+    # One character substituted, left out and typed extra
+    for typo in ("jonhs", "mary jnes", "mary joness", "mary jomes"):
+        assert [(r["name"], r["match"]) for r in run_search(conn, typo)["creators"]] == [("Mary Jones", "fuzzy")]
+    assert run_search(conn, "jonhs", fuzzy=False)["creators"] == []
+    # Too short (or too long) for the trigram index
+    assert run_search(conn, "jhn")["creators"] == []
+    assert run_search(conn, "x" * 17)["creators"] == []
+    # Videos have no fallback
+    add_videos(conn, ("Mary Jones live", 1))
+    assert run_search(conn, "mary jomes")["videos"] == []
+
+
+def test_fuzzy_patterns_need_a_trigram():
+    exact, edits = fuzzy_patterns("john d")
+    assert exact == ["%john d%"]
+    # Only the last word is edited, and every pattern keeps a 3-character literal run
+    assert "%john _%" in edits and "%john %" in edits and "%john _d%" in edits
+    assert all(p.startswith("%john ") for p in edits)
+
+
+@pytest.mark.parametrize("kind,table,column", [("creators", "creators", "name"), ("videos", "videos", "title")])
+def test_index_follows_inserts_renames_and_deletes(conn, kind, table, column):
+    id_column = search.KINDS[kind][2]
+    row_id = conn.execute(f"INSERT INTO {table} ({column}) VALUES ('alpha')").lastrowid
+    assert names(run_search(conn, "alp", kinds=(kind,)), kind, column) == ["alpha"]
+    conn.execute(f"UPDATE {table} SET {column} = 'beta' WHERE {id_column} = ?", (row_id,))
+    assert run_search(conn, "alp", kinds=(kind,))[kind] == []
+    assert names(run_search(conn, "be", kinds=(kind,)), kind, column) == ["beta"]
+    conn.execute(f"DELETE FROM {table} WHERE {id_column} = ?", (row_id,))
+    assert run_search(conn, "be", kinds=(kind,))[kind] == []
@@ -0,0 +1,84 @@
+import base64
+
+import pytest
+
+
+def add_videos(conn, n, creator_id=1):
+    conn.executemany("INSERT INTO videos (title, creator_id) VALUES ('v', ?)", [(creator_id,)] * n)
+    conn.commit()
+    return [r[0] for r in conn.execute("SELECT video_id FROM videos WHERE creator_id = ? ORDER BY video_id", (creator_id,))]
+
+
+def write_thumbnails(app_module, ids, content=b"detail"):
+    app_module.THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
+    for video_id in ids:
+        (app_module.THUMBNAILS_DIR / f"{video_id}.jpg").write_bytes(content + str(video_id).encode())
+        (app_module.THUMBNAILS_DIR / f"{video_id}_grid.jpg").write_bytes(b"grid" + str(video_id).encode())
+
+
+def decoded(image):
+    return base64.b64decode(image["data_uri"].split(",", 1)[1])
+
+
+def test_unpaged_request_gets_every_full_size_thumbnail(app_module, client, conn):
+    ids = add_videos(conn, app_module.DEFAULT_PAGE_SIZE + 20)
+    write_thumbnails(app_module, ids)
+    body = client.get("/get-all-videos-thumbnails?creator_id=1").get_json()
+    assert [i["video_id"] for i in body["images"]] == ids and body["next_cursor"] is None
+    assert decoded(body["images"][0]) == f"detail{ids[0]}".encode()
+    grid = client.get("/get-all-videos-thumbnails?creator_id=1&size=grid").get_json()
+    assert decoded(grid["images"][0]) == f"grid{ids[0]}".encode()
+    assert client.get("/get-all-videos-thumbnails?creator_id=1&size=huge").status_code == 400
+
+
+def test_pages_follow_the_cursor(app_module, client, conn):
+    ids = add_videos(conn, app_module.DEFAULT_PAGE_SIZE + 20)
+    write_thumbnails(app_module, ids)
+    seen, after = [], 0
+    while after is not None:
+        body = client.get(f"/get-all-videos-thumbnails?creator_id=1&limit=50&after={after}").get_json()
+        assert len(body["images"]) <= 50
+        seen += [i["video_id"] for i in body["images"]]
+        after = body["next_cursor"]
+    assert seen == ids
+    # Only a cursor: the default page size
+    body = client.get("/get-all-videos-thumbnails?creator_id=1&after=0").get_json()
+    assert len(body["images"]) == app_module.DEFAULT_PAGE_SIZE and body["next_cursor"] == ids[-21]
+
+
+def test_unchanged_page_answers_304(app_module, client, conn):
+    ids = add_videos(conn, 3)
+    write_thumbnails(app_module, ids)
+    first = client.get("/get-all-videos-thumbnails?creator_id=1")
+    etag = first.headers["ETag"]
+    assert client.get("/get-all-videos-thumbnails?creator_id=1", headers={"If-None-Match": etag}).status_code == 304
+    # A regenerated thumbnail changes the page's ETag and is never served from the cache stale
+    (app_module.THUMBNAILS_DIR / f"{ids[1]}.jpg").write_bytes(b"regenerated")
+    again = client.get("/get-all-videos-thumbnails?creator_id=1", headers={"If-None-Match": etag})
+    assert again.status_code == 200 and again.headers["ETag"] != etag
+    assert decoded(again.get_json()["images"][1]) == b"regenerated"
+
+
+def test_sprite_sheet_replaces_its_previous_version(app_module, client, conn):
+    pytest.importorskip("cv2")
+    ids = add_videos(conn, 5)
+    write_thumbnails(app_module, ids)
+    first = client.get("/get-thumbnail-sprite?creator_id=1&limit=3")
+    body = first.get_json()
+    assert [t["video_id"] for t in body["tiles"]] == ids[:3] and body["next_cursor"] == ids[2]
+    assert body["tiles"][1]["x"] == body["tile_width"]
+    sheet = client.get(body["sprite_url"])
+    assert sheet.status_code == 200 and sheet.mimetype == "image/jpeg"
+    assert client.get("/get-thumbnail-sprite?creator_id=1&limit=3",
+                      headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    second_page = client.get(f"/get-thumbnail-sprite?creator_id=1&limit=3&after={ids[2]}").get_json()
+
+    (app_module.THUMBNAILS_DIR / f"{ids[0]}_grid.jpg").write_bytes(b"changed")
+    rebuilt = client.get("/get-thumbnail-sprite?creator_id=1&limit=3").get_json()
+    assert rebuilt["sprite_url"] != body["sprite_url"]
+    # The old sheet of that page is gone; the other page's sheet is untouched
+    assert client.get(body["sprite_url"]).status_code == 404
+    assert client.get(second_page["sprite_url"]).status_code == 200
+    assert len(list(app_module.SPRITES_DIR.glob("*.jpg"))) == 2
+    assert client.get("/thumbnail-sprite/..%2Fapp.jpg").status_code == 404
+    assert client.get("/get-thumbnail-sprite?creator_id=x").status_code == 400
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pytest
+
+import thumbnails
+from thumbnails import generate_thumbnails, load_manifest
+
+cv2 = pytest.importorskip("cv2")
+
+
+def write_video(path, frames, shade):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    for i in range(frames):
+        writer.write(np.full((48, 64, 3), (shade + i) % 256, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_each_source_is_hashed_once_per_run(tmp_path, monkeypatch):
+    hashed = []
+    file_sha256 = thumbnails.file_sha256
+    monkeypatch.setattr(thumbnails, "file_sha256", lambda path: hashed.append(path) or file_sha256(path))
+    out = tmp_path / "thumbs"
+    video = write_video(tmp_path / "clip.mp4", 10, 0)
+
+    # New video: nothing to compare against, hashed once for the manifest
+    assert generate_thumbnails([video], out) == ["clip"]
+    assert len(hashed) == 1
+
+    # Touched, same content: hashed by the skip check only
+    os.utime(video, ns=(0, 0))
+    assert generate_thumbnails([video], out) == []
+    assert len(hashed) == 2
+
+    # Replaced: the skip check's digest goes into the manifest
+    write_video(video, 20, 90)
+    assert generate_thumbnails([video], out) == ["clip"]
+    assert len(hashed) == 3
+    assert load_manifest(out)["clip"]["sha256"] == file_sha256(video)
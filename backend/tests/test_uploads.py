@@ -0,0 +1,93 @@
+import hashlib
+import io
+
+import pytest
+
+from db import ConnectionPool
+from uploads import UploadError, UploadStore
+
+
+@pytest.fixture
+def store(conn, tmp_path):
+    store = UploadStore(ConnectionPool(conn.execute("PRAGMA database_list").fetchone()[2], size=2), tmp_path / "tmp")
+    store.init_table()
+    return store
+
+
+def upload(store, data, size=None):
+    upload_id = store.create(0, "clip", size)["upload_id"]
+    store.append(upload_id, 0, io.BytesIO(data))
+    return upload_id
+
+
+def test_chunks_resume_at_the_received_offset(store):
+    upload_id = store.create(0, "clip", 6)["upload_id"]
+    assert store.append(upload_id, 0, io.BytesIO(b"abc")) == 3
+    with pytest.raises(UploadError) as e:
+        store.append(upload_id, 0, io.BytesIO(b"abc"))
+    assert e.value.status == 409 and e.value.extra == {"offset": 3}
+    assert store.append(upload_id, 3, io.BytesIO(b"def")) == 6
+    _, path, _ = store.finalize(upload_id, hashlib.sha256(b"abcdef").hexdigest())
+    assert path.read_bytes() == b"abcdef"
+    assert store.status(upload_id)["status"] == "finalizing"
+
+
+def test_finalize_claims_the_session_once(store):
+    upload_id = upload(store, b"video")
+    store.finalize(upload_id)
+    with pytest.raises(UploadError, match="finalizing"):
+        store.finalize(upload_id)
+
+
+def test_reopened_session_can_be_finalized_again(store, tmp_path):
+    upload_id = upload(store, b"video")
+    _, path, digest = store.finalize(upload_id)
+    # Creating the video failed: the session goes back to 'open' and accepts a retry
+    store.reopen(upload_id)
+    assert store.status(upload_id)["status"] == "open"
+    _, path, digest = store.finalize(upload_id)
+    store.commit(upload_id, path, tmp_path / "1.mp4", 1, digest)
+    assert store.status(upload_id)["status"] == "finalized"
+    assert (tmp_path / "1.mp4").read_bytes() == b"video"
+    # Only a session in 'finalizing' is handed back
+    store.reopen(upload_id)
+    assert store.status(upload_id)["status"] == "finalized"
+
+
+def test_failed_commit_puts_the_file_back(store, tmp_path, monkeypatch):
+    upload_id = upload(store, b"video")
+    _, path, digest = store.finalize(upload_id)
+    broken = ConnectionPool(tmp_path / "missing" / "none.db", size=1)
+    monkeypatch.setattr(store, "pool", broken)
+    with pytest.raises(Exception):
+        store.commit(upload_id, path, tmp_path / "1.mp4", 1, digest)
+    monkeypatch.undo()
+    assert path.read_bytes() == b"video" and not (tmp_path / "1.mp4").exists()
+    store.reopen(upload_id)
+    assert store.status(upload_id)["offset"] == 5
+
+
+def test_finalize_left_by_a_dead_process_is_reopened(store, conn):
+    upload_id = upload(store, b"video")
+    store.finalize(upload_id)
+    # Just claimed: another worker may still be finalizing it
+    assert store.reopen_stale() == 0
+    with pytest.raises(UploadError, match="finalizing"):
+        store.finalize(upload_id)
+    # The claim is old and the file never left the temp path: that process died before commit()
+    conn.execute("UPDATE upload_sessions SET updated_at = datetime('now', '-1 hour')")
+    conn.commit()
+    restarted = UploadStore(store.pool, store.tmp_dir)
+    assert restarted.reopen_stale() == 1
+    assert restarted.status(upload_id)["status"] == "open"
+    _, path, digest = restarted.finalize(upload_id)
+    assert digest == hashlib.sha256(b"video").hexdigest()
+
+
+def test_stuck_finalize_can_be_retried_without_a_restart(store, conn):
+    upload_id = upload(store, b"video")
+    store.finalize(upload_id)
+    conn.execute("UPDATE upload_sessions SET updated_at = datetime('now', '-1 hour')")
+    conn.commit()
+    _, path, _ = store.finalize(upload_id)
+    assert path.read_bytes() == b"video" and store.status(upload_id)["status"] == "finalizing"
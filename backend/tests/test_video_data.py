@@ -0,0 +1,50 @@
+from reopt_scheduler import ReoptScheduler
+
+
+def add_video(conn):
+    video_id = conn.execute("INSERT INTO videos (title, creator_id, views) VALUES ('v', 1, 100)").lastrowid
+    conn.commit()
+    return video_id
+
+
+def fetch(client, video_id, etag=None):
+    return client.get(f"/get-video-data?video_id={video_id}", headers={"If-None-Match": etag} if etag else {})
+
+
+def test_repeat_request_with_the_etag_gets_304(client, conn):
+    video_id = add_video(conn)
+    first = fetch(client, video_id)
+    assert first.status_code == 200 and first.get_json()["video_id"] == video_id
+    repeat = fetch(client, video_id, first.headers["ETag"])
+    assert repeat.status_code == 304 and repeat.headers["ETag"] == first.headers["ETag"]
+    assert fetch(client, 999).status_code == 404
+
+
+def test_etag_and_body_follow_the_row_and_the_allocation(app_module, client, conn, monkeypatch):
+    video_id = add_video(conn)
+    etag = fetch(client, video_id).headers["ETag"]
+
+    def changed(check):
+        nonlocal etag
+        resp = fetch(client, video_id, etag)
+        assert resp.status_code == 200 and resp.headers["ETag"] != etag
+        assert check(resp.get_json())
+        etag = resp.headers["ETag"]
+
+    # A row write bumps row_version
+    conn.execute("UPDATE videos SET views = 250, row_version = row_version + 1 WHERE video_id = ?", (video_id,))
+    conn.commit()
+    changed(lambda body: body["views"] == 250)
+
+    # A new allocation is committed and the video points at it
+    version = conn.execute("INSERT INTO allocation_versions (engine, videos, objective, pool) VALUES ('numpy', 1, 0, 1)").lastrowid
+    conn.execute("UPDATE videos SET allocation_version = ? WHERE video_id = ?", (version, video_id))
+    conn.commit()
+    changed(lambda body: body["allocation_version"] == version and body["allocation_committed_at"])
+
+    # A re-solve is pending: the same row is now served as stale
+    reopt = ReoptScheduler(lambda: None, window=60)
+    monkeypatch.setattr(app_module, "reopt", reopt)
+    reopt.mark_dirty()
+    changed(lambda body: body["allocation_stale"] is True)
+    assert fetch(client, video_id, etag).status_code == 304
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from adrev_opti import P, allocation_objective, get_allocation_weights, get_payout_bounds, load_allocation_inputs, solve_allocation
+from whatif import gini, mark_frontier, run_sweep
+
+
+def add_videos(conn, n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    conn.executemany(
+        "INSERT INTO videos (title, creator_id, views, watch_completion, engagement_rate, engagement_diversity, "
+        "rewatch, nlp_quality, compliance, norm_coins, prem_coins) VALUES ('v', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (int(rng.integers(1, 20)), int(rng.integers(100, 50_000)), *map(float, rng.random(5)),
+             int(rng.random() > 0.1), int(rng.integers(0, 500)), int(rng.integers(0, 200)))
+            for _ in range(n)
+        ],
+    )
+    conn.commit()
+
+
+def test_gini_known_values():
+    assert gini([5, 5, 5, 5]) == 0.0
+    # One of n takes everything: (n - 1) / n
+    assert gini([0, 0, 0, 10]) == pytest.approx(0.75)
+    assert gini([1, 2, 3, 4]) == pytest.approx(0.25)
+    # Order doesn't matter; empty and all-zero are equal shares
+    assert gini([4, 1, 3, 2]) == pytest.approx(0.25)
+    assert gini([]) == 0.0 and gini([0, 0]) == 0.0
+
+
+def test_frontier_flags_only_non_dominated_points():
+    results = [
+        {"gini": 0.30, "revenue_kept": 10.0},  # frontier: lowest Gini
+        {"gini": 0.40, "revenue_kept": 30.0},  # frontier
+        {"gini": 0.50, "revenue_kept": 30.0},  # dominated by the one above (same revenue, higher Gini)
+        {"gini": 0.45, "revenue_kept": 20.0},  # dominated by 0.40 / 30
+        {"gini": 0.60, "revenue_kept": 50.0},  # frontier: most revenue kept
+        {"params": {}, "error": "infeasible"},
+    ]
+    mark_frontier(results)
+    assert [r.get("frontier") for r in results] == [True, True, False, False, True, None]
+
+
+def test_sweep_points_match_direct_solves(conn):
+    add_videos(conn)
+    grid = {"lambda_fair": [0.3, 0.8], "alpha": 0.5}
+    report = run_sweep(conn, grid, max_workers=1)
+    assert report["points"] == 2 and len(report["results"]) == 2
+
+    ids, views, Q, C = load_allocation_inputs(conn)
+    _, s, w = get_allocation_weights(views, Q, C, alpha=0.5)
+    lb, ub = get_payout_bounds(C, p_min=1e-8 * P)
+    for lam_fair, result in zip(grid["lambda_fair"], report["results"]):
+        assert result["params"]["lambda_fair"] == lam_fair and result["params"]["alpha"] == 0.5
+        payouts, mu = solve_allocation(s, w, lb, ub, lam_fair=lam_fair, lam_eff=result["params"]["lambda_eff"])
+        assert result["objective"] == pytest.approx(
+            allocation_objective(payouts, s, w, lam_fair=lam_fair, lam_eff=result["params"]["lambda_eff"]), rel=1e-9)
+        assert result["mu"] == pytest.approx(mu, rel=1e-9)
+        assert result["gini"] == pytest.approx(gini(payouts[C == 1]), rel=1e-9)
+    # More weight on fairness spreads the payouts more evenly
+    assert report["results"][1]["gini"] < report["results"][0]["gini"]
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from engines import cv2  # OpenCV is imported on first decode/encode, not with this module
+from metrics import observe
+
+# Output sizes (max width in px, keeps aspect ratio) and JPEG quality per size.
+# "detail" is written to <video_id>.jpg so existing clients keep working.
+THUMBNAIL_SIZES = {
+    "grid": 240,
+    "detail": 720,
+}
+JPEG_QUALITY = {
+    "grid": 70,
+    "detail": 85,
+}
+DEFAULT_SIZE = "detail"
+
+# Representative frame: SEEK_FRACTION into the video, but never later than SEEK_MAX_MS
+SEEK_FRACTION = 0.1
+SEEK_MAX_MS = 1000
+
+# Per-creator sprite sheets: every tile is a center-cropped grid thumbnail of this size
+SPRITE_TILE = (240, 320)
+SPRITE_COLUMNS = 10
+SPRITE_QUALITY = 70
+
+MANIFEST_NAME = "manifest.json"
+HASH_CHUNK = 1024 * 1024
+# Extraction workers are spawned: generate_thumbnails runs from the app and its job threads, where a
+# fork could hand a child a lock (e.g. _manifest_lock) some other thread was holding
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+_manifest_lock = threading.Lock()
+log = logging.getLogger(__name__)
+
+
+def thumbnail_path(out_dir, video_id, size=DEFAULT_SIZE):
+    if size == DEFAULT_SIZE:
+        return Path(out_dir) / f"{video_id}.jpg"
+    return Path(out_dir) / f"{video_id}_{size}.jpg"
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(HASH_CHUNK)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+def _read_representative_frame(video_path):
+    vid = cv2.VideoCapture(str(video_path))
+    try:
+        fps = vid.get(cv2.CAP_PROP_FPS) or 0
+        frames = vid.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+        if fps > 0 and frames > 0:
+            # Seeking jumps to the nearest keyframe and decodes forward from there,
+            # instead of decoding everything before the target frame
+            target_ms = min(SEEK_MAX_MS, SEEK_FRACTION * frames / fps * 1000)
+            vid.set(cv2.CAP_PROP_POS_MSEC, target_ms)
+        ok, img = vid.read()
+        if not ok or img is None:
+            # Some containers don't seek well; fall back to the first frame
+            vid.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, img = vid.read()
+        if not ok or img is None:
+            raise RuntimeError("Failed to read video frame")
+        return img
+    finally:
+        vid.release()
+
+
+def extract_thumbnails(video_path, out_dir):
+    """
+    Decode one representative frame and write every size in THUMBNAIL_SIZES.
+    Runs in a worker process, so it only takes and returns plain values (the elapsed time is
+    returned rather than recorded, since the metrics live in the parent process).
+    """
+    t0 = time.perf_counter()
+    video_path = Path(video_path)
+    img = _read_representative_frame(video_path)
+    h, w = img.shape[:2]
+    written = []
+    for size, max_width in THUMBNAIL_SIZES.items():
+        out = img
+        if w > max_width:
+            out = cv2.resize(img, (max_width, round(h * max_width / w)), interpolation=cv2.INTER_AREA)
+        dest = thumbnail_path(out_dir, video_path.stem, size)
+        tmp = dest.with_name(f".{dest.name}")
+        ok, buf = cv2.imencode(".jpg", out, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY[size]])
+        if not ok:
+            raise RuntimeError(f"Failed to encode {size} thumbnail")
+        tmp.write_bytes(buf.tobytes())
+        os.replace(tmp, dest)
+        written.append(size)
+    return video_path.stem, written, time.perf_counter() - t0
+
+
+def load_manifest(out_dir):
+    path = Path(out_dir) / MANIFEST_NAME
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest(out_dir, manifest):
+    path = Path(out_dir) / MANIFEST_NAME
+    tmp = path.with_name(f".{path.name}")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def _source_unchanged(video_path, entry, out_dir):
+    if not entry or any(not thumbnail_path(out_dir, video_path.stem, s).exists() for s in THUMBNAIL_SIZES):
+        return False, None
+    st = video_path.stat()
+    if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+        return True, None
+    # Touched but maybe not changed: only a content hash can tell
+    digest = file_sha256(video_path)
+    return digest == entry.get("sha256"), digest
+
+
+def generate_thumbnails(video_paths, out_dir, max_workers=None, force=False):
+    """
+    Generate thumbnails for every video whose content changed since the last run.
+    Work is fanned out over a process pool; a single video is done inline.
+    Returns the list of video stems that were (re)generated.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with _manifest_lock:
+        manifest = load_manifest(out_dir)
+
+    todo = []
+    digests = {}  # stem -> sha256 already computed by the skip check, reused for the manifest
+    for video_path in map(Path, video_paths):
+        if not force:
+            unchanged, digests[video_path.stem] = _source_unchanged(video_path, manifest.get(video_path.stem), out_dir)
+            if unchanged:
+                continue
+        todo.append(video_path)
+    if not todo:
+        return []
+
+    results = {}
+    if len(todo) == 1 or max_workers == 0:
+        for video_path in todo:
+            try:
+                _, _, seconds = extract_thumbnails(video_path, out_dir)
+                observe("thumbnail_extract_duration_seconds", seconds)
+                results[video_path.stem] = video_path
+            except Exception as e:
+                log.warning("thumbnail extraction failed", extra={"video": video_path.name, "error": str(e)})
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=MP_CONTEXT) as pool:
+            futures = {pool.submit(extract_thumbnails, str(p), str(out_dir)): p for p in todo}
+            for fut, video_path in futures.items():
+                try:
+                    _, _, seconds = fut.result()
+                    observe("thumbnail_extract_duration_seconds", seconds)
+                    results[video_path.stem] = video_path
+                except Exception as e:
+                    log.warning("thumbnail extraction failed", extra={"video": video_path.name, "error": str(e)})
+
+    with _manifest_lock:
+        manifest = load_manifest(out_dir)
+        for stem, video_path in results.items():
+            st = video_path.stat()
+            digest = digests.get(stem) or file_sha256(video_path)
+            manifest[stem] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        _save_manifest(out_dir, manifest)
+    return sorted(results)
+
+
+def prune_sprites(sprites_dir, slot, keep):
+    """
+    Remove the sheets built earlier for the same slot (<creator>-<after>-<limit>, one page of one
+    creator), all but `keep`.
+    """
+    for p in Path(sprites_dir).glob(f"{slot}-*.jpg"):
+        if p.name != Path(keep).name:
+            p.unlink(missing_ok=True)
+
+
+def prune_thumbnails(out_dir, keep_stems):
+    """
+    Remove thumbnails (and manifest entries) for videos that no longer exist.
+    """
+    out_dir = Path(out_dir)
+    keep_stems = set(keep_stems)
+    for p in out_dir.glob("*.jpg"):
+        if p.stem.split("_", 1)[0] not in keep_stems:
+            p.unlink()
+    with _manifest_lock:
+        manifest = load_manifest(out_dir)
+        stale = [k for k in manifest if k not in keep_stems]
+        if stale:
+            for k in stale:
+                del manifest[k]
+            _save_manifest(out_dir, manifest)
+
+
+def build_sprite(image_paths, dest, tile=SPRITE_TILE, columns=SPRITE_COLUMNS):
+    """
+    Lay the images out row-major on one sheet (each center-cropped to the tile aspect ratio
+    and scaled to the tile size) and write it as a JPEG. Returns the (x, y) of every tile.
+    """
+    tw, th = tile
+    n = len(image_paths)
+    cols = max(1, min(n, columns))
+    rows = max(1, -(-n // cols))
+    sheet = np.zeros((rows * th, cols * tw, 3), dtype=np.uint8)
+    positions = []
+    for i, path in enumerate(image_paths):
+        x, y = (i % cols) * tw, (i // cols) * th
+        positions.append((x, y))
+        img = cv2.imread(str(path))
+        if img is None:
+            continue
+        h, w = img.shape[:2]
+        # Crop to the tile's aspect ratio around the center, then scale
+        if w * th > h * tw:
+            cw = h * tw // th
+            img = img[:, (w - cw) // 2:(w - cw) // 2 + cw]
+        else:
+            ch = w * th // tw
+            img = img[(h - ch) // 2:(h - ch) // 2 + ch]
+        sheet[y:y + th, x:x + tw] = cv2.resize(img, (tw, th), interpolation=cv2.INTER_AREA)
+
+    ok, buf = cv2.imencode(".jpg", sheet, [cv2.IMWRITE_JPEG_QUALITY, SPRITE_QUALITY])
+    if not ok:
+        raise RuntimeError("Failed to encode sprite sheet")
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}")
+    tmp.write_bytes(buf.tobytes())
+    os.replace(tmp, dest)
+    return positions
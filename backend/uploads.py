@@ -0,0 +1,225 @@
+import hashlib
+import os
+import threading
+import uuid
+from pathlib import Path
+
+# Every read/write on the upload path goes through a buffer of this size
+CHUNK_SIZE = 64 * 1024
+# A session still 'finalizing' this long after its claim (seconds) was left by a process that died
+# before commit(): it is handed back so the upload can be finalized again
+FINALIZE_TIMEOUT = 120
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+class UploadStore:
+    """
+    Resumable chunked uploads (init / append-chunk at offset / finalize).
+
+    Each upload session is a row in `upload_sessions` plus a temp file in tmp_dir. Chunks are
+    streamed onto the end of the temp file through a CHUNK_SIZE buffer and fed into a running
+    SHA-256, so memory per upload stays fixed no matter how big the video is. The file on disk is
+    the source of truth for the offset: after an interruption the client asks for the offset and
+    carries on from there. If the process restarted, the running hash is rebuilt from the temp file.
+    """
+
+    def __init__(self, pool, tmp_dir):
+        self.pool = pool
+        self.tmp_dir = Path(tmp_dir)
+        self._hashers = {}  # upload_id -> (bytes hashed, sha256 object)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, upload_id):
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _path(self, upload_id):
+        return self.tmp_dir / f"{upload_id}.part"
+
+    def init_table(self):
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        with self.pool.connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_sessions (
+                    upload_id  TEXT    PRIMARY KEY,
+                    creator_id INTEGER NOT NULL DEFAULT 0,
+                    title      TEXT    NOT NULL,
+                    size       INTEGER,
+                    status     TEXT    NOT NULL DEFAULT 'open',
+                    sha256     TEXT,
+                    video_id   INTEGER,
+                    created_at TEXT    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT    NOT NULL DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            conn.commit()
+
+    def _session(self, conn, upload_id):
+        row = conn.execute("SELECT * FROM upload_sessions WHERE upload_id = ?", (upload_id,)).fetchone()
+        if row is None:
+            raise UploadError("upload not found", 404)
+        return row
+
+    def create(self, creator_id, title, size=None):
+        upload_id = uuid.uuid4().hex
+        self._path(upload_id).touch()
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO upload_sessions (upload_id, creator_id, title, size) VALUES (?, ?, ?, ?)",
+                (upload_id, creator_id, title, size),
+            )
+            conn.commit()
+        self._hashers[upload_id] = (0, hashlib.sha256())
+        return {"upload_id": upload_id, "offset": 0, "size": size}
+
+    def status(self, upload_id):
+        with self.pool.connection() as conn:
+            row = dict(self._session(conn, upload_id))
+        path = self._path(upload_id)
+        row["offset"] = path.stat().st_size if path.exists() else row["size"] or 0
+        return row
+
+    def _hasher(self, upload_id, offset):
+        done, hasher = self._hashers.get(upload_id, (None, None))
+        if done == offset:
+            return hasher
+        # Lost the running hash (restart, or another worker): rebuild it from the temp file
+        hasher = hashlib.sha256()
+        with open(self._path(upload_id), "rb") as f:
+            while True:
+                buf = f.read(CHUNK_SIZE)
+                if not buf:
+                    break
+                hasher.update(buf)
+        return hasher
+
+    def append(self, upload_id, offset, stream):
+        """
+        Write the bytes from `stream` at `offset`, which must equal the bytes already received.
+        Returns the new offset.
+        """
+        with self._lock(upload_id):
+            with self.pool.connection() as conn:
+                session = self._session(conn, upload_id)
+            if session["status"] != "open":
+                raise UploadError(f"upload is {session['status']}", 409)
+
+            path = self._path(upload_id)
+            current = path.stat().st_size
+            if offset != current:
+                raise UploadError("offset mismatch", 409, offset=current)
+
+            hasher = self._hasher(upload_id, current)
+            size = session["size"]
+            written = current
+            try:
+                with open(path, "ab") as f:
+                    while True:
+                        buf = stream.read(CHUNK_SIZE)
+                        if not buf:
+                            break
+                        written += len(buf)
+                        if size is not None and written > size:
+                            raise UploadError("chunk goes past the declared size", 413, offset=current)
+                        f.write(buf)
+                        hasher.update(buf)
+            except Exception:
+                # Drop a partially written chunk so the offset stays at a chunk boundary
+                with open(path, "r+b") as f:
+                    f.truncate(current)
+                self._hashers.pop(upload_id, None)
+                raise
+            self._hashers[upload_id] = (written, hasher)
+            return written
+
+    def finalize(self, upload_id, expected_sha256=None):
+        """
+        Check size and checksum. Returns (session row, temp file path, sha256 hex digest);
+        the caller creates the video and moves the file into place with commit().
+        """
+        with self._lock(upload_id):
+            with self.pool.connection() as conn:
+                session = self._session(conn, upload_id)
+            if session["status"] == "finalizing" and self.reopen_stale():
+                with self.pool.connection() as conn:
+                    session = self._session(conn, upload_id)
+            if session["status"] != "open":
+                raise UploadError(f"upload is {session['status']}", 409)
+
+            path = self._path(upload_id)
+            received = path.stat().st_size
+            if session["size"] is not None and received != session["size"]:
+                raise UploadError("upload is incomplete", 409, offset=received)
+            if received == 0:
+                raise UploadError("upload is empty", 400)
+
+            digest = self._hasher(upload_id, received).hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                raise UploadError("checksum mismatch", 422, sha256=digest)
+
+            # Claim the session so a second finalize can't create a second video
+            with self.pool.connection() as conn:
+                cur = conn.execute(
+                    "UPDATE upload_sessions SET status = 'finalizing', updated_at = CURRENT_TIMESTAMP "
+                    "WHERE upload_id = ? AND status = 'open'",
+                    (upload_id,),
+                )
+                conn.commit()
+            if cur.rowcount != 1:
+                raise UploadError("upload is already being finalized", 409)
+            return session, path, digest
+
+    def commit(self, upload_id, path, dest, video_id, digest):
+        # Same filesystem, so the rename is atomic: readers never see a half-written video
+        os.replace(path, dest)
+        try:
+            with self.pool.connection() as conn:
+                conn.execute(
+                    "UPDATE upload_sessions SET status = 'finalized', sha256 = ?, video_id = ?, "
+                    "updated_at = CURRENT_TIMESTAMP WHERE upload_id = ?",
+                    (digest, video_id, upload_id),
+                )
+                conn.commit()
+        except Exception:
+            # Put the file back where reopen() expects it
+            os.replace(dest, path)
+            raise
+        self._hashers.pop(upload_id, None)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+
+    def reopen(self, upload_id):
+        """
+        Hand a session claimed by finalize() back (status 'open') when creating its video failed,
+        so the client can finalize it again.
+        """
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE upload_sessions SET status = 'open', updated_at = CURRENT_TIMESTAMP "
+                "WHERE upload_id = ? AND status = 'finalizing'",
+                (upload_id,),
+            )
+            conn.commit()
+
+    def reopen_stale(self, timeout=FINALIZE_TIMEOUT):
+        """
+        Reopen the sessions claimed by finalize() more than `timeout` seconds ago whose upload is
+        still at its temp path: the process finalizing them died before commit(). Runs at start-up
+        and when a finalize finds its session stuck. Returns how many were reopened.
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT upload_id FROM upload_sessions WHERE status = 'finalizing' AND updated_at < datetime('now', ?)",
+                (f"-{int(timeout)} seconds",),
+            ).fetchall()
+        stale = [upload_id for (upload_id,) in rows if self._path(upload_id).exists()]
+        for upload_id in stale:
+            self.reopen(upload_id)
+        return len(stale)
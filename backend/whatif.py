@@ -0,0 +1,356 @@
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import adrev_opti
+import donate_opti
+import quality
+from adrev_opti import solve_allocation, allocation_objective, get_allocation_weights, get_payout_bounds
+from db import fetch_chunks
+from donate_opti import solve_coin_splits
+from metrics import timed, inc
+from quality import quality_from_rows, QUALITY_INPUTS
+
+# What-if sweeps: solve the ad allocation and the coin splits for a grid of model parameters
+# against the live catalogue, in memory. Nothing is written; every point is compared with a
+# baseline solved at the current module constants.
+
+# Parameters a sweep can vary -> current value
+ADREV_PARAMS = {"lambda_fair": adrev_opti.lambda_fair, "lambda_eff": adrev_opti.lambda_eff, "alpha": adrev_opti.alpha}
+QUALITY_PARAMS = {"phi_W": quality.phi_W, "phi_E": quality.phi_E, "phi_D": quality.phi_D,
+                  "phi_R": quality.phi_R, "phi_S": quality.phi_S}
+COIN_PARAMS = {"theta": donate_opti.theta, "lam_rev": donate_opti.lam_rev,
+               "lam_util": donate_opti.lam_util, "lam_inc": donate_opti.lam_inc}
+SWEEP_PARAMS = {**ADREV_PARAMS, **QUALITY_PARAMS, **COIN_PARAMS}
+
+MAX_POINTS = 1000
+# Creators listed per point, largest (budget- and coin-normalised) change first
+TOP_CREATORS = 10
+# Worker processes (default: one per core)
+SWEEP_WORKERS = int(os.environ.get("WHATIF_WORKERS", "0")) or os.cpu_count() or 1
+# Below this many point x video solves in total, worker start-up costs more than it saves
+PARALLEL_MIN_WORK = 2_000_000
+# Sweeps come in on request threads. Forking there would copy other threads' held locks into the
+# workers, so they are spawned and get the catalogue through the pool initializer
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+log = logging.getLogger(__name__)
+
+# The catalogue as the sweep sees it, loaded once and shared by every point (and worker)
+SweepInputs = namedtuple("SweepInputs", [
+    "video_ids", "creator_ids", "creator_index", "views", "quality_inputs", "C",
+    "norm_coins", "prem_coins", "x_n", "x_p", "budget",
+])
+
+# One solved point: the ad payouts' Gini (over eligible videos), coins kept by the platform and
+# per-creator ad/coin earnings (aligned with SweepInputs.creator_ids)
+PointSolve = namedtuple("PointSolve", [
+    "objective", "mu", "gini", "coins_paid", "coins_kept", "coin_infeasible", "creator_ad", "creator_coins",
+])
+
+
+def expand_grid(grid):
+    """
+    {param: value or [values]} -> one full parameter dict per grid point (the cartesian product,
+    unlisted parameters at their current value). The last parameter varies fastest, so consecutive
+    points are neighbours and can warm-start each other.
+    """
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError("grid must map parameter names to values")
+    unknown = sorted(set(grid) - set(SWEEP_PARAMS))
+    if unknown:
+        raise ValueError(f"unknown parameters: {', '.join(unknown)} (expected some of {', '.join(SWEEP_PARAMS)})")
+    axes = []
+    for name, values in grid.items():
+        values = values if isinstance(values, (list, tuple)) else [values]
+        if not values:
+            raise ValueError(f"{name}: no values")
+        values = [float(v) for v in values]
+        if not all(math.isfinite(v) and v >= 0 for v in values):
+            raise ValueError(f"{name}: values must be finite and non-negative")
+        if name == "lambda_fair" and min(values) <= 0:
+            # Without the log term the model is linear and has no interior optimum to solve for
+            raise ValueError("lambda_fair: values must be positive")
+        axes.append([(name, v) for v in values])
+    n_points = math.prod(len(axis) for axis in axes)
+    if n_points > MAX_POINTS:
+        raise ValueError(f"{n_points} grid points, at most {MAX_POINTS} allowed")
+    return [{**SWEEP_PARAMS, **dict(combo)} for combo in itertools.product(*axes)]
+
+
+def parse_axis(spec):
+    """
+    CLI grid axis: "name=v1,v2,..." or "name=start:stop:num" (num evenly spaced values).
+    """
+    name, _, values = spec.partition("=")
+    if ":" in values:
+        start, stop, num = values.split(":")
+        return name.strip(), np.linspace(float(start), float(stop), int(num)).tolist()
+    return name.strip(), [float(v) for v in values.split(",")]
+
+
+def load_sweep_inputs(conn, budget=adrev_opti.P):
+    blocks = list(fetch_chunks(
+        conn,
+        f"SELECT video_id, creator_id, views, {', '.join(QUALITY_INPUTS)}, norm_coins, prem_coins, x_n, x_p "
+        "FROM videos ORDER BY video_id",
+    ))
+    if not blocks:
+        raise ValueError("No videos to sweep over.")
+    data = np.concatenate(blocks)
+    del blocks
+    creator_ids, creator_index = np.unique(data[:, 1].astype(np.int64), return_inverse=True)
+    qi = data[:, 3:3 + len(QUALITY_INPUTS)]
+    return SweepInputs(
+        video_ids=data[:, 0].astype(np.int64),
+        creator_ids=creator_ids,
+        creator_index=creator_index.reshape(-1),
+        views=data[:, 2],
+        quality_inputs=qi,
+        C=(qi[:, -1] == 1).astype(np.int64),
+        norm_coins=data[:, -4],
+        prem_coins=data[:, -3],
+        x_n=data[:, -2],
+        x_p=data[:, -1],
+        budget=float(budget),
+    )
+
+
+def gini(x):
+    """
+    Gini coefficient of non-negative values (0: all equal, towards 1: one takes everything).
+    """
+    x = np.sort(np.asarray(x, dtype=np.float64))
+    n, total = len(x), x.sum()
+    if n == 0 or total <= 0:
+        return 0.0
+    return float(2.0 * np.dot(np.arange(1, n + 1), x) / (n * total) - (n + 1) / n)
+
+
+def solve_point(inputs, params, mu0=None, memo=None):
+    """
+    Solve both models for one parameter dict. memo (a dict, per chain of points) keeps quality
+    scores and coin splits across points that share their parameters, since most sweeps only move
+    a few of them. Returns a PointSolve.
+    """
+    memo = {} if memo is None else memo
+    phi = tuple(params[k] for k in QUALITY_PARAMS)
+    Q = memo.get(("Q", phi))
+    if Q is None:
+        Q = memo[("Q", phi)] = quality_from_rows(inputs.quality_inputs, phi)
+
+    _, s, w = get_allocation_weights(inputs.views, Q, inputs.C, alpha=params["alpha"])
+    lb, ub = get_payout_bounds(inputs.C, p_min=max(1e-8 * inputs.budget, 1e-8))
+    payouts, mu = solve_allocation(
+        s, w, lb, ub, pool=inputs.budget, lam_fair=params["lambda_fair"], lam_eff=params["lambda_eff"], mu0=mu0,
+    )
+    objective = allocation_objective(
+        payouts, s, w, pool=inputs.budget, lam_fair=params["lambda_fair"], lam_eff=params["lambda_eff"],
+    )
+
+    coin_key = ("coins", phi, *(params[k] for k in COIN_PARAMS))
+    coins = memo.get(coin_key)
+    if coins is None:
+        xn, xp, ok = solve_coin_splits(Q, inputs.norm_coins, inputs.prem_coins,
+                                       **{k: params[k] for k in COIN_PARAMS})
+        # Infeasible videos keep their stored split, as they do in the live batch solve
+        paid = np.where(ok, xn, inputs.x_n) * inputs.norm_coins + np.where(ok, xp, inputs.x_p) * inputs.prem_coins
+        coins = memo[coin_key] = (paid, int((~ok).sum()))
+    coin_paid, coin_infeasible = coins
+
+    n_creators = len(inputs.creator_ids)
+    coins_total = float(inputs.norm_coins.sum() + inputs.prem_coins.sum())
+    return PointSolve(
+        objective=objective,
+        mu=mu,
+        gini=gini(payouts[inputs.C == 1]),
+        coins_paid=float(coin_paid.sum()),
+        coins_kept=coins_total - float(coin_paid.sum()),
+        coin_infeasible=coin_infeasible,
+        creator_ad=np.bincount(inputs.creator_index, payouts, minlength=n_creators),
+        creator_coins=np.bincount(inputs.creator_index, coin_paid, minlength=n_creators),
+    )
+
+
+def point_summary(inputs, params, point, baseline=None, top_n=TOP_CREATORS):
+    """
+    JSON-ready result for one point; with a baseline PointSolve, per-creator deltas against it.
+    """
+    coins_total = point.coins_paid + point.coins_kept
+    out = {
+        "params": {k: params[k] for k in SWEEP_PARAMS},
+        "objective": point.objective,
+        "mu": point.mu,
+        "gini": point.gini,
+        "coins_paid": point.coins_paid,
+        "revenue_kept": point.coins_kept,
+        "revenue_kept_share": point.coins_kept / coins_total if coins_total > 0 else 0.0,
+        "coin_infeasible": point.coin_infeasible,
+    }
+    if baseline is None:
+        return out
+    ad_delta = point.creator_ad - baseline.creator_ad
+    coin_delta = point.creator_coins - baseline.creator_coins
+    change = np.abs(ad_delta) / inputs.budget + np.abs(coin_delta) / max(coins_total, 1.0)
+    top = np.argsort(-change, kind="stable")[:top_n]
+    top = top[change[top] > 1e-12]
+    out.update({
+        "creators_up": int(((ad_delta + coin_delta) > 1e-9).sum()),
+        "creators_down": int(((ad_delta + coin_delta) < -1e-9).sum()),
+        "max_ad_gain": float(ad_delta.max()),
+        "max_ad_loss": float(ad_delta.min()),
+        "creator_deltas": [
+            {
+                "creator_id": int(inputs.creator_ids[i]),
+                "ad_payout": float(point.creator_ad[i]),
+                "ad_delta": float(ad_delta[i]),
+                "coin_payout": float(point.creator_coins[i]),
+                "coin_delta": float(coin_delta[i]),
+            }
+            for i in top.tolist()
+        ],
+    })
+    return out
+
+
+# Worker state, set once per process by _init_worker (the inputs are large; the tasks are not)
+_worker = {}
+
+
+def _init_worker(inputs, baseline, top_n):
+    _worker.update(inputs=inputs, baseline=baseline, top_n=top_n)
+
+
+def solve_chain(points):
+    """
+    Solve consecutive grid points in order, each warm-started from the previous one's multiplier.
+    Uses the inputs installed by _init_worker. Returns [(summary, seconds)].
+    """
+    inputs, baseline, top_n = _worker["inputs"], _worker["baseline"], _worker["top_n"]
+    memo, mu, out = {}, baseline.mu, []
+    for params in points:
+        t0 = time.perf_counter()
+        try:
+            point = solve_point(inputs, params, mu0=mu, memo=memo)
+        except ValueError as e:
+            out.append(({"params": params, "error": str(e)}, time.perf_counter() - t0))
+            continue
+        mu = point.mu
+        out.append((point_summary(inputs, params, point, baseline, top_n), time.perf_counter() - t0))
+    return out
+
+
+def mark_frontier(results):
+    """
+    Flag the points no other point beats on both axes: lower Gini and more revenue kept.
+    """
+    solved = [r for r in results if "error" not in r]
+    if not solved:
+        return
+    g = np.array([r["gini"] for r in solved])
+    kept = np.array([r["revenue_kept"] for r in solved])
+    for i, r in enumerate(solved):
+        dominated = (g <= g[i]) & (kept >= kept[i]) & ((g < g[i]) | (kept > kept[i]))
+        r["frontier"] = not dominated.any()
+
+
+def run_sweep(conn, grid, max_workers=None, top_n=TOP_CREATORS, budget=adrev_opti.P):
+    """
+    Solve every point of the grid against the current catalogue and return the frontier report:
+    the baseline (current constants), one summary per point in grid order, and timings. Points are
+    split into contiguous chains (neighbours warm-start each other) spread over a process pool;
+    small sweeps run inline. Only reads the database.
+    """
+    t0 = time.perf_counter()
+    if not budget > 0:
+        raise ValueError("budget must be positive")
+    points = expand_grid(grid)
+    max_workers = SWEEP_WORKERS if max_workers is None else max_workers
+    with timed("solver_stage_duration_seconds", span="solver", solver="whatif", engine="numpy", stage="load"):
+        inputs = load_sweep_inputs(conn, budget)
+    baseline = solve_point(inputs, SWEEP_PARAMS)
+
+    workers = min(max_workers, len(points))
+    with timed("solver_stage_duration_seconds", span="solver", solver="whatif", engine="numpy", stage="solve"):
+        if workers <= 1 or len(points) * len(inputs.video_ids) < PARALLEL_MIN_WORK:
+            workers = 1
+            _init_worker(inputs, baseline, top_n)
+            chunks = [solve_chain(points)]
+        else:
+            size = math.ceil(len(points) / (workers * 2))
+            chains = [points[i:i + size] for i in range(0, len(points), size)]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT, initializer=_init_worker,
+                                     initargs=(inputs, baseline, top_n)) as executor:
+                chunks = list(executor.map(solve_chain, chains))
+
+    results = [summary for chunk in chunks for summary, _ in chunk]
+    mark_frontier(results)
+    failed = sum("error" in r for r in results)
+    inc("solver_status_total", len(results) - failed, solver="whatif", engine="numpy", status="optimal")
+    inc("solver_status_total", failed, solver="whatif", engine="numpy", status="infeasible")
+    elapsed = time.perf_counter() - t0
+    log.info("what-if sweep solved", extra={
+        "points": len(points), "videos": len(inputs.video_ids), "workers": workers,
+        "infeasible": failed, "seconds": round(elapsed, 3),
+    })
+    return {
+        "videos": len(inputs.video_ids),
+        "creators": len(inputs.creator_ids),
+        "budget": inputs.budget,
+        "points": len(points),
+        "workers": workers,
+        "baseline": point_summary(inputs, SWEEP_PARAMS, baseline),
+        "results": results,
+        "point_seconds": sum(s for chunk in chunks for _, s in chunk),
+        "seconds": elapsed,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="What-if parameter sweep over the live catalogue (writes nothing)")
+    parser.add_argument("--db", default="app.db")
+    parser.add_argument("--grid", action="append", required=True, metavar="NAME=VALUES",
+                        help=f"axis as v1,v2,... or start:stop:num (repeatable); one of {', '.join(SWEEP_PARAMS)}")
+    parser.add_argument("--workers", type=int, default=SWEEP_WORKERS)
+    parser.add_argument("--budget", type=float, default=adrev_opti.P)
+    parser.add_argument("--top", type=int, default=TOP_CREATORS, help="creators listed per point")
+    parser.add_argument("--json", help="also write the full report here")
+    args = parser.parse_args()
+
+    from metrics import configure_logging
+    configure_logging()
+
+    grid = dict(parse_axis(a) for a in args.grid)
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    report = run_sweep(conn, grid, args.workers, args.top, args.budget)
+    conn.close()
+
+    swept = list(grid)
+    base = report["baseline"]
+    print(f"{'':>3} " + " ".join(f"{n:>11}" for n in swept) + f" {'gini':>8} {'kept %':>8} {'up':>6} {'down':>6}")
+    print(f"{'*':>3} " + " ".join(f"{base['params'][n]:>11.4g}" for n in swept)
+          + f" {base['gini']:>8.4f} {base['revenue_kept_share']:>8.2%} {'-':>6} {'-':>6}  (current)")
+    for r in report["results"]:
+        values = " ".join(f"{r['params'][n]:>11.4g}" for n in swept)
+        if "error" in r:
+            print(f"{'':>3} {values}  {r['error']}")
+            continue
+        flag = "F" if r["frontier"] else ""
+        print(f"{flag:>3} {values} {r['gini']:>8.4f} {r['revenue_kept_share']:>8.2%} "
+              f"{r['creators_up']:>6} {r['creators_down']:>6}")
+    print(f"{report['points']} points over {report['videos']} videos in {report['seconds']:.2f}s "
+          f"with {report['workers']} workers (F: on the Gini / revenue-kept frontier)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)